@@ -0,0 +1,156 @@
+# =============================================================================
+#  Project: Pico Portal
+#  License: CC-BY-NC-4.0
+#  Repository: https://github.com/CodyTolene/Pico-Portal
+#  Description: DNS storm benchmark for the portal's DNS responder. Simulated
+#  phones each send the burst of A, AAAA and HTTPS lookups a phone makes when
+#  it joins a network, all at once, and the answered share and the latency
+#  are reported per burst size. Runs on a computer with Python 3.11+, not on
+#  the Pico.
+#
+#  Usage:
+#    Against the device, joined to its access point:
+#      python3 benchmarks/dns_storm_benchmark.py --server 192.168.4.1
+#    Against the portal running on this machine (see host/run.py):
+#      python3 benchmarks/dns_storm_benchmark.py --server 127.0.0.1 --port 5353
+# =============================================================================
+
+import argparse
+import json
+import random
+import socket
+import struct
+import time
+
+# Lookups made by a phone joining a network, as (name, query type)
+JOIN_LOOKUPS = [
+    ("connectivitycheck.gstatic.com", 1),
+    ("connectivitycheck.gstatic.com", 28),
+    ("captive.apple.com", 1),
+    ("captive.apple.com", 28),
+    ("captive.apple.com", 65),
+    ("www.msftconnecttest.com", 1),
+    ("www.msftconnecttest.com", 28),
+]
+
+QUERY_TYPES = {1: "A", 28: "AAAA", 65: "HTTPS"}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="DNS storm benchmark")
+    parser.add_argument("--server", default="192.168.4.1", help="DNS server")
+    parser.add_argument("--port", type=int, default=53)
+    parser.add_argument(
+        "--phones",
+        default="1,5,10,25,50",
+        help="comma separated phone counts, one burst each",
+    )
+    parser.add_argument(
+        "--timeout", type=float, default=2, help="seconds to wait for answers"
+    )
+    parser.add_argument(
+        "--output",
+        default="dns_storm_results.json",
+        help="file the results are written to",
+    )
+    return parser.parse_args()
+
+
+def encode_query(transaction_id, name, query_type):
+    header = struct.pack(">HHHHHH", transaction_id, 0x0100, 1, 0, 0, 0)
+    labels = b"".join(bytes([len(label)]) + label.encode() for label in name.split("."))
+    return header + labels + b"\x00" + struct.pack(">HH", query_type, 1)
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    index = min(len(values) - 1, round(p / 100 * (len(values) - 1)))
+    return round(values[index], 2)
+
+
+def burst(server, port, phones, timeout):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+    sock.settimeout(0.05)
+
+    # Every phone's lookups, with random transaction IDs like a real client
+    sent = {}
+    for transaction_id in random.sample(range(65536), phones * len(JOIN_LOOKUPS)):
+        name, query_type = JOIN_LOOKUPS[len(sent) % len(JOIN_LOOKUPS)]
+        sent[transaction_id] = (query_type, time.perf_counter())
+        sock.sendto(encode_query(transaction_id, name, query_type), (server, port))
+
+    latencies = []
+    answered = {}
+    deadline = time.perf_counter() + timeout
+    while sent and time.perf_counter() < deadline:
+        try:
+            response = sock.recv(512)
+        except socket.timeout:
+            continue
+        transaction_id = struct.unpack(">H", response[:2])[0]
+        query = sent.pop(transaction_id, None)
+        if query is None:
+            continue
+        query_type, start = query
+        latencies.append((time.perf_counter() - start) * 1000)
+        name = QUERY_TYPES.get(query_type, str(query_type))
+        answered[name] = answered.get(name, 0) + 1
+    sock.close()
+
+    queries = phones * len(JOIN_LOOKUPS)
+    latencies.sort()
+    return {
+        "phones": phones,
+        "queries": queries,
+        "answered": len(latencies),
+        "answered_share": round(len(latencies) / queries, 4),
+        "answered_by_type": answered,
+        "latency_ms": {
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+        },
+    }
+
+
+def main():
+    args = parse_args()
+    print(f"{args.server}:{args.port}")
+    print("phones | queries | answered |  p50 ms |  p95 ms |  p99 ms")
+
+    runs = []
+    for phones in [int(count) for count in args.phones.split(",")]:
+        result = burst(args.server, args.port, phones, args.timeout)
+        runs.append(result)
+        latency = result["latency_ms"]
+        print(
+            "{:6} | {:7} | {:7.1f}% | {:>7} | {:>7} | {:>7}".format(
+                phones,
+                result["queries"],
+                result["answered_share"] * 100,
+                str(latency["p50"]),
+                str(latency["p95"]),
+                str(latency["p99"]),
+            )
+        )
+        # Let the responder settle between bursts
+        time.sleep(1)
+
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "server": args.server,
+                "port": args.port,
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "runs": runs,
+            },
+            f,
+            indent=2,
+        )
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+# =============================================================================
+#  Project: Pico Portal
+#  License: CC-BY-NC-4.0
+#  Repository: https://github.com/CodyTolene/Pico-Portal
+#  Description: HTTP load benchmark for the routes registered by
+#  PortalService. Simulated phones replay the join sequence a phone makes
+#  when it connects to the access point (the OS connectivity probe, the
+#  index page, then requests that fall through to the catch-all redirects)
+#  for a range of concurrent client counts. Requests/s, latency percentiles,
+#  the error rate and the free heap over time are printed and written as
+#  JSON. Runs on a computer with Python 3.11+, not on the Pico.
+#
+#  Usage:
+#    Against the device, joined to its access point:
+#      python3 benchmarks/http_load_benchmark.py --url http://192.168.4.1
+#    Against the portal running on this machine (see host/run.py):
+#      python3 benchmarks/http_load_benchmark.py --host-mode
+# =============================================================================
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+
+# Connectivity probes sent by each OS when it joins a network
+PROBES = {
+    "android": "/generate_204",
+    "apple": "/hotspot-detect.html",
+    "windows": "/connecttest.txt",
+    "windows-ncsi": "/ncsi.txt",
+}
+
+# Requests after the index page that end in the catch-all redirects
+CATCH_ALL_PATHS = [
+    "/favicon.ico",
+    "/apple-touch-icon.png",
+    "/success.txt",
+    "/library/test/success.html",
+    "/canonical.html",
+]
+
+# Heap and hit counters, sampled alongside the load
+STATUS_PATH = "/status.json"
+STATUS_INTERVAL_S = 1.0
+
+# Port used by the portal with --host-mode
+HOST_MODE_PORT = 8080
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="HTTP load benchmark")
+    parser.add_argument("--url", default="http://192.168.4.1", help="portal URL")
+    parser.add_argument(
+        "--host-mode",
+        action="store_true",
+        help="start the portal on this machine with host/run.py and test it",
+    )
+    parser.add_argument(
+        "--clients",
+        default="1,2,4,8,16",
+        help="comma separated concurrent client counts, one run each",
+    )
+    parser.add_argument("--duration", type=float, default=10, help="seconds per run")
+    parser.add_argument(
+        "--timeout", type=float, default=5, help="seconds before a request fails"
+    )
+    parser.add_argument(
+        "--think-time",
+        type=float,
+        default=0,
+        help="seconds a client waits between requests",
+    )
+    parser.add_argument(
+        "--output",
+        default="http_load_results.json",
+        help="file the results are written to",
+    )
+    parser.add_argument("--seed", type=int, default=1, help="random seed")
+    return parser.parse_args()
+
+
+# Requests made by one phone joining the portal, as (route, path)
+def join_sequence(rng):
+    os_name = rng.choice(list(PROBES))
+    sequence = [(os_name, PROBES[os_name]), ("index", "/")]
+    for path in rng.sample(CATCH_ALL_PATHS, 2):
+        sequence.append(("catch-all", path))
+    return sequence
+
+
+# A single GET on a new connection, returns (status, body)
+async def get(host, port, path, timeout):
+    async def request():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            writer.write(
+                f"GET {path} HTTP/1.1\r\nHost: {host}\r\n"
+                "User-Agent: pico-portal-benchmark\r\n\r\n".encode()
+            )
+            await writer.drain()
+
+            status_line = await reader.readline()
+            status = int(status_line.split()[1])
+
+            content_length = None
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                key, _, value = line.decode().partition(":")
+                if key.strip().lower() == "content-length":
+                    content_length = int(value)
+
+            if content_length is None:
+                body = await reader.read()
+            else:
+                body = await reader.readexactly(content_length)
+            return status, body
+        finally:
+            writer.close()
+
+    return await asyncio.wait_for(request(), timeout)
+
+
+class Run:
+    def __init__(self, clients):
+        self.clients = clients
+        self.latencies = []
+        self.routes = {}
+        self.errors = 0
+        self.error_kinds = {}
+        self.heap = []
+        self.started = None
+        self.elapsed = None
+
+    def record(self, route, latency_ms, error=None):
+        stats = self.routes.setdefault(route, {"requests": 0, "errors": 0})
+        stats["requests"] += 1
+        if error is None:
+            self.latencies.append(latency_ms)
+        else:
+            stats["errors"] += 1
+            self.errors += 1
+            self.error_kinds[error] = self.error_kinds.get(error, 0) + 1
+
+    def result(self):
+        requests = len(self.latencies) + self.errors
+        latencies = sorted(self.latencies)
+        heap_free = [sample["mem_free"] for sample in self.heap]
+        return {
+            "clients": self.clients,
+            "duration_s": round(self.elapsed, 3),
+            "requests": requests,
+            "requests_per_s": round(len(latencies) / self.elapsed, 2),
+            "error_rate": round(self.errors / requests, 4) if requests else 0,
+            "errors": self.error_kinds,
+            "latency_ms": {
+                "p50": percentile(latencies, 50),
+                "p95": percentile(latencies, 95),
+                "p99": percentile(latencies, 99),
+                "max": round(latencies[-1], 2) if latencies else None,
+            },
+            "routes": self.routes,
+            "heap_free_min": min(heap_free) if heap_free else None,
+            "heap": self.heap,
+        }
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    index = min(len(values) - 1, round(p / 100 * (len(values) - 1)))
+    return round(values[index], 2)
+
+
+async def client(run, host, port, deadline, args, rng):
+    while time.monotonic() < deadline:
+        for route, path in join_sequence(rng):
+            if time.monotonic() >= deadline:
+                return
+            start = time.perf_counter()
+            try:
+                status, _ = await get(host, port, path, args.timeout)
+                error = None if status < 400 else f"http {status}"
+            except asyncio.TimeoutError:
+                error = "timeout"
+            except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+                error = "connection"
+            run.record(route, (time.perf_counter() - start) * 1000, error)
+            if args.think_time:
+                await asyncio.sleep(args.think_time)
+
+
+# Free heap over time, from the portal's status route
+async def sample_status(run, host, port, deadline, args):
+    while time.monotonic() < deadline:
+        try:
+            status, body = await get(host, port, STATUS_PATH, args.timeout)
+            if status == 200:
+                data = json.loads(body)
+                run.heap.append(
+                    {
+                        "t_s": round(time.monotonic() - run.started, 2),
+                        "mem_free": data["mem_free"],
+                    }
+                )
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+            pass
+        await asyncio.sleep(STATUS_INTERVAL_S)
+
+
+async def run_load(host, port, clients, args):
+    run = Run(clients)
+    run.started = time.monotonic()
+    deadline = run.started + args.duration
+    tasks = [
+        client(run, host, port, deadline, args, random.Random(args.seed + i))
+        for i in range(clients)
+    ]
+    tasks.append(sample_status(run, host, port, deadline, args))
+    await asyncio.gather(*tasks)
+    run.elapsed = time.monotonic() - run.started
+    return run.result()
+
+
+async def wait_for_portal(host, port, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            await get(host, port, STATUS_PATH, 1)
+            return
+        except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+            await asyncio.sleep(0.25)
+    sys.exit(f"Portal not reachable on {host}:{port}")
+
+
+def start_host_portal():
+    return subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(REPO_DIR, "host", "run.py"),
+            "--http-port",
+            str(HOST_MODE_PORT),
+            # Every simulated phone shares this machine's address
+            "--option",
+            "http_rate_limit=0",
+        ],
+        stdout=subprocess.DEVNULL,
+    )
+
+
+async def main():
+    args = parse_args()
+    portal = None
+    if args.host_mode:
+        args.url = f"http://127.0.0.1:{HOST_MODE_PORT}"
+        portal = start_host_portal()
+
+    url = urlsplit(args.url)
+    host, port = url.hostname, url.port or 80
+
+    try:
+        await wait_for_portal(host, port, 15)
+
+        print(f"{args.url}, {args.duration:g}s per run")
+        print("clients |  req/s | p50 ms | p95 ms | p99 ms | errors | min heap")
+        runs = []
+        for clients in [int(count) for count in args.clients.split(",")]:
+            result = await run_load(host, port, clients, args)
+            runs.append(result)
+            latency = result["latency_ms"]
+            print(
+                "{:7} | {:6.1f} | {:>6} | {:>6} | {:>6} | {:5.1f}% | {:>8}".format(
+                    clients,
+                    result["requests_per_s"],
+                    str(latency["p50"]),
+                    str(latency["p95"]),
+                    str(latency["p99"]),
+                    result["error_rate"] * 100,
+                    str(result["heap_free_min"]),
+                )
+            )
+    finally:
+        if portal:
+            portal.terminate()
+            portal.wait()
+
+    with open(args.output, "w") as f:
+        json.dump(
+            {
+                "url": args.url,
+                "host_mode": args.host_mode,
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "duration_s": args.duration,
+                "timeout_s": args.timeout,
+                "think_time_s": args.think_time,
+                "runs": runs,
+            },
+            f,
+            indent=2,
+        )
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
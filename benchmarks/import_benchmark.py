@@ -0,0 +1,118 @@
+# =============================================================================
+#  Project: Pico Portal
+#  License: CC-BY-NC-4.0
+#  Repository: https://github.com/CodyTolene/Pico-Portal
+#  Description: Import benchmark. Imports the modules main.py imports, in the
+#  same order, and reports the time each took and the free heap left after
+#  all imports. Each module is reported as loaded from source (py), bytecode
+#  (mpy) or the firmware (frozen).
+#
+#  Usage:
+#    On the device, run it once with `src/` copied to the Pico and once with
+#    the bundle from `npm run bundle` (dist/), using Thonny.
+#    On a computer, both passes run in one go, the bytecode being CPython's
+#    .pyc files (read it as a trend, not device timings). Compare the heap
+#    used, the free heap of the second pass includes the first:
+#      python3 host/run.py --heap-size 8388608 --script benchmarks/import_benchmark.py
+# =============================================================================
+
+import gc
+import sys
+import utime  # type: ignore
+
+# Modules imported by main.py, in order. Shared dependencies are counted
+# against the first module that imports them
+MODULES = [
+    "services.button_service",
+    "services.led_service",
+    "services.log_service",
+    "services.memory_service",
+    "services.messages_service",
+    "services.metrics_service",
+    "services.options_service",
+    "services.portal_service",
+    "services.power_service",
+    "services.scheduler_service",
+    "services.supervisor_service",
+]
+
+# Package prefixes of the project modules, forgotten between host passes
+PACKAGES = ("services", "modules", "templates")
+
+
+# Where a module was loaded from
+def module_form(name):
+    path = getattr(sys.modules[name], "__file__", None) or ".frozen"
+    if path.startswith(".frozen"):
+        return "frozen"
+    if path.endswith(".mpy"):
+        return "mpy"
+    return "py"
+
+
+# form overrides the form reported for every module
+def run(title, form=None):
+    print(title)
+    print("module                               | form   | import ms | heap used")
+
+    gc.collect()
+    mem_alloc_start = gc.mem_alloc()
+    start = utime.ticks_us()
+    for name in MODULES:
+        gc.collect()
+        mem_alloc = gc.mem_alloc()
+        module_start = utime.ticks_us()
+        __import__(name)
+        elapsed = utime.ticks_diff(utime.ticks_us(), module_start) / 1000
+        print(
+            "{:36} | {:6} | {:9.1f} | {:9}".format(
+                name,
+                form or module_form(name),
+                elapsed,
+                gc.mem_alloc() - mem_alloc,
+            )
+        )
+    total = utime.ticks_diff(utime.ticks_us(), start) / 1000
+
+    # Compiler garbage is freed here, what is left is the modules themselves
+    gc.collect()
+    print(f"Total {total:.1f}ms, heap used {gc.mem_alloc() - mem_alloc_start} bytes")
+    print(f"Free heap after imports: {gc.mem_free()} bytes")
+
+
+# Drop the project modules so the next pass imports them again
+def forget_modules():
+    for name in list(sys.modules):
+        if name.split(".")[0] in PACKAGES:
+            del sys.modules[name]
+
+
+def run_host():
+    import compileall
+    import importlib
+    import shutil
+    import os
+
+    # Source, compiled on every import
+    for root, dirs, _ in os.walk("."):
+        if "__pycache__" in dirs:
+            shutil.rmtree(os.path.join(root, "__pycache__"))
+            dirs.remove("__pycache__")
+    sys.dont_write_bytecode = True
+    forget_modules()
+    importlib.invalidate_caches()
+    run("Source", "py")
+
+    # Bytecode, compiled ahead of time
+    compileall.compile_dir(".", quiet=1)
+    forget_modules()
+    importlib.invalidate_caches()
+    print()
+    run("Bytecode", "pyc")
+
+
+if __name__ == "__main__":
+    if sys.implementation.name == "micropython":
+        run("Imports")
+    else:
+        run_host()
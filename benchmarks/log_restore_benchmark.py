@@ -0,0 +1,86 @@
+# =============================================================================
+#  Project: Pico Portal
+#  License: CC-BY-NC-4.0
+#  Repository: https://github.com/CodyTolene/Pico-Portal
+#  Description: Benchmark for restoring the scrollback from the log at boot.
+#  Writes logs of increasing size, then times reading the last messages
+#  through the index (LogService.tail) against reading the whole log, and
+#  the time to open an existing log. Copy the contents of `src/` to the
+#  Pico, then open and run this file on the device with Thonny, or run
+#  `python3 host/run.py --script benchmarks/log_restore_benchmark.py`.
+# =============================================================================
+
+import gc
+import os
+import utime  # type: ignore
+
+# Local packages
+from services.log_service import LogService, index_path, read_records
+
+# Log sizes in bytes, the default log_max_size is 16384
+LOG_SIZES = [4096, 16384, 65536, 262144]
+
+# Messages restored, three screens of the Pico Display 2.0
+RESTORE_COUNT = 51
+
+# Runs of each measurement, the best is reported
+RUNS = 5
+
+FILE_PATH = "benchmark_log.bin"
+MESSAGE = "192.168.4.{} GET /generate_204 302 Found"
+
+
+def remove_log():
+    for path in (FILE_PATH, index_path(FILE_PATH)):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def write_log(size):
+    remove_log()
+    log = LogService(file_path=FILE_PATH, max_size=0)
+    count = 0
+    while log.file_size + log.length < size:
+        log.write(MESSAGE.format(count % 250 + 2), count % 5)
+        count += 1
+    log.flush()
+    return count
+
+
+def best_ms(action):
+    best = None
+    for _ in range(RUNS):
+        gc.collect()
+        start = utime.ticks_us()
+        action()
+        elapsed = utime.ticks_diff(utime.ticks_us(), start)
+        best = elapsed if best is None else min(best, elapsed)
+    return best / 1000
+
+
+def run():
+    print(f"Restoring the last {RESTORE_COUNT} messages, best of {RUNS} runs")
+    print("log bytes | messages | open ms | tail ms | full read ms")
+    for size in LOG_SIZES:
+        try:
+            count = write_log(size)
+        except OSError as e:
+            print(f"{size:9} | not enough flash: {e}")
+            break
+
+        log = LogService(file_path=FILE_PATH, max_size=0)
+        open_ms = best_ms(lambda: LogService(file_path=FILE_PATH, max_size=0))
+        tail_ms = best_ms(lambda: log.tail(RESTORE_COUNT))
+        full_ms = best_ms(lambda: read_records(FILE_PATH, 0, RESTORE_COUNT))
+        print(
+            "{:9} | {:8} | {:7.1f} | {:7.1f} | {:12.1f}".format(
+                size, count, open_ms, tail_ms, full_ms
+            )
+        )
+    remove_log()
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,87 @@
+# =============================================================================
+#  Project: Pico Portal
+#  License: CC-BY-NC-4.0
+#  Repository: https://github.com/CodyTolene/Pico-Portal
+#  Description: Benchmark for MessagesService.update_display. Measures the
+#  frame time at the top, middle and bottom of the scrollback for a range of
+#  scrollback sizes on both supported displays, and the time of a one-line
+#  scroll from the middle. Copy the contents of `src/`
+#  to the Pico, then open and run this file on the device with Thonny.
+# =============================================================================
+
+import gc
+import utime  # type: ignore
+
+# Local packages
+from services.messages_service import MessagesService
+from services.options_service import OptionsDisplayTypes, OptionKeys, OptionsService
+
+# Messages in the scrollback for each run
+SCROLLBACK_SIZES = [10, 50, 200, 500, 1000]
+
+# Frames drawn at each scroll position
+FRAMES = 10
+
+# Messages kept in RAM, the rest spill to flash
+RAM_MESSAGES = 50
+
+
+# Options for a benchmark run that never touch options.json
+class BenchmarkOptions(OptionsService):
+    def __init__(self, display_type, messages):
+        super().__init__(json_file_path=None)
+        self.options[OptionKeys.DISPLAY_TYPE] = display_type
+        self.options[OptionKeys.SCROLLBACK_SIZE] = min(messages, RAM_MESSAGES)
+        self.options[OptionKeys.SCROLLBACK_SPILL_SIZE] = max(0, messages - RAM_MESSAGES)
+        self.options[OptionKeys.SCROLLBACK_RESTORE] = 0
+
+
+def frame_time_ms(messages, scroll_position):
+    messages.scroll_position = scroll_position
+    start = utime.ticks_us()
+    for _ in range(FRAMES):
+        messages.update_display()
+    return utime.ticks_diff(utime.ticks_us(), start) / FRAMES / 1000
+
+
+# One-line scrolls down and back up, drawn by shifting the framebuffer
+def scroll_time_ms(messages, scroll_position):
+    messages.scroll_position = scroll_position
+    messages.update_display()
+    start = utime.ticks_us()
+    for _ in range(FRAMES // 2):
+        messages.scroll_down()
+        messages.scroll_up()
+    return utime.ticks_diff(utime.ticks_us(), start) / FRAMES / 1000
+
+
+def run(display_type):
+    print(f"{display_type}")
+    print("messages | lines |   top ms | middle ms | bottom ms | scroll ms")
+
+    for size in SCROLLBACK_SIZES:
+        gc.collect()
+        messages = MessagesService(BenchmarkOptions(display_type, size))
+        for i in range(size):
+            messages.append_message(
+                f"> Message {i + 1}: Lorem ipsum dolor sit amet", messages.GRAY
+            )
+
+        bottom = max(0, messages.messages.total_lines - messages.max_lines)
+        print(
+            "{:8} | {:5} | {:8.2f} | {:9.2f} | {:9.2f} | {:9.2f}".format(
+                size,
+                messages.messages.total_lines,
+                frame_time_ms(messages, 0),
+                frame_time_ms(messages, bottom // 2),
+                frame_time_ms(messages, bottom),
+                scroll_time_ms(messages, bottom // 2),
+            )
+        )
+
+        del messages
+
+
+if __name__ == "__main__":
+    run(OptionsDisplayTypes.DISPLAY_PICO_DISPLAY)
+    run(OptionsDisplayTypes.DISPLAY_PICO_DISPLAY_2)
@@ -0,0 +1,128 @@
+// ============================================================================
+//  Project: Pico Portal
+//  License: CC-BY-NC-4.0
+//  SPDX-License-Identifier: CC-BY-NC-4.0
+//  Repository: https://github.com/CodyTolene/Pico-Portal
+//  Description: A script to build a deployable bundle of the Pico Portal in
+//   "dist". Every Python module except "main.py" is compiled to MicroPython
+//   bytecode (".mpy") with mpy-cross, so the device does not compile source
+//   at boot. Everything else (templates, options, static files) is copied
+//   as is. A "manifest.py" is also written for freezing the modules into a
+//   custom firmware instead.
+// ============================================================================
+
+import { execFileSync } from "child_process";
+import {
+    copyFileSync,
+    existsSync as pathExists,
+    mkdirSync as makePath,
+    readdirSync,
+    rmSync,
+    statSync,
+    writeFileSync,
+} from "fs";
+import { join as pathJoin, relative as pathRelative } from "path";
+
+const sourceDir = "./src";
+const bundleDir = "./dist";
+
+// Run as source, MicroPython only runs "main.py" and "boot.py" on boot
+const sourceFiles: readonly string[] = ["main.py", "boot.py"];
+
+// Not needed on the device
+const skipped: readonly string[] = ["__pycache__"];
+
+// Packages frozen into a custom firmware, relative to "src"
+const frozenPackages: readonly string[] = ["modules", "services"];
+
+/**
+ * Function to compile a Python module to bytecode with mpy-cross.
+ *
+ * @param source - The ".py" file to compile.
+ * @param output - The ".mpy" file to write.
+ */
+function compileModule(source: string, output: string): void {
+    execFileSync("python3", ["-m", "mpy_cross", "-o", output, source], {
+      stdio: "inherit",
+    });
+}
+
+/**
+ * Function to copy a folder to the bundle, compiling the Python modules on
+ * the way.
+ *
+ * @param path - The folder to bundle.
+ * @param outputPath - The folder in the bundle.
+ * @returns The size of the source modules and of their bytecode, in bytes.
+ */
+function bundleFolder(path: string, outputPath: string): [number, number] {
+    let sourceSize = 0;
+    let bytecodeSize = 0;
+    makePath(outputPath, { recursive: true });
+
+    for (const name of readdirSync(path)) {
+      if (skipped.includes(name)) {
+        continue;
+      }
+
+      const filePath = pathJoin(path, name);
+      const outputFilePath = pathJoin(outputPath, name);
+
+      if (statSync(filePath).isDirectory()) {
+        const [source, bytecode] = bundleFolder(filePath, outputFilePath);
+        sourceSize += source;
+        bytecodeSize += bytecode;
+        continue;
+      }
+
+      const isModule = name.endsWith(".py") && !(path === sourceDir && sourceFiles.includes(name));
+      if (!isModule) {
+        copyFileSync(filePath, outputFilePath);
+        continue;
+      }
+
+      const mpyPath = outputFilePath.replace(/\.py$/, ".mpy");
+      compileModule(filePath, mpyPath);
+      sourceSize += statSync(filePath).size;
+      bytecodeSize += statSync(mpyPath).size;
+      console.log(`Compiled ${filePath} (${statSync(filePath).size} -> ${statSync(mpyPath).size} bytes)`);
+    }
+
+    return [sourceSize, bytecodeSize];
+}
+
+/**
+ * Function to write a manifest for freezing the modules into a custom
+ * firmware. Include it from the board's manifest when building MicroPython.
+ */
+function writeManifest(): void {
+    const basePath = pathRelative(bundleDir, sourceDir);
+    const lines = [
+      "# Freezes the Pico Portal modules into the firmware. Add",
+      '# include("<path to this file>") to the board manifest, then copy only',
+      "# main.py, options.json and the static files to the device.",
+      ...frozenPackages.map((name) => `package("${name}", base_path="${basePath}")`),
+    ];
+
+    writeFileSync(pathJoin(bundleDir, "manifest.py"), lines.join("\n") + "\n");
+    console.log(`Written ${pathJoin(bundleDir, "manifest.py")}`);
+}
+
+/**
+ * Function to build the bundle from scratch.
+ */
+function bundle(): void {
+    if (!pathExists(pathJoin(sourceDir, "modules", "phew"))) {
+      console.error("src/modules/phew is missing, run `npm install` first");
+      process.exit(1);
+    }
+
+    rmSync(bundleDir, { recursive: true, force: true });
+    const [sourceSize, bytecodeSize] = bundleFolder(sourceDir, bundleDir);
+    writeManifest();
+
+    console.log(`Modules: ${sourceSize} bytes of source -> ${bytecodeSize} bytes of bytecode`);
+    console.log("Completed!");
+}
+
+bundle();
@@ -0,0 +1,86 @@
+// ============================================================================
+//  Project: Pico Portal
+//  License: CC-BY-NC-4.0
+//  SPDX-License-Identifier: CC-BY-NC-4.0
+//  Repository: https://github.com/CodyTolene/Pico-Portal
+//  Description: A script to precompress the static pages served by the Pico
+//   Portal. A ".gz" copy is written next to each page, which the device sends
+//   with "Content-Encoding: gzip" to clients that accept it. Static app files
+//   in "src/www" (including subfolders) are compressed the same way.
+// ============================================================================
+
+import { gzipSync, constants } from "zlib";
+import {
+    existsSync as pathExists,
+    readdirSync,
+    readFileSync,
+    statSync,
+    writeFileSync,
+} from "fs";
+import { join as pathJoin } from "path";
+
+interface Folder {
+    extensions: readonly string[];
+    path: string;
+}
+
+const folders: readonly Folder[] = [
+    {
+        extensions: [".html", ".css", ".js", ".svg", ".json", ".txt"],
+        path: "./src/templates",
+    },
+    {
+        extensions: [".html", ".css", ".js", ".mjs", ".svg", ".json", ".map", ".txt", ".wasm", ".xml"],
+        path: "./src/www",
+    },
+];
+
+/**
+ * Function to write a gzip copy of every matching file in a folder and its
+ * subfolders.
+ *
+ * @param path - The folder to compress.
+ * @param extensions - The file extensions to compress.
+ */
+function compressFolder(path: string, extensions: readonly string[]): void {
+    for (const name of readdirSync(path)) {
+      const filePath = pathJoin(path, name);
+
+      if (statSync(filePath).isDirectory()) {
+        compressFolder(filePath, extensions);
+        continue;
+      }
+
+      if (!extensions.some((extension) => name.endsWith(extension))) {
+        continue;
+      }
+
+      const source = readFileSync(filePath);
+      const compressed = gzipSync(source, { level: constants.Z_BEST_COMPRESSION });
+
+      writeFileSync(`${filePath}.gz`, compressed);
+      console.log(`Compressed ${filePath} (${source.length} -> ${compressed.length} bytes)`);
+    }
+}
+
+/**
+ * Function to compress the given folders, skipping any that do not exist.
+ *
+ * @param dirs - The list of folders to compress.
+ */
+function compressFolders(dirs: readonly Folder[]): void {
+    for (const dir of dirs) {
+      const { extensions, path } = dir;
+
+      if (!pathExists(path)) {
+        console.log(`Skipping ${path}, folder does not exist`);
+        continue;
+      }
+
+      compressFolder(path, extensions);
+    }
+
+    console.log("Completed!");
+}
+
+compressFolders(folders);
@@ -0,0 +1,84 @@
+# =============================================================================
+#  Project: Pico Portal
+#  License: CC-BY-NC-4.0
+#  Repository: https://github.com/CodyTolene/Pico-Portal
+#  Description: Converts the Pico Portal log (log.bin and its rotated copies,
+#  see services/log_service.py) to plain text, one message per line. Copy
+#  the log files off the Pico with Thonny first. Rotated copies given in any
+#  order are written oldest first.
+#
+#  Usage:
+#    python3 host/log_to_text.py log.bin.2 log.bin.1 log.bin [--colors]
+#        [--output log.txt]
+# =============================================================================
+
+import argparse
+import os
+import re
+import struct
+import sys
+
+# Record header, the text length in the low 12 bits and the palette color
+# index in the high 4
+HEADER = struct.Struct("<H")
+LENGTH_MASK = 0x0FFF
+
+# MessagesService palette, in index order
+COLOR_NAMES = ("black", "gray", "green", "red", "white")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Convert a Pico Portal log to text")
+    parser.add_argument("files", nargs="+", help="log.bin and rotated copies")
+    parser.add_argument(
+        "--colors", action="store_true", help="prefix each line with its color"
+    )
+    parser.add_argument("--output", help="write to this file instead of stdout")
+    return parser.parse_args()
+
+
+# log.bin.3 is older than log.bin.1, which is older than log.bin
+def age(file_path):
+    match = re.search(r"\.(\d+)$", file_path)
+    return int(match.group(1)) if match else 0
+
+
+def read_records(file_path):
+    with open(file_path, "rb") as log_file:
+        data = log_file.read()
+
+    offset = 0
+    while offset + HEADER.size <= len(data):
+        (header,) = HEADER.unpack_from(data, offset)
+        start = offset + HEADER.size
+        end = start + (header & LENGTH_MASK)
+        if end > len(data):
+            print(f"{file_path}: last record cut short", file=sys.stderr)
+            return
+        yield data[start:end].decode("utf-8", "replace"), header >> 12
+        offset = end
+
+
+def main():
+    args = parse_args()
+    output = open(args.output, "w") if args.output else sys.stdout
+    count = 0
+    try:
+        for file_path in sorted(args.files, key=age, reverse=True):
+            if not os.path.isfile(file_path):
+                print(f"{file_path}: not found", file=sys.stderr)
+                continue
+            for text, color in read_records(file_path):
+                if args.colors:
+                    name = COLOR_NAMES[color] if color < len(COLOR_NAMES) else color
+                    output.write(f"{name}\t")
+                output.write(f"{text}\n")
+                count += 1
+    finally:
+        if args.output:
+            output.close()
+    print(f"{count} messages", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+# =============================================================================
+#  Project: Pico Portal
+#  License: CC-BY-NC-4.0
+#  Repository: https://github.com/CodyTolene/Pico-Portal
+#  Description: Runs the Pico Portal under CPython on a host machine. The
+#  contents of `src/` are copied into a device root folder (like copying them
+#  to the Pico), the MicroPython and Pimoroni modules are replaced with the
+#  stand-ins in `host/stubs/`, and the real main() is started. HTTP and DNS
+#  are served on localhost ports.
+#
+#  Usage:
+#    python3 host/run.py [--http-port 8080] [--dns-port 5353] [--duration 30]
+#        [--display DISPLAY_PICO_DISPLAY_2] [--screenshot screen.png]
+#        [--button A@2.0] [--button X@4.0:1.5] [--script benchmarks/x.py]
+#        [--option http_rate_limit=0]
+# =============================================================================
+
+import argparse
+import asyncio
+import gc
+import os
+import runpy
+import shutil
+import sys
+import time
+import tracemalloc
+
+HOST_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(HOST_DIR)
+SRC_DIR = os.path.join(REPO_DIR, "src")
+STUBS_DIR = os.path.join(HOST_DIR, "stubs")
+DEFAULT_ROOT = os.path.join(HOST_DIR, ".device")
+
+# Heap size reported through gc.mem_free(). CPython objects are several times
+# larger than MicroPython's, so this is well above the Pico W's ~190 KB
+DEFAULT_HEAP_SIZE = 1024 * 1024
+
+# Traced allocations that are not counted against the heap (imports etc.)
+heap_baseline = 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Run the Pico Portal on the host")
+    parser.add_argument("--root", default=DEFAULT_ROOT, help="device root folder")
+    parser.add_argument("--http-port", type=int, default=8080)
+    parser.add_argument("--dns-port", type=int, default=5353)
+    parser.add_argument(
+        "--display",
+        choices=["DISPLAY_PICO_DISPLAY", "DISPLAY_PICO_DISPLAY_2"],
+        help="override the display_type option",
+    )
+    parser.add_argument(
+        "--option",
+        action="append",
+        default=[],
+        metavar="KEY=VALUE",
+        help="override an option in options.json, the value is JSON",
+    )
+    parser.add_argument("--duration", type=float, help="stop after this many seconds")
+    parser.add_argument("--screenshot", help="save the screen as a PNG on exit")
+    parser.add_argument(
+        "--button",
+        action="append",
+        default=[],
+        metavar="BUTTON@SECONDS[:HOLD]",
+        help="press a button (A, B, X or Y) at a time, optionally held",
+    )
+    parser.add_argument(
+        "--heap-size",
+        type=int,
+        default=DEFAULT_HEAP_SIZE,
+        help="heap size for gc.mem_free(), counted from allocations made "
+        "after imports (CPython objects are larger, treat it as a trend)",
+    )
+    parser.add_argument("--script", help="run a script (such as a benchmark)")
+    return parser.parse_args()
+
+
+# Copy src/ into the device root, keeping files the device created (logs etc.)
+def prepare_root(root):
+    if not os.path.isdir(os.path.join(SRC_DIR, "modules", "phew")):
+        sys.exit("src/modules/phew is missing, run `npm install` first")
+    shutil.copytree(
+        SRC_DIR,
+        root,
+        dirs_exist_ok=True,
+        ignore=shutil.ignore_patterns("__pycache__", "*.pyc"),
+    )
+
+
+# Start counting heap use from here
+def reset_heap_baseline():
+    global heap_baseline
+    heap_baseline = tracemalloc.get_traced_memory()[0]
+
+
+# MicroPython additions to CPython's gc and time modules, phew and the
+# services call these directly
+def install_compat(heap_size):
+    import utime
+
+    tracemalloc.start()
+
+    def mem_alloc():
+        return max(0, tracemalloc.get_traced_memory()[0] - heap_baseline)
+
+    def mem_free():
+        return max(0, heap_size - mem_alloc())
+
+    gc.mem_alloc = mem_alloc
+    gc.mem_free = mem_free
+    gc.threshold = lambda *args: -1
+
+    for name in ("ticks_ms", "ticks_us", "ticks_cpu", "ticks_diff", "ticks_add"):
+        setattr(time, name, getattr(utime, name))
+    time.sleep_ms = utime.sleep_ms
+    time.sleep_us = utime.sleep_us
+
+
+def set_options(root, overrides):
+    import json
+
+    file_path = os.path.join(root, "options.json")
+    with open(file_path) as f:
+        options = json.load(f)
+    options.update(overrides)
+    with open(file_path, "w") as f:
+        json.dump(options, f)
+
+
+def parse_option(spec):
+    import json
+
+    key, _, value = spec.partition("=")
+    try:
+        return key, json.loads(value)
+    except ValueError:
+        return key, value  # A plain string
+
+
+async def run_buttons(buttons):
+    import pimoroni
+
+    events = []
+    for spec in buttons:
+        name, _, timing = spec.partition("@")
+        at, _, hold = timing.partition(":")
+        events.append((float(at), name.upper(), float(hold or 0.15)))
+
+    start = time.monotonic()
+    for at, name, hold in sorted(events):
+        await asyncio.sleep(max(0, at - (time.monotonic() - start)))
+        print(f"[host] button {name} pressed for {hold}s")
+        pimoroni.press(name)
+        await asyncio.sleep(hold)
+        pimoroni.release(name)
+
+
+async def run_portal(args):
+    import main as device_main
+    import services.portal_service as portal_service
+
+    portal_service.HTTP_PORT = args.http_port
+    portal_service.DNS_PORT = args.dns_port
+    print(f"[host] HTTP on http://127.0.0.1:{args.http_port}/")
+    print(f"[host] DNS on 127.0.0.1:{args.dns_port} (udp)")
+
+    if args.button:
+        asyncio.ensure_future(run_buttons(args.button))
+
+    reset_heap_baseline()
+
+    try:
+        await asyncio.wait_for(device_main.main(), args.duration)
+    except asyncio.TimeoutError:
+        pass
+
+
+def report(args):
+    import machine
+    import picographics
+    import pimoroni
+
+    for graphics in picographics.instances:
+        print(
+            f"[host] display {graphics.width}x{graphics.height}: "
+            f"{graphics.frames} frames, {graphics.partial_frames} partial updates"
+        )
+    print(f"[host] RGB LED writes: {len(pimoroni.led_history)}")
+    print(f"[host] pin writes: {len(machine.pin_history)}")
+    print(f"[host] gc.mem_free(): {gc.mem_free()} bytes")
+
+    if args.screenshot and picographics.instances:
+        picographics.instances[-1].save_png(args.screenshot)
+        print(f"[host] screen saved to {args.screenshot}")
+
+
+def main():
+    args = parse_args()
+    if args.screenshot:
+        args.screenshot = os.path.abspath(args.screenshot)
+    script = os.path.abspath(args.script) if args.script else None
+
+    prepare_root(args.root)
+    overrides = dict(parse_option(spec) for spec in args.option)
+    if args.display:
+        overrides["display_type"] = args.display
+    if overrides:
+        set_options(args.root, overrides)
+
+    # The device root acts as the filesystem root, stand-ins shadow nothing
+    # from src/ but replace the firmware modules
+    sys.path[:0] = [args.root, STUBS_DIR]
+    os.chdir(args.root)
+    install_compat(args.heap_size)
+
+    try:
+        if script:
+            reset_heap_baseline()
+            runpy.run_path(script, run_name="__main__")
+        else:
+            asyncio.run(run_portal(args))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        report(args)
+
+
+if __name__ == "__main__":
+    main()
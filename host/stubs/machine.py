@@ -0,0 +1,107 @@
+# =============================================================================
+#  Project: Pico Portal
+#  License: CC-BY-NC-4.0
+#  Repository: https://github.com/CodyTolene/Pico-Portal
+#  Description: Host stand-in for MicroPython's machine module. Pins keep
+#  their value (button pins follow the scripted button state) and record
+#  writes, the watchdog records feeds and reports when it would have reset
+#  the board.
+# =============================================================================
+
+import time
+
+import pimoroni
+
+# Every output pin write as (seconds, pin id, value), oldest first
+pin_history = []
+PIN_HISTORY_SIZE = 1000
+
+# Interrupt handlers by pin id, as (trigger, handler, pin)
+irq_handlers = {}
+
+
+# Call the interrupt handler of a pin after its level changed
+def trigger_irq(pin_id, rising):
+    entry = irq_handlers.get(pin_id)
+    if entry is None:
+        return
+    trigger, handler, pin = entry
+    if trigger & (Pin.IRQ_RISING if rising else Pin.IRQ_FALLING):
+        handler(pin)
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    def __init__(self, id, mode=IN, pull=None, value=None):
+        self.id = id
+        self.mode = mode
+        self._value = value or 0
+
+    def value(self, value=None):
+        if value is None:
+            # Buttons are wired to ground, pressed reads low
+            if self.id in pimoroni.BUTTON_PINS.values():
+                return 0 if self.id in pimoroni.pressed_pins else 1
+            return self._value
+        self._value = 1 if value else 0
+        pin_history.append((time.monotonic(), self.id, self._value))
+        del pin_history[:-PIN_HISTORY_SIZE]
+
+    def irq(self, handler=None, trigger=IRQ_FALLING | IRQ_RISING, hard=False):
+        if handler is None:
+            irq_handlers.pop(self.id, None)
+        else:
+            irq_handlers[self.id] = (trigger, handler, self)
+
+    def on(self):
+        self.value(1)
+
+    def off(self):
+        self.value(0)
+
+    def toggle(self):
+        self.value(0 if self._value else 1)
+
+    def __call__(self, value=None):
+        return self.value(value)
+
+
+class RTC:
+    def datetime(self, value=None):
+        t = time.localtime()
+        return (t[0], t[1], t[2], t[6], t[3], t[4], t[5], 0)
+
+
+class WDT:
+    def __init__(self, id=0, timeout=5000):
+        self.timeout = timeout
+        self.last_feed = time.monotonic()
+        self.feeds = 0
+        self.missed = 0
+
+    def feed(self):
+        now = time.monotonic()
+        if (now - self.last_feed) * 1000 > self.timeout:
+            # The device would have been reset
+            self.missed += 1
+            print(f"[host] watchdog would have reset the board ({self.timeout} ms)")
+        self.last_feed = now
+        self.feeds += 1
+
+
+def freq(value=None):
+    return 125_000_000
+
+
+def reset():
+    raise SystemExit("[host] machine.reset()")
+
+
+def unique_id():
+    return b"\x00\x00\x00\x00\x00\x00\x00\x00"
@@ -0,0 +1,46 @@
+# =============================================================================
+#  Project: Pico Portal
+#  License: CC-BY-NC-4.0
+#  Repository: https://github.com/CodyTolene/Pico-Portal
+#  Description: Host stand-in for MicroPython's network module. The access
+#  point is the local loopback interface.
+# =============================================================================
+
+STA_IF = 0
+AP_IF = 1
+
+STAT_IDLE = 0
+STAT_CONNECTING = 1
+STAT_WRONG_PASSWORD = -3
+STAT_NO_AP_FOUND = -2
+STAT_CONNECT_FAIL = -1
+STAT_GOT_IP = 3
+
+# Address reported by every interface
+LOOPBACK = "127.0.0.1"
+
+
+class WLAN:
+    def __init__(self, interface=STA_IF):
+        self.interface = interface
+        self.settings = {}
+        self._active = False
+
+    def config(self, *args, **kwargs):
+        if args:
+            return self.settings.get(args[0])
+        self.settings.update(kwargs)
+
+    def active(self, value=None):
+        if value is None:
+            return self._active
+        self._active = bool(value)
+
+    def ifconfig(self):
+        return (LOOPBACK, "255.255.255.0", LOOPBACK, LOOPBACK)
+
+    def isconnected(self):
+        return self._active
+
+    def status(self, *args):
+        return STAT_GOT_IP if self._active else STAT_IDLE
@@ -0,0 +1,169 @@
+# =============================================================================
+#  Project: Pico Portal
+#  License: CC-BY-NC-4.0
+#  Repository: https://github.com/CodyTolene/Pico-Portal
+#  Description: Host stand-in for Pimoroni's picographics module. Draws into an
+#  in-memory RGB332 framebuffer (one byte per pixel, like the device) which
+#  can be saved as a PNG. Text is drawn as solid glyph cells using advance
+#  widths close to the bitmap8 font, so layout matches the device closely but
+#  the glyph shapes do not.
+# =============================================================================
+
+import struct
+import time
+import zlib
+
+DISPLAY_PICO_DISPLAY = 0
+DISPLAY_PICO_DISPLAY_2 = 1
+
+PEN_RGB332 = 2
+
+# Native panel sizes before rotation
+DISPLAY_SIZES = {
+    DISPLAY_PICO_DISPLAY: (240, 135),
+    DISPLAY_PICO_DISPLAY_2: (320, 240),
+}
+
+# Approximate bitmap8 glyph widths, every glyph is followed by one pixel of
+# letter spacing
+NARROW_GLYPHS = "!'.,:;|`il"
+WIDE_GLYPHS = "mwMW"
+GLYPH_HEIGHT = 8
+
+# Every PicoGraphics created on the host, newest last
+instances = []
+
+
+def glyph_width(char):
+    if char == " ":
+        return 3
+    if char in NARROW_GLYPHS:
+        return 2
+    if char in WIDE_GLYPHS:
+        return 6
+    if ord(char) < 32:
+        return 0
+    return 5
+
+
+# The framebuffer is the object itself so memoryview(graphics) works as it
+# does on the device
+class PicoGraphics(bytearray):
+    def __init__(self, display=DISPLAY_PICO_DISPLAY, rotate=0, pen_type=PEN_RGB332):
+        width, height = DISPLAY_SIZES[display]
+        if rotate in (90, 270):
+            width, height = height, width
+        super().__init__(width * height)
+
+        self.width = width
+        self.height = height
+        self.pen = 0
+        self.font = "bitmap8"
+        self.backlight = 1.0
+        self.clip = (0, 0, width, height)
+
+        # Host only, frame statistics
+        self.frames = 0
+        self.partial_frames = 0
+        self.last_update = None
+
+        instances.append(self)
+
+    def get_bounds(self):
+        return self.width, self.height
+
+    def create_pen(self, r, g, b):
+        return (r & 0xE0) | ((g & 0xE0) >> 3) | (b >> 6)
+
+    def set_pen(self, pen):
+        self.pen = pen
+
+    def set_font(self, font):
+        self.font = font
+
+    def set_backlight(self, brightness):
+        self.backlight = brightness
+
+    def set_clip(self, x, y, w, h):
+        self.clip = (x, y, x + w, y + h)
+
+    def remove_clip(self):
+        self.clip = (0, 0, self.width, self.height)
+
+    def clear(self):
+        left, top, right, bottom = self.clip
+        row = bytes([self.pen]) * (right - left)
+        for y in range(top, bottom):
+            start = y * self.width + left
+            end = start + len(row)
+            self[start:end] = row
+
+    def pixel(self, x, y):
+        left, top, right, bottom = self.clip
+        if left <= x < right and top <= y < bottom:
+            self[y * self.width + x] = self.pen
+
+    def rectangle(self, x, y, w, h):
+        left, top, right, bottom = self.clip
+        x0, y0 = max(x, left), max(y, top)
+        x1, y1 = min(x + w, right), min(y + h, bottom)
+        if x1 <= x0:
+            return
+        row = bytes([self.pen]) * (x1 - x0)
+        for row_y in range(y0, y1):
+            start = row_y * self.width + x0
+            end = start + len(row)
+            self[start:end] = row
+
+    def measure_text(self, text, scale=1, spacing=1, fixed_width=False):
+        return sum((glyph_width(char) + spacing) * scale for char in text)
+
+    def text(self, text, x, y, wordwrap=-1, scale=1, angle=0, spacing=1):
+        cursor_x, cursor_y = x, y
+        for char in text:
+            width = glyph_width(char) * scale
+            if char == "\n" or (
+                wordwrap > 0 and cursor_x + width > x + wordwrap and cursor_x > x
+            ):
+                cursor_x, cursor_y = x, cursor_y + GLYPH_HEIGHT * scale
+                if char == "\n":
+                    continue
+            if char != " " and width:
+                self.rectangle(cursor_x, cursor_y, width, (GLYPH_HEIGHT - 1) * scale)
+            cursor_x += width + spacing * scale
+
+    def update(self):
+        self.frames += 1
+        self.last_update = time.monotonic()
+
+    def partial_update(self, x, y, w, h):
+        self.partial_frames += 1
+        self.last_update = time.monotonic()
+
+    # Host only, write the framebuffer to a PNG file
+    def save_png(self, file_path):
+        rows = []
+        for y in range(self.height):
+            row = bytearray(b"\x00")  # No filter
+            start = y * self.width
+            end = start + self.width
+            for pen in self[start:end]:
+                row += bytes(
+                    (
+                        (pen & 0xE0) * 255 // 0xE0,
+                        ((pen << 3) & 0xE0) * 255 // 0xE0,
+                        (pen & 0x03) * 255 // 0x03,
+                    )
+                )
+            rows.append(bytes(row))
+
+        def chunk(tag, data):
+            crc = zlib.crc32(tag + data) & 0xFFFFFFFF
+            return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", crc)
+
+        header = struct.pack(">IIBBBBB", self.width, self.height, 8, 2, 0, 0, 0)
+        with open(file_path, "wb") as f:
+            f.write(b"\x89PNG\r\n\x1a\n")
+            f.write(chunk(b"IHDR", header))
+            f.write(chunk(b"IDAT", zlib.compress(b"".join(rows))))
+            f.write(chunk(b"IEND", b""))
@@ -0,0 +1,56 @@
+# =============================================================================
+#  Project: Pico Portal
+#  License: CC-BY-NC-4.0
+#  Repository: https://github.com/CodyTolene/Pico-Portal
+#  Description: Host stand-in for Pimoroni's pimoroni module. Buttons read
+#  their state from a scriptable table of pressed pins, and the RGB LED
+#  records every color it is set to.
+# =============================================================================
+
+import time
+
+# Pins currently held down, set by press()/release() or a button script
+pressed_pins = set()
+
+# Pico Display button pins
+BUTTON_PINS = {"A": 12, "B": 13, "X": 14, "Y": 15}
+
+# Every RGB LED write as (seconds, r, g, b), oldest first
+led_history = []
+LED_HISTORY_SIZE = 1000
+
+
+def press(button):
+    import machine
+
+    pressed_pins.add(BUTTON_PINS[button])
+    machine.trigger_irq(BUTTON_PINS[button], rising=False)
+
+
+def release(button):
+    import machine
+
+    pressed_pins.discard(BUTTON_PINS[button])
+    machine.trigger_irq(BUTTON_PINS[button], rising=True)
+
+
+class Button:
+    def __init__(self, pin, invert=True, repeat_time=200, hold_time=1000):
+        self.pin = pin
+
+    def read(self):
+        return self.pin in pressed_pins
+
+    @property
+    def is_pressed(self):
+        return self.read()
+
+
+class RGBLED:
+    def __init__(self, r, g, b, invert=True):
+        self.color = (0, 0, 0)
+
+    def set_rgb(self, r, g, b):
+        self.color = (r, g, b)
+        led_history.append((time.monotonic(), r, g, b))
+        del led_history[:-LED_HISTORY_SIZE]
@@ -0,0 +1,111 @@
+# =============================================================================
+#  Project: Pico Portal
+#  License: CC-BY-NC-4.0
+#  Repository: https://github.com/CodyTolene/Pico-Portal
+#  Description: Host stand-in for MicroPython's uasyncio, mapped onto CPython's
+#  asyncio. Adds the MicroPython-only helpers the portal and phew use,
+#  including generator based tasks waiting on socket reads.
+# =============================================================================
+
+import asyncio
+from asyncio import *  # noqa: F401,F403
+from types import SimpleNamespace
+
+
+async def sleep_ms(ms):
+    await asyncio.sleep(ms / 1000)
+
+
+async def wait_for_ms(awaitable, timeout):
+    return await asyncio.wait_for(awaitable, timeout / 1000)
+
+
+# An event that clears itself when a waiter wakes, set from interrupts
+class ThreadSafeFlag:
+    def __init__(self):
+        self.event = asyncio.Event()
+
+    def set(self):
+        self.event.set()
+
+    def clear(self):
+        self.event.clear()
+
+    async def wait(self):
+        await self.event.wait()
+        self.event.clear()
+
+
+# Drive a MicroPython style generator task, each value it yields is awaited
+async def _drive(generator):
+    value = None
+    while True:
+        try:
+            awaitable = generator.send(value)
+        except StopIteration as stop:
+            return stop.value
+        value = await awaitable if awaitable is not None else await asyncio.sleep(0)
+
+
+# Same for an "async def" containing "yield", a generator on MicroPython but
+# an async generator on CPython
+async def _drive_async(generator):
+    value = None
+    while True:
+        try:
+            awaitable = await generator.asend(value)
+        except StopAsyncIteration:
+            return
+        value = await awaitable if awaitable is not None else await asyncio.sleep(0)
+
+
+def create_task(coro):
+    if hasattr(coro, "asend"):
+        coro = _drive_async(coro)
+    elif hasattr(coro, "send") and not asyncio.iscoroutine(coro):
+        coro = _drive(coro)
+    return asyncio.get_event_loop().create_task(coro)
+
+
+# Event loop proxy, resolves the running loop when it is used
+class _Loop:
+    def create_task(self, coro):
+        return create_task(coro)
+
+    def run_forever(self):
+        # The portal already runs inside the event loop
+        pass
+
+    def run_until_complete(self, coro):
+        return asyncio.get_event_loop().run_until_complete(coro)
+
+    def stop(self):
+        asyncio.get_event_loop().stop()
+
+    def close(self):
+        pass
+
+
+_loop = _Loop()
+
+
+def get_event_loop():
+    return _loop
+
+
+# uasyncio.core._io_queue.queue_read(socket), used by phew's DNS server
+class _IOQueue:
+    def queue_read(self, sock):
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+
+        def ready():
+            loop.remove_reader(sock)
+            if not future.done():
+                future.set_result(None)
+
+        loop.add_reader(sock, ready)
+        return future
+
+
+core = SimpleNamespace(_io_queue=_IOQueue())
@@ -0,0 +1,8 @@
+# =============================================================================
+#  Project: Pico Portal
+#  License: CC-BY-NC-4.0
+#  Repository: https://github.com/CodyTolene/Pico-Portal
+#  Description: Host stand-in for MicroPython's usocket, CPython's socket.
+# =============================================================================
+
+from socket import *  # noqa: F401,F403
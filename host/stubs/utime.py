@@ -0,0 +1,40 @@
+# =============================================================================
+#  Project: Pico Portal
+#  License: CC-BY-NC-4.0
+#  Repository: https://github.com/CodyTolene/Pico-Portal
+#  Description: Host stand-in for MicroPython's utime, CPython's time plus the
+#  MicroPython tick functions.
+# =============================================================================
+
+import time as _time
+from time import *  # noqa: F401,F403
+
+_start = _time.monotonic_ns()
+
+
+def ticks_ms():
+    return (_time.monotonic_ns() - _start) // 1_000_000
+
+
+def ticks_us():
+    return (_time.monotonic_ns() - _start) // 1_000
+
+
+def ticks_cpu():
+    return ticks_us()
+
+
+def ticks_diff(new, old):
+    return new - old
+
+
+def ticks_add(ticks, delta):
+    return ticks + delta
+
+
+def sleep_ms(ms):
+    _time.sleep(ms / 1000)
+
+
+def sleep_us(us):
+    _time.sleep(us / 1_000_000)
@@ -12,11 +12,25 @@ import time
 
 # Local packages
 from services.button_service import ButtonService
+from services.led_service import LedService
+from services.log_service import FLUSH_INTERVAL_SAVE_MS
+from services.memory_service import (
+    SAMPLE_INTERVAL_MS,
+    SAMPLE_INTERVAL_SAVE_MS,
+    MemoryService,
+)
 from services.messages_service import MessagesService
-from services.onboard_led_service import OnboardLedService
-from services.options_service import OptionsService
-from services.pico_display_led_service import PicoDisplayLedService
-from services.portal_service import PortalService
+from services.metrics_service import MetricKeys, MetricsService
+from services.options_service import (
+    RELOAD_INTERVAL_MS,
+    RELOAD_INTERVAL_SAVE_MS,
+    OptionKeys,
+    OptionsService,
+)
+from services.portal_service import STATUS_ACCESS_POINT, PortalService
+from services.power_service import PowerService
+from services.scheduler_service import SchedulerService
+from services.supervisor_service import SupervisorService
 
 # Ensure packages can be imported
 sys.path.append("/modules")
@@ -25,37 +39,121 @@ sys.path.append("/services")
 # Version
 VERSION = "1.0.0"
 
+# End of the imports, the first phase of the boot timeline
+IMPORTS_DONE_MS = time.ticks_ms()
+
 
 async def main():
     # Dependencies
-    onboard_led = OnboardLedService()
     options = OptionsService()
-    pico_display_led = PicoDisplayLedService(options)
-    messages = MessagesService(options)
-    buttons = ButtonService(messages)
-    portal = PortalService(options, messages, pico_display_led)
+    metrics = MetricsService()
+    metrics.set(MetricKeys.BOOT_IMPORTS_MS, max(1, IMPORTS_DONE_MS))
+    leds = LedService(options, metrics)
+    messages = MessagesService(options, metrics)
+    metrics.mark(MetricKeys.BOOT_DISPLAY_MS)
+    buttons = ButtonService(messages, options)
+    portal = PortalService(options, messages, leds, metrics)
+    memory = MemoryService(options, messages, metrics)
+    supervisor = SupervisorService(
+        messages,
+        metrics,
+        options.get_option(OptionKeys.WATCHDOG_TIMEOUT_MS, 8000),
+    )
+    scheduler = SchedulerService(metrics)
+    power = PowerService(options, messages, leds, scheduler, metrics)
 
     # Display the current version of the software on screen
     await messages.display(f"Pico Portal v{VERSION}")
 
-    # Set the display LED to white while starting up
-    await pico_display_led.set_color("WHITE")
+    # Pulse the display LED white while starting up. One task plays the
+    # effects of both LEDs
+    leds.pulse("WHITE")
+    uasyncio.create_task(leds.run())
+
+    # Bring the access point up before any task runs, the radio takes the
+    # longest to start and phones can join while everything else starts. If
+    # it fails the portal task tries again
+    try:
+        await portal.start_access_point()
+    except Exception as e:
+        leds.status("RED", STATUS_ACCESS_POINT)
+        await messages.display(f"Error: {e}", color=messages.RED)
 
-    # Flash the onboard LED on and off every 3 seconds, indefinitely
-    # Useful for when no screen is connected to the Pico Portal
-    uasyncio.create_task(onboard_led.flash())
+    # Periodic work runs from one scheduler task, which sleeps until the
+    # next deadline. Feeding the watchdog is scheduled first so a hang during
+    # startup resets the board too, the scheduler also measures the loop lag
+    supervisor.start_watchdog()
+    power.stretch(
+        scheduler.every("watchdog", supervisor.feed_interval_ms(), supervisor.feed),
+        supervisor.feed_interval_ms(power_save=True),
+    )
+    supervisor.start("scheduler", scheduler.run)
 
-    # Start Pico Portal services
-    uasyncio.create_task(portal.run())
+    # Start the DNS and web servers, restarted if they fail to start. Started
+    # ahead of the other tasks so the first page is served as soon as possible
+    supervisor.start("portal", portal.run)
+
+    # Draw queued messages on screen
+    supervisor.start("messages", messages.run)
 
     # Handle the buttons and trigger actions based on button presses
-    uasyncio.create_task(buttons.run())
+    supervisor.start("buttons", buttons.run)
+
+    # Save option changes in batches and pick up edits to options.json
+    supervisor.start("options", options.run)
+    power.stretch(
+        scheduler.every("options", RELOAD_INTERVAL_MS, options.check_file),
+        RELOAD_INTERVAL_SAVE_MS,
+    )
+
+    # Write the log buffer to flash now and then, as well as when it fills
+    power.stretch(
+        scheduler.every("log", messages.log.flush_interval_ms, messages.log.flush),
+        FLUSH_INTERVAL_SAVE_MS,
+    )
+
+    # Sample the free heap, collect garbage between requests and shed load,
+    # in this order, while memory is low
+    memory.add_busy_check(lambda: portal.web_server.connections > 0)
+    memory.shed(
+        OptionKeys.MEMORY_TRIM_BELOW,
+        "cache trim",
+        portal.trim_caches,
+        portal.restore_caches,
+    )
+    memory.shed(
+        OptionKeys.MEMORY_REFUSE_BELOW,
+        "connection refusal",
+        portal.refuse_connections,
+        portal.accept_connections,
+    )
+    memory.shed(
+        OptionKeys.MEMORY_PAUSE_BELOW,
+        "redraw pause",
+        messages.pause_redraws,
+        messages.resume_redraws,
+    )
+    power.stretch(
+        scheduler.every("memory", SAMPLE_INTERVAL_MS, memory.sample),
+        SAMPLE_INTERVAL_SAVE_MS,
+    )
+
+    # Blink the onboard LED every 3 seconds, useful for when no screen is
+    # connected to the Pico Portal. With power_save on it stays off instead
+    # and the screen turns off while nobody uses the portal, a button press
+    # only turns it back on
+    buttons.wake = power.wake
+    power.set_enabled(options.get_option(OptionKeys.POWER_SAVE, False))
 
-    # Keep the application running indefinitely while the power is on
-    while True:
-        await uasyncio.sleep(1)
+    # Keep the application running while the power is on, without waking,
+    # the log buffer and unsaved options are written out if the application
+    # is stopped
+    try:
+        await uasyncio.Event().wait()
+    finally:
+        messages.log.flush()
+        options.flush()
 
 
 if __name__ == "__main__":
-    time.sleep(1)
     uasyncio.run(main())
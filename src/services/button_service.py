@@ -3,96 +3,233 @@
 #  License: CC-BY-NC-4.0
 #  Repository: https://github.com/CodyTolene/Pico-Portal
 #  Description: A service to handle button inputs and trigger actions based on
-#  the button presses.
+#  the button presses. Pin-change interrupts queue edges in a fixed ring
+#  buffer and wake the input task, which sleeps while no button is touched.
 # =============================================================================
 
-from pimoroni import Button  # type: ignore
 import sys
 import uasyncio  # type: ignore
+import utime  # type: ignore
+from array import array
+from machine import Pin  # type: ignore
 
 # Local packages
 from services.messages_service import MessagesService
+from services.metrics_service import MetricKeys
+from services.options_service import OptionKeys, OptionsService
 
 # Ensure packages can be imported
 sys.path.append("../modules")
 sys.path.append("../services")
 
+# Button pins, in index order
+BUTTON_A = 0
+BUTTON_B = 1
+BUTTON_X = 2
+BUTTON_Y = 3
+BUTTON_PINS = (12, 13, 14, 15)
+
+# Edges the interrupt handler can queue before the input task catches up,
+# a power of two
+EVENT_QUEUE_SIZE = 16
+
 
 class ButtonService:
-    def __init__(self, messages: MessagesService):
+    def __init__(self, messages: MessagesService, options: OptionsService):
         # Dependencies
         self.messages = messages
+        self.metrics = messages.metrics
+
+        # Timing
+        self.debounce_ms: int = options.get_option(OptionKeys.BUTTON_DEBOUNCE_MS, 20)
+        self.hold_ms: int = options.get_option(OptionKeys.BUTTON_HOLD_MS, 400)
+        self.repeat_ms: int = options.get_option(OptionKeys.BUTTON_REPEAT_MS, 200)
+        self.repeat_min_ms: int = options.get_option(
+            OptionKeys.BUTTON_REPEAT_MIN_MS, 40
+        )
+        for key, name in (
+            (OptionKeys.BUTTON_DEBOUNCE_MS, "debounce_ms"),
+            (OptionKeys.BUTTON_HOLD_MS, "hold_ms"),
+            (OptionKeys.BUTTON_REPEAT_MS, "repeat_ms"),
+            (OptionKeys.BUTTON_REPEAT_MIN_MS, "repeat_min_ms"),
+        ):
+            options.subscribe(key, lambda value, name=name: setattr(self, name, value))
 
-        # Initialize buttons
-        self.button_a = Button(12)  # Button A
-        self.button_b = Button(13)  # Button B
-        self.button_x = Button(14)  # Button X
-        self.button_y = Button(15)  # Button Y
+        # Edge queue, written by the interrupt handler and read by the input
+        # task. Each side only moves its own index so no lock is needed
+        self.event_buttons = bytearray(EVENT_QUEUE_SIZE)
+        self.event_ticks = array("L", [0] * EVENT_QUEUE_SIZE)
+        self.head = 0
+        self.tail = 0
+        self.dropped_events = 0
+        self.flag = uasyncio.ThreadSafeFlag()
 
-        # Initialize button states
-        self.button_states = {
-            "B": False,
-            "Y": False,
-        }
+        # Debounced button states and the time of the first unhandled edge
+        self.pressed = [False] * len(BUTTON_PINS)
+        self.edge_ticks = [None] * len(BUTTON_PINS)
+
+        # Called on every press, returns True if the press only woke the
+        # screen and should not act, see PowerService
+        self.wake = None
+
+        # Button being held, and when it next repeats or counts as held
+        self.held = None
+        self.repeat_at = 0
+        self.repeat_interval = self.repeat_ms
+
+        # A and X act on press and repeat while held. B and Y page on a tap
+        # and jump to the top or bottom when held
+        self.press_actions = (
+            self.messages.scroll_up,
+            None,
+            self.messages.scroll_down,
+            None,
+        )
+        self.tap_actions = (None, self.messages.page_up, None, self.messages.page_down)
+        self.hold_actions = (
+            None,
+            self.messages.scroll_top,
+            None,
+            self.messages.scroll_bottom,
+        )
+
+        # Initialize buttons, wired to ground so a press pulls the pin low
+        self.pins = []
+        for index, pin_number in enumerate(BUTTON_PINS):
+            pin = Pin(pin_number, Pin.IN, Pin.PULL_UP)
+            pin.irq(
+                trigger=Pin.IRQ_FALLING | Pin.IRQ_RISING,
+                handler=lambda pin, index=index: self.queue_edge(index),
+            )
+            self.pins.append(pin)
+
+    # Interrupt handler, must not allocate
+    def queue_edge(self, index):
+        head = self.head
+        next_head = (head + 1) & (EVENT_QUEUE_SIZE - 1)
+        if next_head == self.tail:
+            self.dropped_events += 1
+            return
+        self.event_buttons[head] = index
+        self.event_ticks[head] = utime.ticks_ms()
+        self.head = next_head
+        self.flag.set()
 
     async def run(self):
         while True:
-            # Handle button presses
-            await self.handle_button_a()
-            await self.handle_button_b()
-            await self.handle_button_x()
-            await self.handle_button_y()
-
-            # Sleep for a short period to debounce button presses
-            await uasyncio.sleep(0.1)
-
-    async def handle_button_a(self):
-        if self.button_a.read():
-            await self.scroll_continuously(self.messages.scroll_up)
-        else:
-            await uasyncio.sleep(0.1)
-
-    async def handle_button_b(self):
-        if self.button_b.read():
-            if not self.button_states["B"]:
-                self.button_states["B"] = True
-                self.messages.scroll_top()
-        else:
-            self.button_states["B"] = False
-
-    async def handle_button_x(self):
-        if self.button_x.read():
-            await self.scroll_continuously(self.messages.scroll_down)
-        else:
-            await uasyncio.sleep(0.1)
-
-    async def handle_button_y(self):
-        if self.button_y.read():
-            if not self.button_states["Y"]:
-                self.button_states["Y"] = True
-                self.messages.scroll_bottom()
-        else:
-            self.button_states["Y"] = False
-
-    async def scroll_continuously(self, scroll_function):
-        # Continue scrolling as long as the button is pressed
-        while True:
-            scroll_function()
-            await uasyncio.sleep(0.2)  # Adjust the scrolling speed
-            if not self.button_a.read() and not self.button_x.read():
-                break
+            if self.held is None:
+                # Nothing held, sleep until a button changes
+                await self.flag.wait()
+            else:
+                # Sleep until the next repeat or hold, or a button changes
+                delay = utime.ticks_diff(self.repeat_at, utime.ticks_ms())
+                if delay > 0:
+                    try:
+                        await uasyncio.wait_for_ms(self.flag.wait(), delay)
+                    except uasyncio.TimeoutError:
+                        pass
+
+            if self.drain_events():
+                # Let the contacts settle before reading them
+                await uasyncio.sleep_ms(self.debounce_ms)
+                self.drain_events()
+                self.update_states()
+
+            self.repeat_held()
+
+    # Note the first edge of each button in the queue, True if there were any
+    def drain_events(self):
+        found = False
+        while self.tail != self.head:
+            index = self.event_buttons[self.tail]
+            if self.edge_ticks[index] is None:
+                self.edge_ticks[index] = self.event_ticks[self.tail]
+            self.tail = (self.tail + 1) & (EVENT_QUEUE_SIZE - 1)
+            found = True
+        return found
+
+    # Compare the settled pin levels with the debounced states
+    def update_states(self):
+        for index, pin in enumerate(self.pins):
+            edge_tick = self.edge_ticks[index]
+            if edge_tick is None:
+                continue
+            self.edge_ticks[index] = None
+
+            pressed = not pin.value()
+            if pressed == self.pressed[index]:
+                continue  # Bounce or a tap shorter than the debounce time
+            self.pressed[index] = pressed
+
+            if pressed and self.wake and self.wake():
+                continue
+            if pressed:
+                self.handle_press(index)
+            else:
+                self.handle_release(index)
+            self.metrics.time(
+                MetricKeys.INPUT_LATENCY_MS,
+                utime.ticks_diff(utime.ticks_ms(), edge_tick),
+            )
+
+    def handle_press(self, index):
+        # B and Y pressed together toggle the stats screen
+        if (index == BUTTON_B and self.pressed[BUTTON_Y]) or (
+            index == BUTTON_Y and self.pressed[BUTTON_B]
+        ):
+            self.held = None
+            self.messages.toggle_stats()
+            return
+
+        self.held = index
+        self.repeat_at = utime.ticks_add(utime.ticks_ms(), self.hold_ms)
+        self.repeat_interval = self.repeat_ms
+        if self.press_actions[index]:
+            self.press_actions[index]()
+
+    def handle_release(self, index):
+        if index != self.held:
+            return
+        self.held = None
+
+        # Released before it counted as held
+        if self.tap_actions[index]:
+            self.tap_actions[index]()
+
+    def repeat_held(self):
+        index = self.held
+        if index is None:
+            return
+        if self.pins[index].value():
+            # Released, the release edge is still on its way
+            self.pressed[index] = False
+            self.handle_release(index)
+            return
+        if utime.ticks_diff(utime.ticks_ms(), self.repeat_at) < 0:
+            return
+
+        if self.hold_actions[index]:
+            self.held = None
+            self.hold_actions[index]()
+            return
+
+        # Scroll buttons repeat while held, faster the longer they are held
+        self.press_actions[index]()
+        self.repeat_at = utime.ticks_add(utime.ticks_ms(), self.repeat_interval)
+        self.repeat_interval = max(self.repeat_min_ms, self.repeat_interval * 3 // 4)
 
 
 # Testing
 if __name__ == "__main__":
-    from services.options_service import OptionsDisplayTypes, OptionsService, OptionKeys
 
     async def main():
         options = OptionsService()
-        display_type: OptionsDisplayTypes = options.get_option(OptionKeys.DISPLAY_TYPE)
 
-        messages = MessagesService(display_type)
-        button_service = ButtonService(messages)
+        messages = MessagesService(options)
+        button_service = ButtonService(messages, options)
+
+        # Start the render task
+        uasyncio.create_task(messages.run())
 
         # Start the button service
         uasyncio.create_task(button_service.run())
@@ -101,7 +238,6 @@ if __name__ == "__main__":
         await messages.display("Success (green) message.", color=messages.GREEN)
         await messages.display("Error (red) message!", color=messages.RED)
         await messages.display("Normal (gray) message.")
-        await messages.display("Normal (gray) message, no timestamp.", timestamp=False)
 
         # Test an extra long string that has no spaces
         await messages.display(
@@ -120,6 +256,7 @@ if __name__ == "__main__":
         # Keep the event loop running indefinitely to continue processing
         # button inputs
         while True:
-            await uasyncio.sleep(1)
+            await uasyncio.sleep(10)
+            print(f"Input latency: {messages.metrics.snapshot()['input_latency_ms']}ms")
 
     uasyncio.run(main())
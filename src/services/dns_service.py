@@ -0,0 +1,232 @@
+# =============================================================================
+#  Project: Pico Portal
+#  License: CC-BY-NC-4.0
+#  Repository: https://github.com/CodyTolene/Pico-Portal
+#  Description: A catch-all DNS responder for the Pico Portal. Every A query
+#  is answered with the portal's IP address, other query types (AAAA,
+#  HTTPS/SVCB and so on) get an immediate empty answer so clients do not wait
+#  for a timeout. Answers are encoded once per question and cached, a repeat
+#  query only has its transaction ID patched in. Clients sending more
+#  queries than their rate limit allows are refused.
+# =============================================================================
+
+import sys
+import uasyncio  # type: ignore
+import usocket  # type: ignore
+
+# Local packages
+from services.metrics_service import MetricKeys, MetricsService
+from services.rate_limit_service import RateLimitService
+
+# Ensure packages can be imported
+sys.path.append("../modules")
+sys.path.append("../services")
+
+# Largest DNS message over UDP without EDNS
+MAX_PACKET_SIZE = 512
+
+# Encoded answers kept, one per distinct question, and while memory is low
+CACHE_SIZE = 32
+CACHE_SIZE_TRIMMED = 4
+
+# Packets read per wake up before other tasks get a turn
+BATCH_SIZE = 16
+
+# Time to live of the answers in seconds
+TTL = 60
+
+# Query types
+TYPE_A = 1
+TYPE_AAAA = 28
+TYPE_SVCB = 64
+TYPE_HTTPS = 65
+
+# Header flags of an answer, a response with recursion available
+FLAGS_RESPONSE = b"\x81\x80"
+FLAGS_NOT_IMPLEMENTED = b"\x81\x84"
+FLAGS_REFUSED = b"\x81\x85"
+
+
+class DnsService:
+    def __init__(
+        self,
+        ip_address,
+        port=53,
+        metrics: MetricsService = None,
+        rate_limit: RateLimitService = None,
+    ):
+        # Dependencies
+        self.metrics = metrics or MetricsService()
+        self.rate_limit = rate_limit
+
+        # Properties
+        self.ip_address = ip_address
+        self.port = port
+        self.socket = None
+
+        # Answer record for A queries, the name is a pointer to the question
+        self.a_record = b"".join(
+            [
+                b"\xc0\x0c",  # Pointer to the name at byte 12
+                b"\x00\x01\x00\x01",  # Type A, class IN
+                TTL.to_bytes(4, "big"),
+                b"\x00\x04",  # Address length
+                bytes([int(part) for part in ip_address.split(".")]),
+            ]
+        )
+
+        # Question section (name, type and class) mapped to the encoded answer
+        # without its transaction ID
+        self.cache = {}
+        self.cache_size = CACHE_SIZE
+
+        # Answers are assembled here, no allocation per packet
+        self.response = bytearray(MAX_PACKET_SIZE)
+
+    def start(self):
+        self.socket = usocket.socket(usocket.AF_INET, usocket.SOCK_DGRAM)
+        self.socket.setblocking(False)
+        self.socket.setsockopt(usocket.SOL_SOCKET, usocket.SO_REUSEADDR, 1)
+        address = usocket.getaddrinfo(self.ip_address, self.port, 0, usocket.SOCK_DGRAM)
+        self.socket.bind(address[0][-1])
+        uasyncio.create_task(self.run())
+
+    # Wait for the socket to be readable, then answer every queued packet
+    async def run(self):
+        while True:
+            yield uasyncio.core._io_queue.queue_read(self.socket)
+            for _ in range(BATCH_SIZE):
+                try:
+                    request, client = self.socket.recvfrom(MAX_PACKET_SIZE)
+                except OSError:
+                    break  # Nothing left to read
+                try:
+                    length = self.answer(request, client)
+                    if length:
+                        self.socket.sendto(memoryview(self.response)[:length], client)
+                except Exception as e:
+                    self.metrics.inc(MetricKeys.DNS_DROPPED)
+                    print(f"DNS error: {e}")
+
+    # Write the answer to a request into the response buffer, returns its
+    # length or 0 to ignore the request. Clients over their query rate are
+    # refused
+    def answer(self, request, client=None):
+        metrics = self.metrics
+        metrics.inc(MetricKeys.DNS_QUERIES)
+
+        question_end = self.question_end(request)
+        if question_end < 0:
+            metrics.inc(MetricKeys.DNS_DROPPED)
+            return 0
+
+        query_type = (request[question_end - 4] << 8) | request[question_end - 3]
+        if query_type == TYPE_A:
+            metrics.inc(MetricKeys.DNS_A)
+        elif query_type == TYPE_AAAA:
+            metrics.inc(MetricKeys.DNS_AAAA)
+        elif query_type == TYPE_HTTPS or query_type == TYPE_SVCB:
+            metrics.inc(MetricKeys.DNS_HTTPS)
+        else:
+            metrics.inc(MetricKeys.DNS_OTHER)
+
+        if self.rate_limit and client and not self.rate_limit.allow(client[0]):
+            return self.empty_answer(request, question_end, FLAGS_REFUSED)
+        if (request[2] >> 3) & 0x0F:
+            # Only standard queries are answered, never cached
+            return self.empty_answer(request, question_end, FLAGS_NOT_IMPLEMENTED)
+
+        key = request[12:question_end]
+        cached = self.cache.get(key)
+        if cached is None:
+            cached = self.encode(key)
+            if len(self.cache) >= self.cache_size:
+                self.cache.popitem()
+            self.cache[key] = cached
+        else:
+            metrics.inc(MetricKeys.DNS_CACHE_HITS)
+
+        # Patch the transaction ID into the cached answer
+        length = len(cached) + 2
+        response = self.response
+        response[0] = request[0]
+        response[1] = request[1]
+        response[2:length] = cached
+        return length
+
+    # Write an answer without records straight into the response buffer,
+    # byte by byte so a flood of refused queries allocates nothing
+    def empty_answer(self, request, question_end, flags):
+        response = self.response
+        response[0] = request[0]
+        response[1] = request[1]
+        response[2] = flags[0]
+        response[3] = flags[1]
+        for position in range(4, 12):
+            response[position] = 0
+        response[5] = 1  # 1 question, no answers
+        for position in range(12, question_end):
+            response[position] = request[position]
+        return question_end
+
+    # Empty the answer cache and keep it small, while memory is low
+    def trim_cache(self):
+        self.cache.clear()
+        self.cache_size = CACHE_SIZE_TRIMMED
+
+    def restore_cache(self):
+        self.cache_size = CACHE_SIZE
+
+    # End of the single question in a standard query, -1 if the request is
+    # not one
+    def question_end(self, request):
+        length = len(request)
+        if length < 17 or request[2] & 0x80:
+            return -1  # Too short or a response
+        if request[4] or request[5] != 1:
+            return -1  # Not exactly one question
+
+        # Labels up to the root label, then the type and class
+        position = 12
+        while position < length:
+            label = request[position]
+            if label == 0:
+                end = position + 5
+                return end if end <= length else -1
+            if label & 0xC0:
+                return -1  # No compression in a question
+            position += label + 1
+        return -1
+
+    # Encode the answer to a question, without the transaction ID
+    def encode(self, question):
+        query_type = (question[-4] << 8) | question[-3]
+        if query_type == TYPE_A:
+            # 1 question, 1 answer
+            return b"".join(
+                [
+                    FLAGS_RESPONSE,
+                    b"\x00\x01\x00\x01\x00\x00\x00\x00",
+                    question,
+                    self.a_record,
+                ]
+            )
+
+        # No records of any other type, an empty answer
+        return FLAGS_RESPONSE + b"\x00\x01\x00\x00\x00\x00\x00\x00" + question
+
+
+# Testing
+if __name__ == "__main__":
+
+    async def main():
+        metrics = MetricsService()
+        dns = DnsService("127.0.0.1", 5353, metrics)
+        dns.start()
+        print("DNS responder on 127.0.0.1:5353")
+
+        while True:
+            await uasyncio.sleep(10)
+            print(metrics.snapshot())
+
+    uasyncio.run(main())
@@ -0,0 +1,278 @@
+# =============================================================================
+#  Project: Pico Portal
+#  License: CC-BY-NC-4.0
+#  Repository: https://github.com/CodyTolene/Pico-Portal
+#  Description: A service for the LEDs of the Pico Portal, the RGB LED on the
+#  Pico Display and the onboard LED of the Pico W. One task plays the effects
+#  of both (steady, fade, pulse and blink patterns) and sleeps until the next
+#  change. Brightness and gamma correction come from lookup tables built when
+#  the brightness option changes, so updates only use integer math.
+# =============================================================================
+
+import math
+import sys
+import uasyncio  # type: ignore
+import utime  # type: ignore
+from machine import Pin  # type: ignore
+from pimoroni import RGBLED  # type: ignore
+
+# Local packages
+from services.metrics_service import MetricKeys, MetricsService
+from services.options_service import OptionKeys, OptionsService
+
+# Ensure packages can be imported
+sys.path.append("../modules")
+sys.path.append("../services")
+
+COLORS = {
+    "RED": (255, 0, 0),
+    "GREEN": (0, 255, 0),
+    "BLUE": (0, 0, 255),
+    "YELLOW": (255, 255, 0),
+    "CYAN": (0, 255, 255),
+    "MAGENTA": (255, 0, 255),
+    "WHITE": (255, 255, 255),
+    "OFF": (0, 0, 0),
+}
+
+# Effects
+STEADY = 0
+FADE = 1
+PULSE = 2
+BLINK = 3
+
+# Interval between the steps of a fade or pulse
+FRAME_MS = 20
+
+# Default effect timings
+FADE_MS = 500
+PULSE_MS = 2000
+
+# Status code blinks, the code is the number of blinks before the pause
+STATUS_ON_MS = 150
+STATUS_OFF_MS = 250
+STATUS_PAUSE_MS = 1500
+
+# Onboard LED blink while the portal runs
+HEARTBEAT_PATTERN = (3000, 3000)
+
+# Perceived (linear) level to PWM level, so equal steps look equal
+GAMMA = 2.2
+GAMMA_TABLE = bytes(round(255 * (i / 255) ** GAMMA) for i in range(256))
+
+# Levels of one pulse, rising from off to full and back
+PULSE_STEPS = 64
+PULSE_TABLE = bytes(
+    round(127.5 - 127.5 * math.cos(2 * math.pi * i / PULSE_STEPS))
+    for i in range(PULSE_STEPS)
+)
+
+
+class LedEffect:
+    def __init__(self, kind, color, duration=0, pattern=None, start_color=None):
+        self.kind = kind
+        self.color = color
+        self.duration = duration
+        self.pattern = pattern
+        self.start_color = start_color
+        self.started_at = utime.ticks_ms()
+
+
+class LedService:
+    def __init__(self, options: OptionsService, metrics: MetricsService = None):
+        # Dependencies
+        self.metrics = metrics or MetricsService()
+
+        # Wakes the task when an effect or the brightness changes
+        self.changed = uasyncio.Event()
+
+        # Brightness lookup table, a color channel (0 - 255) to its PWM level
+        # at the brightness option, gamma corrected
+        self.table = bytearray(256)
+        self.set_brightness(options.get_option(OptionKeys.LED_BRIGHTNESS, 0.25))
+        options.subscribe(OptionKeys.LED_BRIGHTNESS, self.set_brightness)
+
+        # Set up LEDs
+        self.rgb_led = RGBLED(6, 7, 8)  # Pico display pins
+        self.onboard_led = Pin("LED", Pin.OUT)
+
+        # Current effects, and what was last written to each LED
+        self.rgb = LedEffect(STEADY, COLORS["OFF"])
+        self.onboard = LedEffect(STEADY, COLORS["OFF"])
+        self.current_color = COLORS["OFF"]
+        self.rgb_written = -1
+        self.onboard_written = -1
+
+    # Build the brightness table, the only place the brightness is scaled
+    def set_brightness(self, brightness: float):
+        scale = int(brightness * 255)
+        for level in range(256):
+            self.table[level] = GAMMA_TABLE[level * scale // 255]
+        self.rgb_written = -1
+        self.changed.set()
+
+    def lookup(self, color: str):
+        if color not in COLORS:
+            print(
+                f"Invalid color: {color}. Available colors are: {', '.join(COLORS.keys())}"
+            )
+            return None
+        return COLORS[color]
+
+    def play(self, effect: LedEffect):
+        self.rgb = effect
+        self.changed.set()
+
+    # Set the color of the RGB LED
+    def set_color(self, color: str):
+        rgb = self.lookup(color)
+        if rgb:
+            self.play(LedEffect(STEADY, rgb))
+
+    # Fade the RGB LED from its current color to another
+    def fade(self, color: str, duration_ms=FADE_MS):
+        rgb = self.lookup(color)
+        if rgb:
+            self.play(LedEffect(FADE, rgb, duration_ms, start_color=self.current_color))
+
+    # Pulse the RGB LED in a color, one breath per period
+    def pulse(self, color: str, period_ms=PULSE_MS):
+        rgb = self.lookup(color)
+        if rgb:
+            self.play(LedEffect(PULSE, rgb, period_ms))
+
+    # Blink the RGB LED in a color, pattern holds the on and off times in
+    # turn, starting with on, and repeats
+    def blink(self, color: str, pattern):
+        rgb = self.lookup(color)
+        if rgb:
+            self.play(LedEffect(BLINK, rgb, sum(pattern), pattern))
+
+    # Blink a status code, code blinks then a pause
+    def status(self, color: str, code: int):
+        pattern = (STATUS_ON_MS, STATUS_OFF_MS) * (code - 1)
+        self.blink(color, pattern + (STATUS_ON_MS, STATUS_PAUSE_MS))
+
+    # Turn the onboard LED on or off, or blink it in a pattern as above
+    def set_onboard(self, on: bool):
+        self.onboard = LedEffect(STEADY, COLORS["WHITE" if on else "OFF"])
+        self.changed.set()
+
+    def blink_onboard(self, pattern):
+        self.onboard = LedEffect(BLINK, COLORS["WHITE"], sum(pattern), pattern)
+        self.changed.set()
+
+    # Play the effects, sleeping until the next change
+    async def run(self):
+        while True:
+            self.changed.clear()
+            now = utime.ticks_ms()
+            rgb_ms = self.update_rgb(now)
+            onboard_ms = self.update_onboard(now)
+
+            if rgb_ms is None:
+                delay = onboard_ms
+            elif onboard_ms is None:
+                delay = rgb_ms
+            else:
+                delay = min(rgb_ms, onboard_ms)
+
+            if delay is None:
+                await self.changed.wait()
+                continue
+            try:
+                await uasyncio.wait_for_ms(self.changed.wait(), delay)
+            except uasyncio.TimeoutError:
+                self.metrics.inc(MetricKeys.WAKEUPS)
+
+    # Write the RGB effect's color at this time, returns the milliseconds
+    # until it next changes, None if it does not
+    def update_rgb(self, now):
+        effect = self.rgb
+        r, g, b = effect.color
+        elapsed = self.elapsed(effect, now)
+        delay = None
+
+        if effect.kind == FADE and elapsed >= effect.duration:
+            effect.kind = STEADY  # Done, stays on the new color
+        elif effect.kind == FADE:
+            r0, g0, b0 = effect.start_color
+            r = r0 + (r - r0) * elapsed // effect.duration
+            g = g0 + (g - g0) * elapsed // effect.duration
+            b = b0 + (b - b0) * elapsed // effect.duration
+            delay = FRAME_MS
+        elif effect.kind == PULSE:
+            level = PULSE_TABLE[elapsed * PULSE_STEPS // effect.duration]
+            r = r * level // 255
+            g = g * level // 255
+            b = b * level // 255
+            delay = max(FRAME_MS, effect.duration // PULSE_STEPS)
+        elif effect.kind == BLINK:
+            on, delay = self.pattern_at(effect.pattern, elapsed)
+            if not on:
+                r = g = b = 0
+
+        # Only write when the PWM levels change
+        table = self.table
+        written = table[r] << 16 | table[g] << 8 | table[b]
+        if written != self.rgb_written:
+            self.rgb_written = written
+            self.current_color = (r, g, b)
+            self.rgb_led.set_rgb(table[r], table[g], table[b])
+        return delay
+
+    # The onboard LED is only on or off, each write is a message to the
+    # wireless chip
+    def update_onboard(self, now):
+        effect = self.onboard
+        on = effect.color != COLORS["OFF"]
+        delay = None
+        if effect.kind == BLINK:
+            on, delay = self.pattern_at(effect.pattern, self.elapsed(effect, now))
+
+        if on != self.onboard_written:
+            self.onboard_written = on
+            self.onboard_led.value(on)
+        return delay
+
+    # Time into the effect, repeating effects are kept within one period so
+    # the tick difference never overflows
+    def elapsed(self, effect, now):
+        elapsed = utime.ticks_diff(now, effect.started_at)
+        if effect.kind != FADE and effect.duration and elapsed >= effect.duration:
+            skipped = elapsed - elapsed % effect.duration
+            effect.started_at = utime.ticks_add(effect.started_at, skipped)
+            elapsed -= skipped
+        return elapsed
+
+    # Whether a blink pattern is on at this time, and the time to the next
+    # edge
+    def pattern_at(self, pattern, elapsed):
+        on = True
+        for duration in pattern:
+            if elapsed < duration:
+                return on, duration - elapsed
+            elapsed -= duration
+            on = not on
+        return on, 0
+
+
+# Testing
+if __name__ == "__main__":
+
+    async def main():
+        options = OptionsService()
+        leds = LedService(options)
+        uasyncio.create_task(leds.run())
+
+        leds.blink_onboard(HEARTBEAT_PATTERN)
+        leds.pulse("WHITE")
+        await uasyncio.sleep(4)
+        leds.fade("GREEN")
+        await uasyncio.sleep(2)
+        leds.status("RED", 3)
+
+        while True:
+            await uasyncio.sleep(1)
+
+    uasyncio.run(main())
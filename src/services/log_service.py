@@ -0,0 +1,340 @@
+# =============================================================================
+#  Project: Pico Portal
+#  License: CC-BY-NC-4.0
+#  Repository: https://github.com/CodyTolene/Pico-Portal
+#  Description: A buffered writer for the log.bin file. Records are collected
+#  in a fixed RAM buffer and written to flash in the background when the
+#  buffer fills up, and by a scheduled job every flush interval. Every 16th
+#  record's offset goes to a small index file (log.bin.idx), so the last
+#  records can be read back at boot without reading the whole log. The log is
+#  rotated to log.bin.1, log.bin.2 and so on once it reaches the configured
+#  size. A log cut short by a power loss is repaired when it is opened.
+#  Convert it to text with host/log_to_text.py.
+# =============================================================================
+
+import os
+import struct
+import sys
+import uasyncio  # type: ignore
+import utime  # type: ignore
+
+# Local packages
+from services.metrics_service import MetricKeys, MetricsService
+
+# Ensure packages can be imported
+sys.path.append("../modules")
+sys.path.append("../services")
+
+# Size of the RAM buffer and the fill level that triggers a background flush
+BUFFER_SIZE = 1024
+FLUSH_THRESHOLD = 768
+
+# Flush interval while saving power, fewer and larger writes
+FLUSH_INTERVAL_SAVE_MS = 30000
+
+# Each record is a little endian 16-bit header, the text length in the low
+# 12 bits and the palette color index in the high 4, then the UTF-8 text
+HEADER_SIZE = 2
+MAX_TEXT_BYTES = 0x0FFF
+MAX_COLOR = 0x0F
+
+# One index entry, a 32-bit little endian record offset, every this many
+# records
+INDEX_EVERY = 16
+INDEX_ENTRY_SIZE = 4
+INDEX_BUFFER_SIZE = (BUFFER_SIZE // HEADER_SIZE // INDEX_EVERY + 1) * INDEX_ENTRY_SIZE
+
+
+# Index file of a log file
+def index_path(file_path):
+    return f"{file_path}.idx"
+
+
+# Size of a file, 0 if it does not exist
+def file_size(file_path):
+    try:
+        return os.stat(file_path)[6]
+    except OSError:
+        return 0
+
+
+# Read the records of a log file from a record offset to the end, keeps the
+# last keep records as (text, color) pairs. Returns them, the number of
+# records read and the offset after the last complete one
+def read_records(file_path, offset=0, keep=0):
+    records = []
+    count = 0
+    try:
+        with open(file_path, "rb") as log_file:
+            log_file.seek(offset)
+            while True:
+                header = log_file.read(HEADER_SIZE)
+                if len(header) < HEADER_SIZE:
+                    break
+                length = (header[0] | header[1] << 8) & MAX_TEXT_BYTES
+                data = log_file.read(length)
+                if len(data) < length:
+                    break  # Cut short by a power loss
+                count += 1
+                offset += HEADER_SIZE + length
+                if keep:
+                    records.append((data.decode(), header[1] >> 4))
+                    if len(records) > keep:
+                        records.pop(0)
+    except OSError:
+        pass
+    return records, count, offset
+
+
+# Offset of the index entry count entries from the end, 0 without an index
+def indexed_offset(file_path, count):
+    try:
+        with open(index_path(file_path), "rb") as index_file:
+            size = index_file.seek(0, 2)
+            position = max(0, size // INDEX_ENTRY_SIZE - count) * INDEX_ENTRY_SIZE
+            index_file.seek(position)
+            entry = index_file.read(INDEX_ENTRY_SIZE)
+    except OSError:
+        return 0
+    if len(entry) < INDEX_ENTRY_SIZE:
+        return 0
+    return struct.unpack("<I", entry)[0]
+
+
+class LogService:
+    def __init__(
+        self,
+        file_path="log.bin",
+        max_size=16384,
+        rotate_count=3,
+        flush_interval_ms=5000,
+        metrics: MetricsService = None,
+    ):
+        # Dependencies
+        self.metrics = metrics or MetricsService()
+
+        # Properties
+        self.file_path = file_path
+        self.max_size = max_size
+        self.rotate_count = rotate_count
+        self.flush_interval_ms = flush_interval_ms
+
+        # Record buffer, and the index entries of the records in it
+        self.buffer = bytearray(BUFFER_SIZE)
+        self.length = 0
+        self.index_buffer = bytearray(INDEX_BUFFER_SIZE)
+        self.index_length = 0
+        self.flush_event = uasyncio.Event()
+
+        # Counters
+        self.bytes_written = 0
+        self.flush_count = 0
+        self.dropped_bytes = 0
+
+        # Size of the log file, and records written since the last indexed
+        # one. Continues from the last index entry of an existing log
+        self.file_size = 0
+        self.since_index = 0
+        self.open_log()
+
+    # Continue an existing log. A log cut short by a power loss (a partial
+    # record at the end, a partial index entry, or an index left over from
+    # an interrupted rotation) is repaired first, new records would not line
+    # up with the index otherwise
+    def open_log(self):
+        size = file_size(self.file_path)
+        index_size = file_size(index_path(self.file_path))
+        offset = indexed_offset(self.file_path, 1)
+        if offset <= size and index_size % INDEX_ENTRY_SIZE == 0:
+            _, self.since_index, self.file_size = read_records(self.file_path, offset)
+            if self.file_size == size:
+                return
+
+        print(f"Repairing {self.file_path}, it was cut short")
+        try:
+            self.repair()
+        except OSError as e:
+            # Start over, the damaged log is rotated out
+            print(f"Failed to repair {self.file_path}: {e}")
+            self.rotate()
+
+    # Copy the complete records to a new log and index, then rename them
+    # over the damaged ones. MicroPython files cannot be truncated
+    def repair(self):
+        self.file_size = 0
+        self.since_index = 0
+        if not file_size(self.file_path):
+            # Only an index left over from a rotation
+            os.remove(index_path(self.file_path))
+            return
+
+        temp_path = f"{self.file_path}.tmp"
+        count = 0
+        with open(self.file_path, "rb") as source, open(
+            temp_path, "wb"
+        ) as log_file, open(index_path(temp_path), "wb") as index_file:
+            while True:
+                header = source.read(HEADER_SIZE)
+                if len(header) < HEADER_SIZE:
+                    break
+                length = (header[0] | header[1] << 8) & MAX_TEXT_BYTES
+                data = source.read(length)
+                if len(data) < length:
+                    break
+                if count % INDEX_EVERY == 0:
+                    index_file.write(struct.pack("<I", self.file_size))
+                    self.since_index = 0
+                log_file.write(header)
+                log_file.write(data)
+                count += 1
+                self.since_index += 1
+                self.file_size += HEADER_SIZE + length
+        os.rename(temp_path, self.file_path)
+        os.rename(index_path(temp_path), index_path(self.file_path))
+
+    # Add a record to the buffer, flushing right away if it does not fit.
+    # color is the message's palette index
+    def write(self, message, color=1):
+        data = message.encode()
+
+        # Records larger than the whole buffer are clipped, on a UTF-8
+        # character boundary
+        limit = min(MAX_TEXT_BYTES, BUFFER_SIZE - HEADER_SIZE)
+        if len(data) > limit:
+            while limit and (data[limit] & 0xC0) == 0x80:
+                limit -= 1
+            self.dropped_bytes += len(data) - limit
+            data = data[:limit]
+
+        if self.length + HEADER_SIZE + len(data) > BUFFER_SIZE:
+            self.flush()
+
+        if self.since_index % INDEX_EVERY == 0:
+            struct.pack_into(
+                "<I",
+                self.index_buffer,
+                self.index_length,
+                self.file_size + self.length,
+            )
+            self.index_length += INDEX_ENTRY_SIZE
+            self.since_index = 0
+        self.since_index += 1
+
+        # Colors added at runtime are logged as gray
+        if color > MAX_COLOR:
+            color = 1
+        header = len(data) | color << 12
+        start = self.length + HEADER_SIZE
+        end = start + len(data)
+        self.buffer[self.length] = header & 0xFF
+        self.buffer[self.length + 1] = header >> 8
+        self.buffer[start:end] = data
+        self.length = end
+
+        if self.length >= FLUSH_THRESHOLD:
+            self.flush_event.set()
+
+    # Background task, flushes once the buffer fills up
+    async def run(self):
+        while True:
+            await self.flush_event.wait()
+            self.flush_event.clear()
+            self.flush()
+
+    # Write the buffer to flash and rotate the log if it is too large
+    def flush(self):
+        if not self.length:
+            return
+
+        start = utime.ticks_ms()
+        try:
+            with open(self.file_path, "ab") as log_file:
+                log_file.write(memoryview(self.buffer)[: self.length])
+            self.file_size += self.length
+            if self.index_length:
+                with open(index_path(self.file_path), "ab") as index_file:
+                    index_file.write(memoryview(self.index_buffer)[: self.index_length])
+            self.bytes_written += self.length
+            self.metrics.inc(MetricKeys.LOG_BYTES_FLUSHED, self.length)
+            if self.max_size and self.file_size >= self.max_size:
+                self.rotate()
+        except OSError as e:
+            self.dropped_bytes += self.length
+            print(f"Failed to log message: {e}")
+        self.length = 0
+        self.index_length = 0
+
+        self.flush_count += 1
+        self.metrics.inc(MetricKeys.LOG_FLUSHES)
+        self.metrics.time(
+            MetricKeys.LOG_FLUSH_MS, utime.ticks_diff(utime.ticks_ms(), start)
+        )
+
+    # Shift log.bin to log.bin.1, log.bin.1 to log.bin.2 and so on, each with
+    # its index
+    def rotate(self):
+        for number in range(self.rotate_count, 0, -1):
+            source = self.file_path if number == 1 else f"{self.file_path}.{number - 1}"
+            target = f"{self.file_path}.{number}"
+            for source_path, target_path in (
+                (source, target),
+                (index_path(source), index_path(target)),
+            ):
+                try:
+                    if number == self.rotate_count:
+                        os.remove(target_path)
+                except OSError:
+                    pass
+                try:
+                    os.rename(source_path, target_path)
+                except OSError:
+                    pass
+
+        # Without rotated copies the log simply starts over
+        if not self.rotate_count:
+            for path in (self.file_path, index_path(self.file_path)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+        self.file_size = 0
+        self.since_index = 0
+
+    # The last count records as (text, color) pairs, oldest first. Reads
+    # from the index entry just before them, and from the previous log file
+    # when the current one was rotated recently
+    def tail(self, count):
+        records = []
+        paths = [self.file_path]
+        if self.rotate_count:
+            paths.append(f"{self.file_path}.1")
+
+        for path in paths:
+            needed = count - len(records)
+            if needed <= 0:
+                break
+            offset = indexed_offset(path, needed // INDEX_EVERY + 2)
+            older, _, _ = read_records(path, offset, needed)
+            records = older + records
+        return records
+
+
+# Testing
+if __name__ == "__main__":
+    log = LogService(file_path="test_log.bin", max_size=2048, rotate_count=1)
+    for i in range(200):
+        log.write(f"Message {i + 1}: Lorem ipsum dolor sit amet", color=i % 5)
+    log.flush()
+
+    start = utime.ticks_us()
+    records = log.tail(50)
+    elapsed = utime.ticks_diff(utime.ticks_us(), start)
+    print(f"Read {len(records)} records in {elapsed}us, last: {records[-1]}")
+
+    for path in ("test_log.bin", "test_log.bin.1"):
+        for file_path in (path, index_path(path)):
+            try:
+                os.remove(file_path)
+            except OSError:
+                pass
@@ -0,0 +1,228 @@
+# =============================================================================
+#  Project: Pico Portal
+#  License: CC-BY-NC-4.0
+#  Repository: https://github.com/CodyTolene/Pico-Portal
+#  Description: A memory manager for the Pico Portal. The free heap is sampled
+#  by a scheduled job and the garbage collector is run at quiet points (no
+#  request in flight) instead of whenever an allocation happens to fail.
+#  Below configurable free heap thresholds load is shed in stages, in the
+#  order they were registered, and each change is reported on screen.
+# =============================================================================
+
+import gc
+import sys
+import uasyncio  # type: ignore
+import utime  # type: ignore
+
+# Local packages
+from services.messages_service import MessagesService
+from services.metrics_service import MetricKeys, MetricsService
+from services.options_service import OptionKeys, OptionsService
+
+# Ensure packages can be imported
+sys.path.append("../modules")
+sys.path.append("../services")
+
+# How often the free heap is sampled, and while saving power
+SAMPLE_INTERVAL_MS = 250
+SAMPLE_INTERVAL_SAVE_MS = 1000
+
+# Collect once this much has been allocated since the last collection
+COLLECT_AFTER_BYTES = 8192
+
+# Longest a collection waits for a quiet point
+COLLECT_DEFER_MAX_MS = 2000
+
+# How often the largest free block is probed, each probe can take a few
+# collections
+PROBE_INTERVAL_MS = 30000
+
+# Steps the largest free block is probed in, as fractions of the free heap
+PROBE_STEPS = 8
+
+# A stage ends once the free heap is this far above its threshold, and it
+# has been on for this long
+HYSTERESIS_BYTES = 4096
+STAGE_MIN_MS = 5000
+
+
+class MemoryStage:
+    def __init__(self, name, threshold, enter, leave):
+        self.name = name
+        self.threshold = threshold
+        self.enter = enter
+        self.leave = leave
+        self.active = False
+        self.started_at = 0
+
+
+class MemoryService:
+    def __init__(
+        self,
+        options: OptionsService,
+        messages: MessagesService,
+        metrics: MetricsService = None,
+    ):
+        # Dependencies
+        self.options = options
+        self.messages = messages
+        self.metrics = metrics or messages.metrics
+
+        # Load shedding stages, in the order they start
+        self.stages = []
+
+        # Checks that return True while the device is busy, no collection is
+        # started then unless it has waited too long
+        self.busy_checks = []
+
+        # Heap in use after the last collection, and when it ran
+        self.alloc_after_collect = gc.mem_alloc()
+        self.collect_due_at = None
+        self.probed_at = None
+
+    # Start shedding load when the free heap drops below the option's value
+    # in bytes (0 = never). enter and leave are called without arguments
+    def shed(self, key: OptionKeys, name, enter, leave=None):
+        stage = MemoryStage(name, self.options.get_option(key, 0), enter, leave)
+        self.options.subscribe(key, lambda value: setattr(stage, "threshold", value))
+        self.stages.append(stage)
+        return stage
+
+    def add_busy_check(self, check):
+        self.busy_checks.append(check)
+
+    def busy(self):
+        for check in self.busy_checks:
+            if check():
+                return True
+        return False
+
+    # Scheduled job, samples the heap, collects at quiet points and moves
+    # between the load shedding stages
+    def sample(self):
+        values = self.metrics.values
+        collected = self.collect_if_due()
+        mem_free = gc.mem_free()
+        values[MetricKeys.MEM_FREE] = mem_free
+        if mem_free < values[MetricKeys.MEM_FREE_LOW]:
+            values[MetricKeys.MEM_FREE_LOW] = mem_free
+
+        if collected and self.probe_due():
+            self.probe_fragmentation(mem_free)
+
+        self.update_stages(mem_free)
+
+    # Collect when enough has been allocated, waiting for a quiet point
+    def collect_if_due(self):
+        if gc.mem_alloc() - self.alloc_after_collect < COLLECT_AFTER_BYTES:
+            return False
+
+        now = utime.ticks_ms()
+        if self.collect_due_at is None:
+            self.collect_due_at = now
+        waited = utime.ticks_diff(now, self.collect_due_at)
+        if self.busy() and waited < COLLECT_DEFER_MAX_MS:
+            return False
+
+        self.collect()
+        return True
+
+    def collect(self):
+        gc.collect()
+        self.alloc_after_collect = gc.mem_alloc()
+        self.collect_due_at = None
+        self.metrics.inc(MetricKeys.GC_COLLECTS)
+
+    def probe_due(self):
+        now = utime.ticks_ms()
+        if self.probed_at is None or (
+            utime.ticks_diff(now, self.probed_at) >= PROBE_INTERVAL_MS
+        ):
+            self.probed_at = now
+            return True
+        return False
+
+    # Estimate the largest free block by allocating ever smaller blocks, the
+    # share of the free heap it misses is the fragmentation
+    def probe_fragmentation(self, mem_free):
+        largest = 0
+        for step in range(PROBE_STEPS, 0, -1):
+            size = mem_free * step // PROBE_STEPS
+            try:
+                block = bytearray(size)
+            except MemoryError:
+                continue
+            del block
+            largest = size
+            break
+
+        # The probe block is garbage now
+        self.collect()
+
+        values = self.metrics.values
+        values[MetricKeys.MEM_LARGEST_FREE] = largest
+        values[MetricKeys.MEM_FRAGMENTATION_PCT] = (
+            100 - largest * 100 // mem_free if mem_free else 0
+        )
+
+    # Start the stages whose threshold the free heap is below, end the ones
+    # it has risen well above
+    def update_stages(self, mem_free):
+        now = utime.ticks_ms()
+        active = 0
+        for stage in self.stages:
+            if not stage.active and mem_free < stage.threshold:
+                stage.active = True
+                stage.started_at = now
+                self.metrics.inc(MetricKeys.MEMORY_SHEDS)
+                self.report(f"Low memory ({mem_free}B), {stage.name} started")
+                stage.enter()
+            elif stage.active and self.can_end(stage, mem_free, now):
+                stage.active = False
+                self.report(f"Memory recovered ({mem_free}B), {stage.name} ended")
+                if stage.leave:
+                    stage.leave()
+            if stage.active:
+                active += 1
+        self.metrics.set(MetricKeys.MEMORY_STAGE, active)
+
+    def can_end(self, stage, mem_free, now):
+        if mem_free < stage.threshold + HYSTERESIS_BYTES:
+            return False
+        return utime.ticks_diff(now, stage.started_at) >= STAGE_MIN_MS
+
+    def report(self, message):
+        uasyncio.create_task(self.messages.display(message, color=self.messages.RED))
+
+
+# Testing
+if __name__ == "__main__":
+    from services.scheduler_service import SchedulerService
+
+    async def main():
+        options = OptionsService()
+        messages = MessagesService(options)
+        uasyncio.create_task(messages.run())
+
+        memory = MemoryService(options, messages)
+        memory.shed(
+            OptionKeys.MEMORY_TRIM_BELOW,
+            "cache trim",
+            lambda: print("Trimming caches"),
+            lambda: print("Restoring caches"),
+        )
+        scheduler = SchedulerService(memory.metrics)
+        scheduler.every("memory", SAMPLE_INTERVAL_MS, memory.sample)
+        uasyncio.create_task(scheduler.run())
+
+        # Hold on to memory until the first stage starts, then let it go
+        blocks = []
+        while not memory.stages[0].active:
+            blocks.append(bytearray(4096))
+            await uasyncio.sleep_ms(SAMPLE_INTERVAL_MS)
+        blocks.clear()
+
+        await uasyncio.sleep(2)
+        print(memory.metrics.snapshot())
+
+    uasyncio.run(main())
@@ -4,7 +4,8 @@
 #  Repository: https://github.com/CodyTolene/Pico-Portal
 #  Description: A service for displaying messages on the Pico Portal screen,
 #  with support for timestamps, colors, and scrolling. Messages are also logged
-#  to a log.txt file and output to the console.
+#  to the log.bin file and output to the console, and the last screens of
+#  messages are restored from the log at boot.
 # =============================================================================
 
 import sys
@@ -13,15 +14,30 @@ import utime  # type: ignore
 from picographics import PicoGraphics, DISPLAY_PICO_DISPLAY, DISPLAY_PICO_DISPLAY_2  # type: ignore
 
 # Local packages
+from services.log_service import LogService
+from services.metrics_service import MetricKeys, MetricsService
 from services.options_service import OptionsDisplayTypes, OptionKeys, OptionsService
+from services.scrollback_service import ScrollbackService
 
 # Ensure packages can be imported
 sys.path.append("../modules")
 sys.path.append("../services")
 
+# Messages queued within this window are drawn together in a single frame
+FRAME_BUDGET_MS = 50
+
+# How often the stats screen is redrawn while it is shown
+STATS_REFRESH_MS = 1000
+
+# Shortest time between redraws while memory is low
+PAUSED_DWELL_MS = 2000
+
 
 class MessagesService:
-    def __init__(self, options: OptionsService):
+    def __init__(self, options: OptionsService, metrics: MetricsService = None):
+        # Dependencies
+        self.metrics = metrics or MetricsService()
+
         display_type: OptionsDisplayTypes = options.get_option(OptionKeys.DISPLAY_TYPE)
         self.enable_timestamps: bool = options.get_option(OptionKeys.ENABLE_TIMESTAMPS)
 
@@ -41,47 +57,92 @@ class MessagesService:
         self.GREEN = self.graphics.create_pen(0, 200, 0)
         self.RED = self.graphics.create_pen(255, 0, 0)
         self.WHITE = self.graphics.create_pen(255, 255, 255)
+        self.palette = [self.BLACK, self.GRAY, self.GREEN, self.RED, self.WHITE]
         self.line_height = 13
         self.margin = 10
 
-        # Define max_lines for the selected display
+        # Define max_lines and the wrap width for the selected display
         self.max_lines = (
             self.graphics.get_bounds()[1] - self.margin * 2
         ) // self.line_height
+        self.max_width = self.graphics.get_bounds()[0] - self.margin * 2
 
-        self.messages = []
-        self.scroll_position = 0
+        # Framebuffer, one-line scrolls shift its rows instead of redrawing
+        # the screen. Falls back to full redraws if it cannot be accessed
+        width, height = self.graphics.get_bounds()
+        try:
+            self.framebuffer = memoryview(self.graphics)
+            self.row_bytes = len(self.framebuffer) // height
+        except TypeError:
+            self.framebuffer = None
+            self.row_bytes = 0
+
+        # Push only the changed rows to the panel after a scroll, for display
+        # drivers that support partial updates
+        self.partial_update = options.get_option(
+            OptionKeys.DISPLAY_PARTIAL_UPDATE, False
+        ) and hasattr(self.graphics, "partial_update")
 
         # Use system font that supports lowercase and better character
         # distinction
         self.graphics.set_font("bitmap8")
 
-    def calculate_total_lines(self):
-        total_lines = 0
-        for msg, _ in self.messages:  # Process only the message text, not the color
-            wrapped_lines = self.calculate_wrapped_lines(msg)
-            total_lines += wrapped_lines
-        return total_lines
-
-    def calculate_wrapped_lines(self, message):
-        # Calculate the number of lines a message would take after wrapping
-        max_width = self.graphics.get_bounds()[0] - self.margin * 2
-        wrapped_lines = 1
-        current_line_length = 0
-
-        for word in message.split():
-            word_length = self.graphics.measure_text(word, scale=1)
-            if current_line_length + word_length <= max_width:
-                current_line_length += word_length + self.graphics.measure_text(
-                    " ", scale=1
-                )
-            else:
-                wrapped_lines += 1
-                current_line_length = word_length + self.graphics.measure_text(
-                    " ", scale=1
-                )
+        # Advance width of every character in the first 256 code points, the
+        # bitmap font measures a string as the sum of its characters so this
+        # matches measure_text without calling it while wrapping
+        self.advances = bytearray(256)
+        for code in range(256):
+            self.advances[code] = self.graphics.measure_text(chr(code), scale=1)
+
+        # Fixed-capacity scrollback, also holds the wrapped line index which
+        # is built once per message when it is appended so scrolling never has
+        # to re-wrap the scrollback
+        self.messages = ScrollbackService(
+            options.get_option(OptionKeys.SCROLLBACK_SIZE, 50),
+            options.get_option(OptionKeys.SCROLLBACK_SPILL_SIZE, 500),
+        )
+        self.scroll_position = 0
+
+        # Messages waiting to be drawn by the render task
+        self.pending = []
+        self.render_event = uasyncio.Event()
+        self.dwell_ms: int = options.get_option(OptionKeys.DISPLAY_DWELL_MS, 250)
+
+        # Show the runtime metrics in place of the messages
+        self.stats_visible = False
+
+        # Fewer redraws while memory is low, each one allocates
+        self.redraws_paused = False
+
+        # Backlight level (0.0 - 1.0), nothing is drawn while it is off
+        self.backlight = 1.0
+
+        # Buffered, rotating log.bin writer
+        self.log = LogService(
+            max_size=options.get_option(OptionKeys.LOG_MAX_SIZE, 16384),
+            rotate_count=options.get_option(OptionKeys.LOG_ROTATE_COUNT, 3),
+            metrics=self.metrics,
+        )
+        self.log_task = None
 
-        return wrapped_lines
+        # Bring back the last screens of messages from before the restart
+        self.restore_scrollback(options.get_option(OptionKeys.SCROLLBACK_RESTORE, 3))
+
+        # Apply option changes without a restart
+        options.subscribe(
+            OptionKeys.ENABLE_TIMESTAMPS,
+            lambda value: setattr(self, "enable_timestamps", value),
+        )
+        options.subscribe(
+            OptionKeys.DISPLAY_DWELL_MS, lambda value: setattr(self, "dwell_ms", value)
+        )
+        options.subscribe(
+            OptionKeys.LOG_MAX_SIZE, lambda value: setattr(self.log, "max_size", value)
+        )
+        options.subscribe(
+            OptionKeys.LOG_ROTATE_COUNT,
+            lambda value: setattr(self.log, "rotate_count", value),
+        )
 
     async def display(self, message, log=True, color=None):
         if self.enable_timestamps:
@@ -98,7 +159,7 @@ class MessagesService:
             )
             # Display timestamp and message on separate lines for the screen
             display_message = f"[{formatted_time}]\n{message}"
-            # Log timestamp and message on the same line for log.txt
+            # Log timestamp and message on the same line for the log
             log_message = f"[{formatted_time}] {message}"
         else:
             display_message = message
@@ -108,137 +169,371 @@ class MessagesService:
         if color is None:
             color = self.GRAY
 
-        # Add the display message and its color to the list of messages
-        self.messages.append((f"> {display_message}", color))
+        # Queue the display message and its color for the render task
+        self.pending.append((f"> {display_message}", color))
+        self.render_event.set()
 
-        # Calculate the total number of lines in all messages
-        total_lines = self.calculate_total_lines()
+        if log:
+            print(log_message)
+            self.log_to_file(log_message, color)
+
+    # Render task, draws queued messages in batches
+    async def run(self):
+        # Flush the log in the background alongside the render task, once
+        # even if the render task is restarted
+        if not self.log_task:
+            self.log_task = uasyncio.create_task(self.log.run())
+
+        while True:
+            if self.stats_visible and self.backlight and not self.redraws_paused:
+                # Keep the stats screen current
+                try:
+                    await uasyncio.wait_for_ms(
+                        self.render_event.wait(), STATS_REFRESH_MS
+                    )
+                except uasyncio.TimeoutError:
+                    self.metrics.inc(MetricKeys.WAKEUPS)
+            else:
+                await self.render_event.wait()
+            self.render_event.clear()
 
-        # If total lines exceed the maximum, adjust the scroll position
-        if total_lines > self.max_lines:
-            self.scroll_position = total_lines - self.max_lines
+            # Let messages arriving within the frame budget join this frame
+            await uasyncio.sleep_ms(FRAME_BUDGET_MS)
+            self.render_pending()
 
-        # Update the display
-        self.update_display(total_lines)
+            # Keep the frame on screen for at least the dwell time
+            if self.redraws_paused:
+                await uasyncio.sleep_ms(max(self.dwell_ms, PAUSED_DWELL_MS))
+            else:
+                await uasyncio.sleep_ms(self.dwell_ms)
 
-        if log:
-            print(log_message)
-            self.log_to_file(log_message)
+    # Add all queued messages to the scrollback and redraw once
+    def render_pending(self):
+        for message, color in self.pending:
+            self.append_message(message, color)
+        self.pending.clear()
 
-        await uasyncio.sleep(1)
+        # If total lines exceed the maximum, adjust the scroll position
+        if self.messages.total_lines > self.max_lines:
+            self.scroll_position = self.messages.total_lines - self.max_lines
+
+        # Update the display, messages that arrive while the screen is off
+        # are drawn when it turns back on
+        if self.backlight:
+            self.update_display()
+
+    # Wrap a message once and add it to the scrollback and line index
+    def append_message(self, message, color):
+        message = self.messages.clip(message)
+        line_count = len(self.split_message_into_lines(message))
+        self.messages.append(message, self.color_index(color), line_count)
+
+    # Palette index of a pen, stored with a message instead of the pen
+    def color_index(self, color):
+        if color not in self.palette and len(self.palette) < 256:
+            self.palette.append(color)
+        return self.palette.index(color) if color in self.palette else 1
+
+    # Add the last screens of logged messages to the scrollback, read from
+    # the end of the log through its index
+    def restore_scrollback(self, screens):
+        count = min(screens * self.max_lines, self.messages.capacity - 1)
+        if count <= 0:
+            return
+
+        start = utime.ticks_ms()
+        try:
+            records = self.log.tail(count)
+        except (OSError, ValueError) as e:
+            print(f"Failed to restore scrollback: {e}")
+            return
+        if not records:
+            return
+
+        for text, color in records:
+            pen = self.palette[color] if color < len(self.palette) else self.GRAY
+            self.append_message(f"> {text}", pen)
+        elapsed = utime.ticks_diff(utime.ticks_ms(), start)
+        self.append_message(
+            f"> Restored {len(records)} messages in {elapsed}ms", self.GRAY
+        )
+
+        if self.messages.total_lines > self.max_lines:
+            self.scroll_position = self.messages.total_lines - self.max_lines
+
+    def update_display(self):
+        start = utime.ticks_us()
 
-    def update_display(self, total_lines):
         # Clear the display
         self.graphics.set_pen(self.WHITE)
         self.graphics.clear()
 
+        if self.stats_visible:
+            self.draw_stats()
+            self.draw_frame(start)
+            return
+
         y = self.margin
-        current_line = 0
-
-        for msg, color in self.messages:
-            wrapped_lines = self.calculate_wrapped_lines(msg)
-            if current_line + wrapped_lines > self.scroll_position:
-                if msg.startswith("["):
-                    # Extract timestamp and rest of the message
-                    timestamp, rest = msg.split("\n", 1)
-                    self.graphics.set_pen(self.BLACK)
+        rows = 0
+
+        # Jump straight to the first visible message and only draw the rows
+        # that fit on screen
+        seq = self.messages.seq_at_line(self.scroll_position)
+        while seq < self.messages.next_seq and rows < self.max_lines:
+            current_line = self.messages.line_of(seq)
+            msg, color = self.messages.get(seq)
+            self.graphics.set_pen(self.palette[color])
+            # Split message into lines manually for better handling
+            for line in self.split_message_into_lines(msg):
+                if current_line >= self.scroll_position and rows < self.max_lines:
                     self.graphics.text(
-                        timestamp,
-                        self.margin,
-                        y,
-                        wordwrap=self.graphics.get_bounds()[0] - self.margin * 2,
-                        scale=1,
+                        line, self.margin, y, wordwrap=self.max_width, scale=1
                     )
-                    y += self.line_height  # Move to next line after timestamp
-                    msg = rest  # Remaining message text
-
-                self.graphics.set_pen(color)
-                # Split message into lines manually for better handling
-                lines = self.split_message_into_lines(msg)
-                for line in lines:
-                    if current_line >= self.scroll_position:
-                        self.graphics.text(
-                            line,
-                            self.margin,
-                            y,
-                            wordwrap=self.graphics.get_bounds()[0] - self.margin * 2,
-                            scale=1,
-                        )
-                        y += self.line_height
-                    current_line += 1
-
-            current_line += wrapped_lines
-
-        self.draw_scroll_bar(total_lines)
+                    y += self.line_height
+                    rows += 1
+                current_line += 1
+            seq += 1
+
+        self.draw_scroll_bar()
+        self.draw_frame(start)
+
+    # Push the frame to the screen and record the render and update times
+    def draw_frame(self, start):
+        update_start = utime.ticks_us()
         self.graphics.update()
+        end = utime.ticks_us()
+        self.metrics.time(MetricKeys.UPDATE_US, utime.ticks_diff(end, update_start))
+        self.metrics.time(MetricKeys.RENDER_US, utime.ticks_diff(end, start))
 
+    # Draw the runtime metrics, one per row
+    def draw_stats(self):
+        y = self.margin
+        self.graphics.set_pen(self.BLACK)
+        self.graphics.text("Stats", self.margin, y, scale=1)
+        self.graphics.set_pen(self.GRAY)
+        for line in self.metrics.summary_lines()[: self.max_lines - 1]:
+            y += self.line_height
+            self.graphics.text(line, self.margin, y, scale=1)
+
+    # Redraw at most every PAUSED_DWELL_MS, while memory is low
+    def pause_redraws(self):
+        self.redraws_paused = True
+
+    def resume_redraws(self):
+        self.redraws_paused = False
+        self.render_event.set()
+
+    # Dim or turn off the screen, see PowerService
+    def set_backlight(self, level):
+        was_off = not self.backlight
+        self.backlight = level
+        self.graphics.set_backlight(level)
+        if level and was_off:
+            self.render_event.set()
+
+    # Switch between the messages and the stats screen
+    def toggle_stats(self):
+        self.stats_visible = not self.stats_visible
+        self.render_event.set()
+
+    # Wrap a message at word boundaries in a single pass over the advance
+    # table, breaking words that are wider than a line and on newlines
     def split_message_into_lines(self, message):
-        max_width = self.graphics.get_bounds()[0] - self.margin * 2
+        advances = self.advances
+        max_width = self.max_width
+        space = advances[32]
         lines = []
-        current_line = ""
-
-        # Process the message character by character
-        for char in message:
-            if self.graphics.measure_text(current_line + char, scale=1) <= max_width:
-                current_line += char
+        start = 0  # Start of the current line
+        width = 0  # Width of message[start:i]
+        break_at = -1  # Last space on the current line
+        break_width = 0  # Width of message[start:break_at]
+        i = 0
+        length = len(message)
+
+        while i < length:
+            char = message[i]
+            if char == "\n":
+                lines.append(message[start:i])
+                start = i + 1
+                width = 0
+                break_at = -1
+                i += 1
+                continue
+
+            code = ord(char)
+            if code < 256:
+                advance = advances[code]
             else:
-                lines.append(current_line)
-                current_line = char
-
-        if current_line:
-            lines.append(current_line)
+                advance = self.graphics.measure_text(char, scale=1)
+
+            if width + advance > max_width and i > start:
+                if char == " ":
+                    # Break on this space and drop it
+                    lines.append(message[start:i])
+                    start = i + 1
+                    width = 0
+                    i += 1
+                elif break_at >= 0:
+                    # Break on the last space and drop it
+                    lines.append(message[start:break_at])
+                    start = break_at + 1
+                    width -= break_width + space
+                else:
+                    # No space on this line, break the word
+                    lines.append(message[start:i])
+                    start = i
+                    width = 0
+                break_at = -1
+                continue
+
+            if char == " ":
+                break_at = i
+                break_width = width
+            width += advance
+            i += 1
+
+        if start < length or not lines:
+            lines.append(message[start:])
 
         return lines
 
-    def draw_scroll_bar(self, total_lines):
+    # Position and height of the scroll bar, None if everything fits
+    def scroll_bar_rect(self):
         # Calculate the height and position of the scroll bar
+        total_lines = self.messages.total_lines
         display_height = self.graphics.get_bounds()[1]
         if total_lines <= self.max_lines:
-            return  # No need to draw a scroll bar if content fits within the screen
+            return None  # No need for a scroll bar if content fits within the screen
 
         scroll_bar_height = max(int(display_height * (self.max_lines / total_lines)), 5)
         scrollable_area_height = display_height - scroll_bar_height
         scroll_ratio = self.scroll_position / (total_lines - self.max_lines)
         scroll_bar_position = int(scrollable_area_height * scroll_ratio)
+        return scroll_bar_position, scroll_bar_height
+
+    def draw_scroll_bar(self):
+        rect = self.scroll_bar_rect()
+        if rect is None:
+            return
 
         # Draw the scroll bar
         self.graphics.set_pen(self.BLACK)
-        self.graphics.rectangle(
-            self.graphics.get_bounds()[0] - 5, scroll_bar_position, 5, scroll_bar_height
+        self.graphics.rectangle(self.graphics.get_bounds()[0] - 5, rect[0], 5, rect[1])
+
+    # Draw a single wrapped line of the scrollback
+    def draw_line(self, line, y):
+        seq = self.messages.seq_at_line(line)
+        msg, color = self.messages.get(seq)
+        lines = self.split_message_into_lines(msg)
+        self.graphics.set_pen(self.palette[color])
+        self.graphics.text(
+            lines[line - self.messages.line_of(seq)],
+            self.margin,
+            y,
+            wordwrap=self.max_width,
+            scale=1,
         )
 
+    # Scroll the screen by one line, moving the rows already drawn in the
+    # framebuffer and drawing only the line that comes into view
+    def shift_display(self, direction):
+        if self.stats_visible or self.framebuffer is None:
+            self.update_display()
+            return
+
+        start = utime.ticks_us()
+        width, height = self.graphics.get_bounds()
+        old_bar = self.scroll_bar_rect()
+
+        # Rows of the text area, less the line scrolled out of view
+        step = self.line_height * self.row_bytes
+        top = self.margin * self.row_bytes
+        size = (self.max_lines - 1) * step
+        if direction > 0:
+            # Content moves up, the new line is at the bottom
+            source = top + step
+            target = top
+            exposed = self.max_lines - 1
+        else:
+            # Content moves down, the new line is at the top
+            source = top
+            target = top + step
+            exposed = 0
+        source_end = source + size
+        target_end = target + size
+        self.framebuffer[target:target_end] = self.framebuffer[source:source_end]
+
+        # Draw the line that came into view
+        y = self.margin + exposed * self.line_height
+        self.graphics.set_pen(self.WHITE)
+        self.graphics.rectangle(0, y, width, self.line_height)
+        self.draw_line(self.scroll_position + exposed, y)
+
+        # Redraw the scroll bar column
+        self.graphics.set_pen(self.WHITE)
+        self.graphics.rectangle(width - 5, 0, 5, height)
+        self.draw_scroll_bar()
+
+        if self.partial_update:
+            # The text rows and both scroll bar positions
+            new_bar = self.scroll_bar_rect()
+            region_top = self.margin
+            region_bottom = self.margin + self.max_lines * self.line_height
+            for bar in (old_bar, new_bar):
+                if bar:
+                    region_top = min(region_top, bar[0])
+                    region_bottom = max(region_bottom, bar[0] + bar[1])
+            update_start = utime.ticks_us()
+            self.graphics.partial_update(
+                0, region_top, width, region_bottom - region_top
+            )
+            end = utime.ticks_us()
+            self.metrics.time(MetricKeys.UPDATE_US, utime.ticks_diff(end, update_start))
+            self.metrics.time(MetricKeys.RENDER_US, utime.ticks_diff(end, start))
+        else:
+            self.draw_frame(start)
+
     # Scroll up by one line
     def scroll_up(self):
         if self.scroll_position > 0:
             self.scroll_position -= 1
-            self.update_display(self.calculate_total_lines())
+            self.shift_display(-1)
 
     # Scroll down by one line
     def scroll_down(self):
-        total_lines = self.calculate_total_lines()
-        if self.scroll_position < total_lines - self.max_lines:
+        if self.scroll_position < self.messages.total_lines - self.max_lines:
             self.scroll_position += 1
-            self.update_display(total_lines)
+            self.shift_display(1)
+
+    # Scroll up by a screen, keeping one line of context
+    def page_up(self):
+        if self.scroll_position > 0:
+            self.scroll_position = max(0, self.scroll_position - self.max_lines + 1)
+            self.update_display()
+
+    # Scroll down by a screen, keeping one line of context
+    def page_down(self):
+        bottom = self.messages.total_lines - self.max_lines
+        if self.scroll_position < bottom:
+            self.scroll_position = min(
+                bottom, self.scroll_position + self.max_lines - 1
+            )
+            self.update_display()
 
     # Scroll to the top of the messages
     def scroll_top(self):
         self.scroll_position = 0
-        self.update_display(self.calculate_total_lines())
+        self.update_display()
 
     # Scroll to the bottom of the messages
     def scroll_bottom(self):
-        total_lines = self.calculate_total_lines()
-        if total_lines > self.max_lines:
-            self.scroll_position = total_lines - self.max_lines
-            self.update_display(total_lines)
+        if self.messages.total_lines > self.max_lines:
+            self.scroll_position = self.messages.total_lines - self.max_lines
+            self.update_display()
 
-    # Append a message to the log.txt file on a single line
-    def log_to_file(self, message):
-        try:
-            with open("log.txt", "a") as log_file:
-                log_file.write(message + "\n")
-        except Exception as e:
-            print(f"Failed to log message: {e}")
+    # Append a message and its color to the log
+    def log_to_file(self, message, color):
+        self.log.write(message, self.color_index(color))
 
 
 # Testing
@@ -248,6 +543,7 @@ if __name__ == "__main__":
         options = OptionsService()
 
         messages = MessagesService(options)
+        uasyncio.create_task(messages.run())
         GREEN = messages.GREEN
         RED = messages.RED
 
@@ -282,6 +578,12 @@ if __name__ == "__main__":
 
         await uasyncio.sleep(1)
 
+        # Page up and back down
+        messages.page_up()
+        await uasyncio.sleep(1)
+        messages.page_down()
+        await uasyncio.sleep(1)
+
         # Scroll to top
         messages.scroll_top()
         await uasyncio.sleep(1)
@@ -0,0 +1,269 @@
+# =============================================================================
+#  Project: Pico Portal
+#  License: CC-BY-NC-4.0
+#  Repository: https://github.com/CodyTolene/Pico-Portal
+#  Description: A registry of runtime metrics for the Pico Portal. Counters,
+#  gauges and timings live in a fixed-size array indexed by the MetricKeys
+#  constants, so recording one is a single array update that allocates
+#  nothing. Requests are also counted per route and status class. The
+#  memory service samples the free heap, the supervisor records the event
+#  loop lag.
+# =============================================================================
+
+import gc
+import sys
+import uasyncio  # type: ignore
+import utime  # type: ignore
+from array import array
+
+# Ensure packages can be imported
+sys.path.append("../modules")
+sys.path.append("../services")
+
+
+# Slots in the metrics array. A timing takes three slots, the last value, the
+# maximum and a running average
+class MetricKeys:
+    HTTP_REQUESTS = 0
+    HTTP_ERRORS = 1
+    DNS_QUERIES = 2
+    RENDER_US = 3  # 3 slots
+    UPDATE_US = 6  # 3 slots
+    LOG_BYTES_FLUSHED = 9
+    LOG_FLUSHES = 10
+    MEM_FREE = 11
+    MEM_FREE_LOW = 12
+    LOOP_LAG_MS = 13
+    LOOP_LAG_MS_MAX = 14
+    TASK_RESTARTS = 15
+    SLOW_STEPS = 16
+    INPUT_LATENCY_MS = 17  # 3 slots
+    DNS_A = 20
+    DNS_AAAA = 21
+    DNS_HTTPS = 22
+    DNS_OTHER = 23
+    DNS_CACHE_HITS = 24
+    DNS_DROPPED = 25
+    BOOT_IMPORTS_MS = 26
+    BOOT_DISPLAY_MS = 27
+    BOOT_AP_MS = 28
+    BOOT_DNS_MS = 29
+    BOOT_HTTP_MS = 30
+    BOOT_FIRST_REQUEST_MS = 31
+    HTTP_CONNECTIONS = 32
+    HTTP_CONNECTIONS_MAX = 33
+    HTTP_REJECTED = 34
+    HTTP_KEEP_ALIVE_REUSES = 35
+    MEM_LARGEST_FREE = 36
+    MEM_FRAGMENTATION_PCT = 37
+    GC_COLLECTS = 38
+    MEMORY_STAGE = 39
+    MEMORY_SHEDS = 40
+    HTTP_THROTTLED = 41
+    DNS_THROTTLED = 42
+    THROTTLED_CLIENTS = 43
+    WAKEUPS = 44
+    WAKEUPS_PER_MIN = 45
+    POWER_DRAW_UA = 46
+    BATTERY_LIFE_MIN = 47
+    LOG_FLUSH_MS = 48  # 3 slots
+
+
+# Names used in the JSON snapshot, in slot order
+METRIC_NAMES = (
+    "http_requests",
+    "http_errors",
+    "dns_queries",
+    "render_us",
+    "render_us_max",
+    "render_us_avg",
+    "update_us",
+    "update_us_max",
+    "update_us_avg",
+    "log_bytes_flushed",
+    "log_flushes",
+    "mem_free",
+    "mem_free_low",
+    "loop_lag_ms",
+    "loop_lag_ms_max",
+    "task_restarts",
+    "slow_steps",
+    "input_latency_ms",
+    "input_latency_ms_max",
+    "input_latency_ms_avg",
+    "dns_a",
+    "dns_aaaa",
+    "dns_https",
+    "dns_other",
+    "dns_cache_hits",
+    "dns_dropped",
+    "boot_imports_ms",
+    "boot_display_ms",
+    "boot_ap_ms",
+    "boot_dns_ms",
+    "boot_http_ms",
+    "boot_first_request_ms",
+    "http_connections",
+    "http_connections_max",
+    "http_rejected",
+    "http_keep_alive_reuses",
+    "mem_largest_free",
+    "mem_fragmentation_pct",
+    "gc_collects",
+    "memory_stage",
+    "memory_sheds",
+    "http_throttled",
+    "dns_throttled",
+    "throttled_clients",
+    "wakeups",
+    "wakeups_per_min",
+    "power_draw_ua",
+    "battery_life_min",
+    "log_flush_ms",
+    "log_flush_ms_max",
+    "log_flush_ms_avg",
+)
+
+# Status classes counted per route, 1xx to 5xx
+STATUS_CLASSES = ("1xx", "2xx", "3xx", "4xx", "5xx")
+
+
+class MetricsService:
+    def __init__(self):
+        self.values = array("L", [0] * len(METRIC_NAMES))
+
+        # Route path mapped to request counts by status class
+        self.routes = {}
+
+        mem_free = gc.mem_free()
+        self.values[MetricKeys.MEM_FREE] = mem_free
+        self.values[MetricKeys.MEM_FREE_LOW] = mem_free
+
+    def inc(self, key, amount=1):
+        self.values[key] += amount
+
+    def set(self, key, value):
+        self.values[key] = value
+
+    # Record when a boot phase finished, in milliseconds since power on. Only
+    # the first time counts, a restarted task does not move its phase
+    def mark(self, key):
+        if not self.values[key]:
+            self.values[key] = max(1, utime.ticks_ms())
+
+    # Record a timing, the average moves 1/8 of the way to each new value
+    def time(self, key, value):
+        values = self.values
+        values[key] = value
+        if value > values[key + 1]:
+            values[key + 1] = value
+        average = values[key + 2]
+        if average:
+            values[key + 2] = average + (value - average) // 8
+        else:
+            values[key + 2] = value
+
+    # Request counters for a route, look up once and keep the result on hot
+    # paths then count with count_request
+    def route(self, path):
+        counters = self.routes.get(path)
+        if counters is None:
+            counters = array("L", [0] * len(STATUS_CLASSES))
+            self.routes[path] = counters
+        return counters
+
+    def count_request(self, counters, status):
+        counters[min(max(status // 100, 1), 5) - 1] += 1
+        self.values[MetricKeys.HTTP_REQUESTS] += 1
+        if status >= 500:
+            self.values[MetricKeys.HTTP_ERRORS] += 1
+
+    # All metrics as a dictionary, for the JSON endpoint
+    def snapshot(self):
+        snapshot = {"uptime_ms": utime.ticks_ms()}
+        for key, name in enumerate(METRIC_NAMES):
+            snapshot[name] = self.values[key]
+        snapshot["routes"] = {
+            path: {
+                STATUS_CLASSES[i]: count for i, count in enumerate(counters) if count
+            }
+            for path, counters in self.routes.items()
+        }
+        return snapshot
+
+    # Short lines for the on-device stats screen
+    def summary_lines(self):
+        values = self.values
+        lines = [
+            f"Uptime {utime.ticks_ms() // 1000}s",
+            f"Heap {values[MetricKeys.MEM_FREE]} low {values[MetricKeys.MEM_FREE_LOW]}",
+            f"Frag {values[MetricKeys.MEM_FRAGMENTATION_PCT]}% GC {values[MetricKeys.GC_COLLECTS]} stage {values[MetricKeys.MEMORY_STAGE]}",
+            f"Loop lag {values[MetricKeys.LOOP_LAG_MS]}ms max {values[MetricKeys.LOOP_LAG_MS_MAX]}ms",
+            f"HTTP {values[MetricKeys.HTTP_REQUESTS]} errors {values[MetricKeys.HTTP_ERRORS]}",
+            f"Conns {values[MetricKeys.HTTP_CONNECTIONS]} max {values[MetricKeys.HTTP_CONNECTIONS_MAX]} busy {values[MetricKeys.HTTP_REJECTED]}",
+            f"DNS {values[MetricKeys.DNS_QUERIES]} A {values[MetricKeys.DNS_A]} AAAA {values[MetricKeys.DNS_AAAA]}",
+            f"Throttled HTTP {values[MetricKeys.HTTP_THROTTLED]} DNS {values[MetricKeys.DNS_THROTTLED]}",
+            f"Restarts {values[MetricKeys.TASK_RESTARTS]} slow {values[MetricKeys.SLOW_STEPS]}",
+            "Wakes {}/min draw {:.1f}mA life {:.1f}h".format(
+                values[MetricKeys.WAKEUPS_PER_MIN],
+                values[MetricKeys.POWER_DRAW_UA] / 1000,
+                values[MetricKeys.BATTERY_LIFE_MIN] / 60,
+            ),
+            "Render {:.1f}ms max {:.1f}ms".format(
+                values[MetricKeys.RENDER_US + 2] / 1000,
+                values[MetricKeys.RENDER_US + 1] / 1000,
+            ),
+            "Update {:.1f}ms max {:.1f}ms".format(
+                values[MetricKeys.UPDATE_US + 2] / 1000,
+                values[MetricKeys.UPDATE_US + 1] / 1000,
+            ),
+            f"Input {values[MetricKeys.INPUT_LATENCY_MS + 2]}ms max {values[MetricKeys.INPUT_LATENCY_MS + 1]}ms",
+            f"Log {values[MetricKeys.LOG_BYTES_FLUSHED]}B {values[MetricKeys.LOG_FLUSHES]} flushes",
+            f"Flush {values[MetricKeys.LOG_FLUSH_MS + 2]}ms max {values[MetricKeys.LOG_FLUSH_MS + 1]}ms",
+        ]
+        lines.extend(self.boot_lines())
+        for path, counters in self.routes.items():
+            lines.append(f"{path} {sum(counters)}")
+        return lines
+
+    # The boot timeline, phases not reached yet are left out
+    def boot_lines(self):
+        values = self.values
+        phases = []
+        for key, name in (
+            (MetricKeys.BOOT_IMPORTS_MS, "imports"),
+            (MetricKeys.BOOT_DISPLAY_MS, "display"),
+            (MetricKeys.BOOT_AP_MS, "AP"),
+            (MetricKeys.BOOT_DNS_MS, "DNS"),
+            (MetricKeys.BOOT_HTTP_MS, "HTTP"),
+            (MetricKeys.BOOT_FIRST_REQUEST_MS, "page"),
+        ):
+            if values[key]:
+                phases.append("{} {:.1f}s".format(name, values[key] / 1000))
+
+        # Two phases per line to fit the narrow display
+        lines = []
+        for start in range(0, len(phases), 2):
+            end = start + 2
+            lines.append("Boot " + " ".join(phases[start:end]))
+        return lines
+
+
+# Testing
+if __name__ == "__main__":
+
+    async def main():
+        metrics = MetricsService()
+
+        index = metrics.route("/")
+        for status in (200, 200, 304, 404, 500):
+            metrics.count_request(index, status)
+        for value in (1000, 3000, 2000):
+            metrics.time(MetricKeys.RENDER_US, value)
+
+        await uasyncio.sleep(1)
+        print(metrics.snapshot())
+        for line in metrics.summary_lines():
+            print(line)
+
+    uasyncio.run(main())
@@ -3,9 +3,28 @@
 #  License: CC-BY-NC-4.0
 #  Repository: https://github.com/CodyTolene/Pico-Portal
 #  Description: A service to handle user defined options from a JSON file.
+#  Options are checked against a schema and merged over the defaults when
+#  loaded. Changes are written in batches through a temporary file that is
+#  renamed over options.json, so a power loss never leaves a half written
+#  file, and are passed to the services that subscribed to them.
 # =============================================================================
 
 import json
+import os
+import sys
+import uasyncio  # type: ignore
+
+# Ensure packages can be imported
+sys.path.append("../modules")
+sys.path.append("../services")
+
+# Changes within this window are written to flash together
+SAVE_DELAY_MS = 1000
+
+# How often options.json is checked for edits made outside the portal, and
+# while saving power
+RELOAD_INTERVAL_MS = 5000
+RELOAD_INTERVAL_SAVE_MS = 30000
 
 
 class OptionsDisplayTypes:
@@ -20,48 +39,287 @@ class OptionKeys:
     DISPLAY_TYPE: OptionsDisplayTypes = "display_type"  # Default: DISPLAY_PICO_DISPLAY
     ENABLE_TIMESTAMPS: bool = "enable_timestamps"  # Default: false
     LED_BRIGHTNESS = "led_brightness"  # Default: 0.25 (0.0 - 1.0)
+    SCROLLBACK_SIZE: int = "scrollback_size"  # Default: 50 (messages in RAM)
+    SCROLLBACK_SPILL_SIZE: int = "scrollback_spill_size"  # Default: 500 (on flash)
+    SCROLLBACK_RESTORE: int = "scrollback_restore"  # Default: 3 (screens, 0 = off)
+    DISPLAY_DWELL_MS: int = "display_dwell_ms"  # Default: 250
+    DISPLAY_PARTIAL_UPDATE: bool = "display_partial_update"  # Default: false
+    LOG_MAX_SIZE: int = "log_max_size"  # Default: 16384 (bytes)
+    LOG_ROTATE_COUNT: int = "log_rotate_count"  # Default: 3
+    STATIC_DIR: str = "static_dir"  # Default: "www"
+    WATCHDOG_TIMEOUT_MS: int = "watchdog_timeout_ms"  # Default: 8000 (0 = off)
+    BUTTON_DEBOUNCE_MS: int = "button_debounce_ms"  # Default: 20
+    BUTTON_HOLD_MS: int = "button_hold_ms"  # Default: 400
+    BUTTON_REPEAT_MS: int = "button_repeat_ms"  # Default: 200
+    BUTTON_REPEAT_MIN_MS: int = "button_repeat_min_ms"  # Default: 40
+    HTTP_MAX_CONNECTIONS: int = "http_max_connections"  # Default: 8
+    HTTP_BACKLOG: int = "http_backlog"  # Default: 4
+    HTTP_KEEP_ALIVE_MS: int = "http_keep_alive_ms"  # Default: 2000 (0 = off)
+    HTTP_RATE_LIMIT: int = (
+        "http_rate_limit"  # Default: 10 (requests/s per client, 0 = off)
+    )
+    HTTP_RATE_BURST: int = "http_rate_burst"  # Default: 30
+    DNS_RATE_LIMIT: int = (
+        "dns_rate_limit"  # Default: 20 (queries/s per client, 0 = off)
+    )
+    DNS_RATE_BURST: int = "dns_rate_burst"  # Default: 50
+    MEMORY_TRIM_BELOW: int = "memory_trim_below"  # Default: 32768 (bytes, 0 = off)
+    MEMORY_REFUSE_BELOW: int = "memory_refuse_below"  # Default: 20480 (bytes, 0 = off)
+    MEMORY_PAUSE_BELOW: int = "memory_pause_below"  # Default: 12288 (bytes, 0 = off)
+    POWER_SAVE: bool = "power_save"  # Default: false
+    DISPLAY_DIM_AFTER_MS: int = "display_dim_after_ms"  # Default: 30000 (0 = never)
+    DISPLAY_OFF_AFTER_MS: int = "display_off_after_ms"  # Default: 120000 (0 = never)
+    BATTERY_MAH: int = "battery_mah"  # Default: 0 (mAh, 0 = no battery)
+
+
+# Type, default and allowed values of an option. Numbers are limited to the
+# minimum and maximum, strings to that length
+class Option:
+    def __init__(self, type, default, minimum=None, maximum=None, choices=None):
+        self.type = type
+        self.default = default
+        self.minimum = minimum
+        self.maximum = maximum
+        self.choices = choices
+
+
+OPTIONS_SCHEMA = {
+    OptionKeys.WIFI_SSID: Option(str, "WiFi", 1, 32),
+    OptionKeys.WIFI_PASSWORD: Option(str, "", 0, 63),
+    OptionKeys.WIFI_DOMAIN: Option(str, "setup.local", 1, 253),
+    OptionKeys.DISPLAY_TYPE: Option(
+        str,
+        OptionsDisplayTypes.DISPLAY_PICO_DISPLAY,
+        choices=(
+            OptionsDisplayTypes.DISPLAY_PICO_DISPLAY,
+            OptionsDisplayTypes.DISPLAY_PICO_DISPLAY_2,
+        ),
+    ),
+    OptionKeys.ENABLE_TIMESTAMPS: Option(bool, False),
+    OptionKeys.LED_BRIGHTNESS: Option(float, 0.25, 0.0, 1.0),
+    OptionKeys.SCROLLBACK_SIZE: Option(int, 50, 1, 1000),
+    OptionKeys.SCROLLBACK_SPILL_SIZE: Option(int, 500, 0, 10000),
+    OptionKeys.SCROLLBACK_RESTORE: Option(int, 3, 0, 100),
+    OptionKeys.DISPLAY_DWELL_MS: Option(int, 250, 0, 5000),
+    OptionKeys.DISPLAY_PARTIAL_UPDATE: Option(bool, False),
+    OptionKeys.LOG_MAX_SIZE: Option(int, 16384, 0, 1048576),
+    OptionKeys.LOG_ROTATE_COUNT: Option(int, 3, 0, 9),
+    OptionKeys.STATIC_DIR: Option(str, "www", 0, 64),
+    OptionKeys.WATCHDOG_TIMEOUT_MS: Option(int, 8000, 0, 8388),
+    OptionKeys.BUTTON_DEBOUNCE_MS: Option(int, 20, 0, 200),
+    OptionKeys.BUTTON_HOLD_MS: Option(int, 400, 50, 5000),
+    OptionKeys.BUTTON_REPEAT_MS: Option(int, 200, 10, 2000),
+    OptionKeys.BUTTON_REPEAT_MIN_MS: Option(int, 40, 10, 2000),
+    OptionKeys.HTTP_MAX_CONNECTIONS: Option(int, 8, 1, 32),
+    OptionKeys.HTTP_BACKLOG: Option(int, 4, 1, 16),
+    OptionKeys.HTTP_KEEP_ALIVE_MS: Option(int, 2000, 0, 30000),
+    OptionKeys.HTTP_RATE_LIMIT: Option(int, 10, 0, 1000),
+    OptionKeys.HTTP_RATE_BURST: Option(int, 30, 1, 1000),
+    OptionKeys.DNS_RATE_LIMIT: Option(int, 20, 0, 1000),
+    OptionKeys.DNS_RATE_BURST: Option(int, 50, 1, 1000),
+    OptionKeys.MEMORY_TRIM_BELOW: Option(int, 32768, 0, 262144),
+    OptionKeys.MEMORY_REFUSE_BELOW: Option(int, 20480, 0, 262144),
+    OptionKeys.MEMORY_PAUSE_BELOW: Option(int, 12288, 0, 262144),
+    OptionKeys.POWER_SAVE: Option(bool, False),
+    OptionKeys.DISPLAY_DIM_AFTER_MS: Option(int, 30000, 0, 3600000),
+    OptionKeys.DISPLAY_OFF_AFTER_MS: Option(int, 120000, 0, 3600000),
+    OptionKeys.BATTERY_MAH: Option(int, 0, 0, 100000),
+}
 
 
 class OptionsService:
-    def __init__(self):
-        # Properties
-        self.json_file_path = "/options.json"
+    def __init__(self, json_file_path="options.json"):
+        # Properties, without a file path the options only live in memory
+        self.json_file_path = json_file_path
+        self.temp_file_path = f"{json_file_path}.tmp"
+
+        # Option key mapped to the callbacks to run when it changes
+        self.subscribers = {}
+
+        # Unsaved changes
+        self.dirty = False
+        self.save_event = uasyncio.Event()
+
+        # Size and time of options.json when last read or written
+        self.file_stat = None
 
         # Initialization
         self.options = self.load_options()
 
+    # Defaults merged with the valid options from the file, at boot
     def load_options(self):
+        options = self.default_options()
+        if not self.json_file_path:
+            return options
+
         try:
-            with open(self.json_file_path, "r") as f:
-                data = json.load(f)
-                return data
+            data = self.read_file()
         except OSError:
-            self.save_options(self.default_options())
-            return self.default_options()
-        except ValueError:
-            self.save_options(self.default_options())
-            return self.default_options()
+            # First boot, write out the defaults to edit
+            self.save_options(options)
+            return options
+        except ValueError as e:
+            # Keep the broken file for the user to fix, start from defaults
+            print(f"Error reading {self.json_file_path}: {e}, using defaults")
+            try:
+                os.rename(self.json_file_path, f"{self.json_file_path}.bad")
+            except OSError:
+                pass
+            self.save_options(options)
+            return options
+
+        for key, value in data.items():
+            try:
+                options[key] = self.validate(key, value)
+            except ValueError as e:
+                print(f"Invalid option {key}: {e}, using the default")
+        return options
+
+    # The options in the file, raises OSError if it cannot be read and
+    # ValueError if it is not a JSON object
+    def read_file(self):
+        with open(self.json_file_path, "r") as f:
+            data = json.load(f)
+        if not isinstance(data, dict):
+            raise ValueError("not an object")
+        self.file_stat = self.stat()
+        return data
 
+    # Write through a temporary file so options.json is always complete
     def save_options(self, options):
+        if not self.json_file_path:
+            return
         try:
-            with open(self.json_file_path, "w") as f:
+            with open(self.temp_file_path, "w") as f:
                 json.dump(options, f)
+            os.rename(self.temp_file_path, self.json_file_path)
+            self.file_stat = self.stat()
         except OSError as e:
             print(f"Error writing to {self.json_file_path}: {e}")
 
     def get_option(self, key: OptionKeys, default=None):
         return self.options.get(key, default)
 
+    # Change an option, raises ValueError if the value is not allowed. The
+    # change is saved shortly after by the run task, or by flush
     def set_option(self, key: OptionKeys, value):
+        value = self.validate(key, value)
+        if self.options.get(key) == value:
+            return
         self.options[key] = value
-        self.save_options(self.options)
+        self.dirty = True
+        self.save_event.set()
+        self.notify(key, value)
+
+    # Call callback(value) whenever the option changes
+    def subscribe(self, key: OptionKeys, callback):
+        self.subscribers.setdefault(key, []).append(callback)
+
+    def notify(self, key, value):
+        for callback in self.subscribers.get(key, ()):
+            try:
+                callback(value)
+            except Exception as e:
+                print(f"Error applying option {key}: {e}")
+
+    # The value as stored, raises ValueError if it is not allowed. Options
+    # outside the schema are kept as they are
+    def validate(self, key, value):
+        option = OPTIONS_SCHEMA.get(key)
+        if option is None:
+            return value
+
+        if option.type is float and type(value) is int:
+            value = float(value)
+        if type(value) is not option.type:
+            raise ValueError(f"expected {option.type.__name__}")
+
+        if option.choices is not None and value not in option.choices:
+            raise ValueError(f"expected one of {', '.join(option.choices)}")
+
+        size = len(value) if option.type is str else value
+        if option.minimum is not None and size < option.minimum:
+            raise ValueError(f"below the minimum of {option.minimum}")
+        if option.maximum is not None and size > option.maximum:
+            raise ValueError(f"above the maximum of {option.maximum}")
+        return value
+
+    # Background task, saves batched changes
+    async def run(self):
+        while True:
+            await self.save_event.wait()
+            self.save_event.clear()
+            await uasyncio.sleep_ms(SAVE_DELAY_MS)
+            self.flush()
+
+    # Scheduled job, picks up edits made to options.json outside the portal
+    def check_file(self):
+        if not self.dirty and self.stat() != self.file_stat:
+            self.reload()
+
+    # Write unsaved changes now
+    def flush(self):
+        if self.dirty:
+            self.dirty = False
+            self.save_options(self.options)
+
+    # Read options.json again and apply the options that changed. A file
+    # that cannot be read (such as one an editor is still saving) or an
+    # invalid option leaves the current options as they are, the file is
+    # read again at the next check
+    def reload(self):
+        try:
+            data = self.read_file()
+        except (OSError, ValueError) as e:
+            print(f"Error reading {self.json_file_path}: {e}, keeping the options")
+            return
+
+        options = self.default_options()
+        for key, value in data.items():
+            try:
+                options[key] = self.validate(key, value)
+            except ValueError as e:
+                print(f"Invalid option {key}: {e}, keeping {self.options.get(key)}")
+                options[key] = self.options.get(key)
+
+        for key, value in options.items():
+            if self.options.get(key) != value:
+                self.options[key] = value
+                self.notify(key, value)
+
+    def stat(self):
+        try:
+            stat = os.stat(self.json_file_path)
+            return stat[6], stat[8]
+        except OSError:
+            return None
 
     def default_options(self):
-        return {
-            OptionKeys.WIFI_SSID: "WiFi",
-            OptionKeys.WIFI_PASSWORD: "",
-            OptionKeys.WIFI_DOMAIN: "setup.local",
-            OptionKeys.DISPLAY_TYPE: OptionsDisplayTypes.DISPLAY_PICO_DISPLAY,
-            OptionKeys.ENABLE_TIMESTAMPS: False,
-            OptionKeys.LED_BRIGHTNESS: 0.25,
-        }
+        return {key: option.default for key, option in OPTIONS_SCHEMA.items()}
+
+
+# Testing
+if __name__ == "__main__":
+
+    async def main():
+        options = OptionsService()
+        uasyncio.create_task(options.run())
+
+        options.subscribe(
+            OptionKeys.LED_BRIGHTNESS,
+            lambda value: print(f"LED brightness changed to {value}"),
+        )
+
+        brightness = options.get_option(OptionKeys.LED_BRIGHTNESS)
+        options.set_option(OptionKeys.LED_BRIGHTNESS, 0.5)
+        options.set_option(OptionKeys.LED_BRIGHTNESS, brightness)
+
+        try:
+            options.set_option(OptionKeys.LED_BRIGHTNESS, 2)
+        except ValueError as e:
+            print(f"Rejected: {e}")
+
+        # Both changes are written once, after the save delay
+        await uasyncio.sleep_ms(SAVE_DELAY_MS * 2)
+
+    uasyncio.run(main())
@@ -7,42 +7,84 @@
 #  server to allow users to connect to the device to be served web content.
 # =============================================================================
 
+import json
 import uasyncio  # type: ignore
 import sys
 
 # Third party packages
-from modules.phew import access_point, dns, server
-from modules.phew.server import redirect
-from modules.phew.template import render_template
+from modules.phew import access_point
+from modules.phew.server import Response, redirect
 
 # Local packages
+from services.dns_service import DnsService
+from services.led_service import LedService
 from services.messages_service import MessagesService
+from services.metrics_service import MetricKeys, MetricsService
 from services.options_service import OptionKeys, OptionsService
-from services.pico_display_led_service import PicoDisplayLedService
+from services.rate_limit_service import RateLimitService
+from services.static_files_service import StaticFilesService
+from services.static_pages_service import StaticPagesService
+from services.web_server_service import WebServerService, prebuilt_response
 
 # Ensure packages can be imported
 sys.path.append("../modules")
 sys.path.append("../services")
 
+# Ports the portal serves on
+HTTP_PORT = 80
+DNS_PORT = 53
+
+# Status codes blinked in red on the display LED when a step fails
+STATUS_ACCESS_POINT = 1
+STATUS_DNS = 2
+STATUS_WEB_SERVER = 3
+
 
 class PortalService:
     def __init__(
         self,
         options: OptionsService,
         messages: MessagesService,
-        pico_display_led: PicoDisplayLedService,
+        leds: LedService,
+        metrics: MetricsService = None,
     ):
         # Dependencies
         self.messages = messages
-        self.pico_display_led = pico_display_led
+        self.leds = leds
+        self.metrics = metrics or messages.metrics
 
         # Properties
         self.domain = options.get_option(OptionKeys.WIFI_DOMAIN)
         self.password = options.get_option(OptionKeys.WIFI_PASSWORD)
         self.ssid = options.get_option(OptionKeys.WIFI_SSID)
         self.ip = None
+        self.dns = None
+        self.web_server_started = False
+
+        # Static pages, read from flash once and served from memory
+        self.static_pages = StaticPagesService()
+        self.static_pages.load("templates/index.html")
+        self.static_pages.load("templates/success.html")
+
+        # Static files (such as a single-page app) streamed from flash
+        self.static_files = StaticFilesService(
+            options.get_option(OptionKeys.STATIC_DIR, "www")
+        )
+
+        # Queries per second allowed from each DNS client
+        self.dns_rate_limit = RateLimitService(
+            options,
+            OptionKeys.DNS_RATE_LIMIT,
+            OptionKeys.DNS_RATE_BURST,
+            MetricKeys.DNS_THROTTLED,
+            self.metrics,
+        )
+
+        # Web server, answers the captive-portal probes from prebuilt responses
+        self.web_server = WebServerService(options, self.metrics)
 
         # Initialization
+        self.register_fast_paths()
         self.register_routes()
 
     async def start_access_point(self):
@@ -52,6 +94,7 @@ class PortalService:
         await self.messages.display("AP Password:")
         await self.messages.display(f"{self.password if self.password else 'None'}")
         self.ip = ap.ifconfig()[0]
+        self.metrics.mark(MetricKeys.BOOT_AP_MS)
         await self.messages.display("AP IP:")
         await self.messages.display(self.ip)
 
@@ -60,52 +103,108 @@ class PortalService:
         await self.messages.display("Domain:")
         await self.messages.display(self.domain)
 
-        if self.ip:
-            dns.run_catchall(self.ip)
+        if self.dns:
+            await self.messages.display("DNS server already running")
+        elif self.ip:
+            self.dns = DnsService(self.ip, DNS_PORT, self.metrics, self.dns_rate_limit)
+            self.dns.start()
+            self.metrics.mark(MetricKeys.BOOT_DNS_MS)
             await self.messages.display("DNS server started")
         else:
             await self.messages.display("Error: Access Point not started")
             raise Exception("Access Point not started")
 
     async def start_web_server(self):
-        await self.pico_display_led.set_color("GREEN")
+        if not self.web_server_started:
+            await self.web_server.start(port=HTTP_PORT)
+            self.web_server_started = True
+            self.metrics.mark(MetricKeys.BOOT_HTTP_MS)
+            uasyncio.create_task(self.report_boot())
+        self.leds.fade("GREEN")
         await self.messages.display("Pico Portal started")
-        server.run()
+
+    # Show the boot timeline once the portal is up, and again when the first
+    # page has been served
+    async def report_boot(self):
+        for line in self.metrics.boot_lines():
+            await self.messages.display(line)
+        await self.web_server.first_response.wait()
+        await self.messages.display(
+            "First page after {:.1f}s".format(
+                self.metrics.values[MetricKeys.BOOT_FIRST_REQUEST_MS] / 1000
+            )
+        )
 
     async def run(self):
+        status = STATUS_ACCESS_POINT
         try:
-            await self.start_access_point()
+            # The access point is usually started early by main
+            if not self.ip:
+                await self.start_access_point()
+            status = STATUS_DNS
             await self.start_dns_server()
+            status = STATUS_WEB_SERVER
             await self.start_web_server()
         except Exception as e:
+            self.leds.status("RED", status)
             await self.messages.display(f"Error: {e}")
+            self.messages.log.flush()
+            # Let the supervisor restart the portal
+            raise
+
+    # Load shedding while memory is low, see MemoryService
+    def trim_caches(self):
+        if self.dns:
+            self.dns.trim_cache()
+
+    def restore_caches(self):
+        if self.dns:
+            self.dns.restore_cache()
+
+    def refuse_connections(self):
+        self.web_server.accepting = False
+
+    def accept_connections(self):
+        self.web_server.accepting = True
+
+    # OS connectivity probes, the most frequent requests the portal handles.
+    # Apple's probe is answered with the portal page, see register_routes
+    def register_fast_paths(self):
+        empty = prebuilt_response(200, {"Content-Type": "text/html"})
+        self.web_server.add_fast_path("/connecttest.txt", empty)  # Windows
+        self.web_server.add_fast_path("/ncsi.txt", empty)  # Windows
+        self.web_server.add_fast_path(  # Android
+            "/generate_204",
+            prebuilt_response(302, {"Location": f"http://{self.domain}/"}),
+        )
 
     def register_routes(self):
-        @server.route("/", methods=["GET"])
+        @self.web_server.route("/", methods=["GET"])
         def index(request):
-            return render_template("templates/index.html")
-
-        @server.route("/success", methods=["GET"])
-        def success(request):
-            return render_template("templates/success.html")
-
-        @server.route("/connecttest.txt", methods=["GET"])
-        def connecttest(request):
-            return "", 200
+            return self.static_files.respond(
+                request, request.path
+            ) or self.static_pages.respond(request, "templates/index.html")
 
-        @server.route("/ncsi.txt", methods=["GET"])
-        def ncsi(request):
-            return "", 200
+        # Apple's probe opens the sign-in sheet on any answer other than its
+        # success page, the portal page with its ETag and gzip copy is sent
+        @self.web_server.route("/hotspot-detect.html", methods=["GET"])
+        def hotspot_detect(request):
+            return self.static_pages.respond(request, "templates/index.html")
 
-        @server.route("/generate_204", methods=["GET"])
-        def android(request):
-            return redirect(f"http://{self.domain}/", 302)
-
-        @server.route("/hotspot-detect.html", methods=["GET"])
-        def apple(request):
-            return render_template("templates/index.html")
+        @self.web_server.route("/success", methods=["GET"])
+        def success(request):
+            return self.static_pages.respond(request, "templates/success.html")
+
+        # Runtime metrics for load tests and monitoring, never cached
+        @self.web_server.route("/status.json", methods=["GET"])
+        def status(request):
+            return Response(
+                json.dumps(self.metrics.snapshot()),
+                200,
+                {"Content-Type": "application/json", "Cache-Control": "no-store"},
+            )
 
-        @server.route("/login", methods=["GET"])
+        @self.web_server.route("/login", methods=["GET"])
         def login(request):
             username = request.query.get("username")
             password = request.query.get("password")
@@ -114,6 +213,15 @@ class PortalService:
             )
             return redirect(f"http://{self.domain}/success")
 
-        @server.route("/<path>", methods=["GET"])
+        @self.web_server.route("/<path>", methods=["GET"])
         def catch_all(request, path):
-            return redirect(f"http://{self.domain}/")
+            return self.static_files.respond(request, request.path) or redirect(
+                f"http://{self.domain}/"
+            )
+
+        # Paths with more than one segment, such as app assets
+        @self.web_server.catchall()
+        def catch_all_nested(request):
+            return self.static_files.respond(request, request.path) or redirect(
+                f"http://{self.domain}/"
+            )
@@ -0,0 +1,220 @@
+# =============================================================================
+#  Project: Pico Portal
+#  License: CC-BY-NC-4.0
+#  Repository: https://github.com/CodyTolene/Pico-Portal
+#  Description: Power saving for battery powered builds. With the power_save
+#  option on, scheduled jobs run at longer intervals, the onboard LED stops
+#  blinking, and the screen dims and then turns off (with the display LED)
+#  when nobody has pressed a button or loaded a page for a while. The draw
+#  and battery life are estimated from the timer wake-ups and the backlight.
+# =============================================================================
+
+import sys
+import utime  # type: ignore
+
+# Local packages
+from services.led_service import HEARTBEAT_PATTERN, LedService
+from services.messages_service import MessagesService
+from services.metrics_service import MetricKeys, MetricsService
+from services.options_service import OptionKeys, OptionsService
+from services.scheduler_service import ScheduledJob, SchedulerService
+
+# Ensure packages can be imported
+sys.path.append("../modules")
+sys.path.append("../services")
+
+# Screen states
+SCREEN_ON = 0
+SCREEN_DIM = 1
+SCREEN_OFF = 2
+
+# Backlight of each screen state
+BACKLIGHT_LEVELS = (1.0, 0.2, 0.0)
+
+# How often inactivity is checked while saving power, a web request wakes
+# the screen at the next check
+IDLE_CHECK_MS = 1000
+
+# How often the draw and battery life are estimated
+ESTIMATE_INTERVAL_MS = 60000
+
+# Rough draw of a Pico W with the access point up and the CPU idle, of the
+# display backlight at full brightness, and the charge each timer wake-up
+# costs (a couple of milliseconds awake). Measure your own build to tune
+IDLE_UA = 45000
+BACKLIGHT_UA = 25000
+WAKEUP_UC = 40
+
+
+class PowerService:
+    def __init__(
+        self,
+        options: OptionsService,
+        messages: MessagesService,
+        leds: LedService,
+        scheduler: SchedulerService,
+        metrics: MetricsService = None,
+    ):
+        # Dependencies
+        self.messages = messages
+        self.leds = leds
+        self.scheduler = scheduler
+        self.metrics = metrics or messages.metrics
+
+        # Options
+        self.enabled: bool = options.get_option(OptionKeys.POWER_SAVE, False)
+        self.dim_after_ms: int = options.get_option(
+            OptionKeys.DISPLAY_DIM_AFTER_MS, 30000
+        )
+        self.off_after_ms: int = options.get_option(
+            OptionKeys.DISPLAY_OFF_AFTER_MS, 120000
+        )
+        self.battery_mah: int = options.get_option(OptionKeys.BATTERY_MAH, 0)
+        options.subscribe(OptionKeys.POWER_SAVE, self.set_enabled)
+        for key, name in (
+            (OptionKeys.DISPLAY_DIM_AFTER_MS, "dim_after_ms"),
+            (OptionKeys.DISPLAY_OFF_AFTER_MS, "off_after_ms"),
+            (OptionKeys.BATTERY_MAH, "battery_mah"),
+        ):
+            options.subscribe(key, lambda value, name=name: setattr(self, name, value))
+
+        # Jobs and their intervals while saving power
+        self.stretched = []
+
+        # Screen state, the last activity, and the display LED effect to
+        # restore when the screen turns back on
+        self.screen = SCREEN_ON
+        self.active_at = utime.ticks_ms()
+        self.requests_seen = 0
+        self.saved_effect = None
+        self.blank_effect = None
+
+        # Estimate window, backlight percent integrated over time
+        self.estimated_at = utime.ticks_ms()
+        self.accounted_at = self.estimated_at
+        self.backlight_pct_ms = 0
+        self.wakeups_seen = 0
+
+        self.idle_job = scheduler.every("idle", 0, self.check_idle)
+        scheduler.every("power", ESTIMATE_INTERVAL_MS, self.estimate)
+
+    # Run a job at save_ms instead of its interval while saving power
+    def stretch(self, job: ScheduledJob, save_ms):
+        self.stretched.append((job, job.interval_ms, save_ms))
+        if self.enabled:
+            self.scheduler.set_interval(job, save_ms)
+
+    # Apply the option, also called once everything is set up
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        for job, normal_ms, save_ms in self.stretched:
+            self.scheduler.set_interval(job, save_ms if enabled else normal_ms)
+        self.scheduler.set_interval(self.idle_job, IDLE_CHECK_MS if enabled else 0)
+
+        if enabled:
+            self.leds.set_onboard(False)
+            self.active_at = utime.ticks_ms()
+        else:
+            self.leds.blink_onboard(HEARTBEAT_PATTERN)
+            self.set_screen(SCREEN_ON)
+
+    # Note activity and turn the screen back on, True if it was off
+    def wake(self):
+        self.active_at = utime.ticks_ms()
+        if self.screen == SCREEN_ON:
+            return False
+        was_off = self.screen == SCREEN_OFF
+        self.set_screen(SCREEN_ON)
+        return was_off
+
+    # Scheduled job, dims or turns off the screen once idle
+    def check_idle(self):
+        requests = self.metrics.values[MetricKeys.HTTP_REQUESTS]
+        if requests != self.requests_seen:
+            self.requests_seen = requests
+            self.wake()
+            return
+
+        idle = utime.ticks_diff(utime.ticks_ms(), self.active_at)
+        screen = SCREEN_ON
+        if self.off_after_ms and idle >= self.off_after_ms:
+            screen = SCREEN_OFF
+        elif self.dim_after_ms and idle >= self.dim_after_ms:
+            screen = SCREEN_DIM
+        if screen > self.screen:
+            self.set_screen(screen)
+
+    def set_screen(self, screen):
+        if screen == self.screen:
+            return
+        self.account(utime.ticks_ms())
+
+        if screen == SCREEN_OFF:
+            self.saved_effect = self.leds.rgb
+            self.leds.set_color("OFF")
+            self.blank_effect = self.leds.rgb
+        elif self.screen == SCREEN_OFF and self.leds.rgb is self.blank_effect:
+            # Nothing else changed the display LED while the screen was off
+            self.leds.play(self.saved_effect)
+
+        self.screen = screen
+        self.messages.set_backlight(BACKLIGHT_LEVELS[screen])
+
+    # Add the backlight since the last call to the estimate window
+    def account(self, now):
+        elapsed = utime.ticks_diff(now, self.accounted_at)
+        self.backlight_pct_ms += elapsed * int(self.messages.backlight * 100)
+        self.accounted_at = now
+
+    # Scheduled job, estimates the draw from the last window
+    def estimate(self):
+        now = utime.ticks_ms()
+        self.account(now)
+        elapsed = max(1, utime.ticks_diff(now, self.estimated_at))
+        wakeups = self.metrics.values[MetricKeys.WAKEUPS]
+        wakeups_per_min = (wakeups - self.wakeups_seen) * 60000 // elapsed
+
+        draw_ua = IDLE_UA
+        draw_ua += BACKLIGHT_UA * self.backlight_pct_ms // elapsed // 100
+        draw_ua += wakeups_per_min * WAKEUP_UC // 60
+
+        self.metrics.set(MetricKeys.WAKEUPS_PER_MIN, wakeups_per_min)
+        self.metrics.set(MetricKeys.POWER_DRAW_UA, draw_ua)
+        self.metrics.set(
+            MetricKeys.BATTERY_LIFE_MIN, self.battery_mah * 60000 // draw_ua
+        )
+
+        self.estimated_at = now
+        self.backlight_pct_ms = 0
+        self.wakeups_seen = wakeups
+
+
+# Testing
+if __name__ == "__main__":
+    import uasyncio  # type: ignore
+
+    async def main():
+        options = OptionsService(json_file_path=None)
+        options.set_option(OptionKeys.DISPLAY_DIM_AFTER_MS, 2000)
+        options.set_option(OptionKeys.DISPLAY_OFF_AFTER_MS, 4000)
+        options.set_option(OptionKeys.BATTERY_MAH, 1000)
+
+        messages = MessagesService(options)
+        leds = LedService(options, messages.metrics)
+        scheduler = SchedulerService(messages.metrics)
+        power = PowerService(options, messages, leds, scheduler)
+        uasyncio.create_task(messages.run())
+        uasyncio.create_task(leds.run())
+        uasyncio.create_task(scheduler.run())
+
+        # Dims after 2 seconds, turns off after 4, then wakes
+        leds.set_color("GREEN")
+        power.set_enabled(True)
+        await uasyncio.sleep(5)
+        print(f"Screen {power.screen}, backlight {messages.backlight}")
+        power.wake()
+        print(f"Screen {power.screen}, backlight {messages.backlight}")
+        power.estimate()
+        print(messages.metrics.snapshot())
+
+    uasyncio.run(main())
@@ -0,0 +1,127 @@
+# =============================================================================
+#  Project: Pico Portal
+#  License: CC-BY-NC-4.0
+#  Repository: https://github.com/CodyTolene/Pico-Portal
+#  Description: A per-client rate limiter for the Pico Portal. Each client
+#  address has a token bucket that refills at the configured rate up to the
+#  burst size, and every request takes one token. Buckets live in a fixed
+#  table of arrays, the least recently seen client makes room for a new one,
+#  so memory use is the same however many clients join.
+# =============================================================================
+
+import sys
+import utime  # type: ignore
+from array import array
+
+# Local packages
+from services.metrics_service import MetricKeys, MetricsService
+from services.options_service import OptionKeys, OptionsService
+
+# Ensure packages can be imported
+sys.path.append("../modules")
+sys.path.append("../services")
+
+# Clients tracked at once
+CLIENT_TABLE_SIZE = 32
+
+# Tokens are counted in thousandths, a request costs one token
+TOKEN = 1000
+
+
+class RateLimitService:
+    def __init__(
+        self,
+        options: OptionsService,
+        rate_key: OptionKeys,
+        burst_key: OptionKeys,
+        throttled_key: MetricKeys,
+        metrics: MetricsService = None,
+    ):
+        # Dependencies
+        self.metrics = metrics or MetricsService()
+
+        # Requests per second (0 = no limit) and the burst allowed on top
+        self.rate: int = options.get_option(rate_key, 0)
+        self.burst: int = options.get_option(burst_key, 1)
+        options.subscribe(rate_key, lambda value: setattr(self, "rate", value))
+        options.subscribe(burst_key, lambda value: setattr(self, "burst", value))
+
+        # Metric counting the requests refused
+        self.throttled_key = throttled_key
+
+        # Client table, a key of 0 marks a free slot
+        self.keys = array("L", [0] * CLIENT_TABLE_SIZE)
+        self.tokens = array("L", [0] * CLIENT_TABLE_SIZE)
+        self.seen = array("L", [0] * CLIENT_TABLE_SIZE)
+        self.throttled = bytearray(CLIENT_TABLE_SIZE)
+
+    # Take a token for a request from the client's address, False if the
+    # client is over the limit
+    def allow(self, address):
+        if not self.rate:
+            return True
+
+        # Addresses are hashed to fit the table, two clients sharing a hash
+        # share a bucket
+        key = (hash(address) & 0x7FFFFFFF) | 1
+        now = utime.ticks_ms()
+        capacity = self.burst * TOKEN
+        keys = self.keys
+        seen = self.seen
+
+        # Find the client, or the free or least recently seen slot
+        slot = -1
+        free = -1
+        oldest = 0
+        for index in range(CLIENT_TABLE_SIZE):
+            if keys[index] == key:
+                slot = index
+                break
+            if keys[index] == 0:
+                if free < 0:
+                    free = index
+            elif utime.ticks_diff(seen[index], seen[oldest]) < 0:
+                oldest = index
+
+        if slot < 0:
+            # New client, starts with a full bucket
+            slot = free if free >= 0 else oldest
+            keys[slot] = key
+            tokens = capacity
+            self.throttled[slot] = 0
+        else:
+            elapsed = utime.ticks_diff(now, seen[slot])
+            tokens = min(capacity, self.tokens[slot] + elapsed * self.rate)
+        seen[slot] = now
+
+        if tokens >= TOKEN:
+            self.tokens[slot] = tokens - TOKEN
+            self.throttled[slot] = 0
+            return True
+
+        self.tokens[slot] = tokens
+        if not self.throttled[slot]:
+            self.throttled[slot] = 1
+            self.metrics.inc(MetricKeys.THROTTLED_CLIENTS)
+        self.metrics.inc(self.throttled_key)
+        return False
+
+
+# Testing
+if __name__ == "__main__":
+    options = OptionsService(json_file_path=None)
+    metrics = MetricsService()
+    limiter = RateLimitService(
+        options,
+        OptionKeys.HTTP_RATE_LIMIT,
+        OptionKeys.HTTP_RATE_BURST,
+        MetricKeys.HTTP_THROTTLED,
+        metrics,
+    )
+
+    # A burst from one client, then many clients at once
+    allowed = sum(limiter.allow("192.168.4.2") for _ in range(100))
+    print(f"Allowed {allowed} of 100 requests from one client")
+    for i in range(100):
+        limiter.allow(f"192.168.4.{i + 3}")
+    print(metrics.snapshot())
@@ -0,0 +1,127 @@
+# =============================================================================
+#  Project: Pico Portal
+#  License: CC-BY-NC-4.0
+#  Repository: https://github.com/CodyTolene/Pico-Portal
+#  Description: A scheduler for the periodic work of the Pico Portal. Jobs are
+#  kept by deadline and run from one task, which sleeps until the earliest
+#  deadline. Jobs due soon after it are run early in the same wake-up, so the
+#  board idles between bursts of work instead of waking for each job. How
+#  late a wake-up is measures the event loop lag.
+# =============================================================================
+
+import sys
+import uasyncio  # type: ignore
+import utime  # type: ignore
+
+# Local packages
+from services.metrics_service import MetricKeys, MetricsService
+
+# Ensure packages can be imported
+sys.path.append("../modules")
+sys.path.append("../services")
+
+# A job is run early, with the job that woke the scheduler, when it is due
+# within this fraction of its interval
+EARLY_DIVISOR = 4
+
+
+class ScheduledJob:
+    def __init__(self, name, interval_ms, callback):
+        self.name = name
+        self.interval_ms = interval_ms
+        self.callback = callback
+        self.due_at = utime.ticks_add(utime.ticks_ms(), interval_ms)
+
+
+class SchedulerService:
+    def __init__(self, metrics: MetricsService = None):
+        # Dependencies
+        self.metrics = metrics or MetricsService()
+
+        # Jobs, an interval of 0 pauses a job
+        self.jobs = []
+
+        # Wakes the task when a job is added or its interval changes
+        self.changed = uasyncio.Event()
+
+    # Call callback (no arguments, must not block) every interval_ms
+    def every(self, name, interval_ms, callback):
+        job = ScheduledJob(name, interval_ms, callback)
+        self.jobs.append(job)
+        self.changed.set()
+        return job
+
+    # Change a job's interval, it next runs one new interval from now
+    def set_interval(self, job: ScheduledJob, interval_ms):
+        job.interval_ms = interval_ms
+        job.due_at = utime.ticks_add(utime.ticks_ms(), interval_ms)
+        self.changed.set()
+
+    # Milliseconds to the earliest deadline, None if no job is scheduled
+    def next_delay(self, now):
+        delay = None
+        for job in self.jobs:
+            if not job.interval_ms:
+                continue
+            until = utime.ticks_diff(job.due_at, now)
+            if delay is None or until < delay:
+                delay = until
+        return delay
+
+    async def run(self):
+        while True:
+            self.changed.clear()
+            delay = self.next_delay(utime.ticks_ms())
+            if delay is None:
+                await self.changed.wait()
+                continue
+            if delay > 0:
+                try:
+                    await uasyncio.wait_for_ms(self.changed.wait(), delay)
+                    continue  # Jobs changed, find the earliest deadline again
+                except uasyncio.TimeoutError:
+                    pass
+
+            self.metrics.inc(MetricKeys.WAKEUPS)
+            self.run_due(utime.ticks_ms())
+
+    # Run the jobs that are due, or nearly due, and schedule their next run
+    def run_due(self, now):
+        lag = 0
+        for job in self.jobs:
+            interval = job.interval_ms
+            if not interval:
+                continue
+            late = utime.ticks_diff(now, job.due_at)
+            if late < -(interval // EARLY_DIVISOR):
+                continue
+
+            lag = max(lag, late)
+            if late < interval:
+                job.due_at = utime.ticks_add(job.due_at, interval)
+            else:
+                # Missed whole intervals, skip them rather than catch up
+                job.due_at = utime.ticks_add(now, interval)
+            job.callback()
+
+        values = self.metrics.values
+        values[MetricKeys.LOOP_LAG_MS] = lag
+        if lag > values[MetricKeys.LOOP_LAG_MS_MAX]:
+            values[MetricKeys.LOOP_LAG_MS_MAX] = lag
+
+
+# Testing
+if __name__ == "__main__":
+
+    async def main():
+        scheduler = SchedulerService()
+        uasyncio.create_task(scheduler.run())
+
+        # The second job is run early with the first every other time
+        scheduler.every("fast", 1000, lambda: print(f"fast {utime.ticks_ms()}"))
+        scheduler.every("slow", 1900, lambda: print(f"slow {utime.ticks_ms()}"))
+
+        await uasyncio.sleep(10)
+        print(scheduler.metrics.snapshot()["wakeups"])
+
+    uasyncio.run(main())
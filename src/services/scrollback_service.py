@@ -0,0 +1,167 @@
+# =============================================================================
+#  Project: Pico Portal
+#  License: CC-BY-NC-4.0
+#  Repository: https://github.com/CodyTolene/Pico-Portal
+#  Description: A fixed-capacity store for the on-screen message history.
+#  Messages are kept in a preallocated ring of byte slots in RAM, and slots
+#  that age out are spilled to a ring file on flash so they can be paged back
+#  in when scrolling. Heap use is fixed when the service is created.
+# =============================================================================
+
+from array import array
+
+# Each stored message is one slot: [length][color][text bytes...]
+SLOT_SIZE = 128
+MAX_TEXT_BYTES = SLOT_SIZE - 2
+
+# Number of spilled slots read from flash at a time when paging
+PAGE_SLOTS = 8
+
+
+class ScrollbackService:
+    def __init__(
+        self, capacity=50, spill_capacity=500, spill_file_path="scrollback.bin"
+    ):
+        # Properties
+        self.capacity = max(1, capacity)
+        self.spill_capacity = max(0, spill_capacity)
+        self.spill_file = None
+
+        # Open (or create) the spill file, spilling is disabled on failure
+        if self.spill_capacity:
+            try:
+                try:
+                    self.spill_file = open(spill_file_path, "r+b")
+                except OSError:
+                    self.spill_file = open(spill_file_path, "w+b")
+            except OSError as e:
+                print(f"Scrollback spill disabled: {e}")
+                self.spill_capacity = 0
+
+        # In RAM message slots
+        self.slots = bytearray(self.capacity * SLOT_SIZE)
+
+        # Single cached page of spilled slots
+        self.page = bytearray(PAGE_SLOTS * SLOT_SIZE)
+        self.page_number = -1
+
+        # Line index for every retained message (RAM and flash), indexed by
+        # sequence number modulo the index size
+        self.index_size = self.capacity + self.spill_capacity
+        self.line_offsets = array("L", [0] * self.index_size)
+        self.line_counts = bytearray(self.index_size)
+
+        # Sequence numbers increase forever, messages in the range
+        # [first_seq, ram_seq) are on flash and [ram_seq, next_seq) are in RAM
+        self.first_seq = 0
+        self.ram_seq = 0
+        self.next_seq = 0
+
+        # Absolute line numbers of the oldest retained and the next message
+        self.first_line = 0
+        self.next_line = 0
+
+    # Total wrapped lines across all retained messages
+    @property
+    def total_lines(self):
+        return self.next_line - self.first_line
+
+    # Clip a message so it fits into a single slot
+    def clip(self, message: str):
+        data = message.encode()
+        if len(data) <= MAX_TEXT_BYTES:
+            return message
+
+        # Cut on a UTF-8 character boundary
+        end = MAX_TEXT_BYTES
+        while end and (data[end] & 0xC0) == 0x80:
+            end -= 1
+        return data[:end].decode()
+
+    # Add a message (already clipped) with its palette color index and line count
+    def append(self, message: str, color: int, line_count: int):
+        # Move the oldest RAM message out of the way when the ring is full
+        if self.next_seq - self.ram_seq == self.capacity:
+            self._spill_oldest()
+
+        # Drop the oldest retained message when the line index is full
+        if self.next_seq - self.first_seq == self.index_size:
+            self._drop_oldest()
+
+        data = message.encode()
+        offset = (self.next_seq % self.capacity) * SLOT_SIZE
+        start = offset + 2
+        end = start + len(data)
+        self.slots[offset] = len(data)
+        self.slots[offset + 1] = color
+        self.slots[start:end] = data
+
+        index = self.next_seq % self.index_size
+        self.line_offsets[index] = self.next_line
+        self.line_counts[index] = min(line_count, 255)
+        self.next_seq += 1
+        self.next_line += self.line_counts[index]
+
+    # Line number of a message, relative to the oldest retained line
+    def line_of(self, seq):
+        return self.line_offsets[seq % self.index_size] - self.first_line
+
+    # Number of wrapped lines in a message
+    def line_count(self, seq):
+        return self.line_counts[seq % self.index_size]
+
+    # Find the message containing a line (relative to the oldest retained
+    # line) with a binary search over the line index
+    def seq_at_line(self, line):
+        low = self.first_seq
+        high = self.next_seq - 1
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.line_of(middle) <= line:
+                low = middle
+            else:
+                high = middle - 1
+        return low
+
+    # Read a message back as (text, color), paging it in from flash if needed
+    def get(self, seq):
+        if seq >= self.ram_seq:
+            buffer = self.slots
+            offset = (seq % self.capacity) * SLOT_SIZE
+        else:
+            buffer = self._page_in(seq % self.spill_capacity)
+            offset = (seq % self.spill_capacity % PAGE_SLOTS) * SLOT_SIZE
+
+        start = offset + 2
+        end = start + buffer[offset]
+        return bytes(buffer[start:end]).decode(), buffer[offset + 1]
+
+    def _spill_oldest(self):
+        if self.spill_capacity:
+            slot = self.ram_seq % self.spill_capacity
+            start = (self.ram_seq % self.capacity) * SLOT_SIZE
+            end = start + SLOT_SIZE
+            try:
+                self.spill_file.seek(slot * SLOT_SIZE)
+                self.spill_file.write(memoryview(self.slots)[start:end])
+            except OSError as e:
+                print(f"Failed to spill scrollback: {e}")
+            if slot // PAGE_SLOTS == self.page_number:
+                self.page_number = -1
+        self.ram_seq += 1
+
+    def _drop_oldest(self):
+        self.first_line += self.line_counts[self.first_seq % self.index_size]
+        self.first_seq += 1
+        self.ram_seq = max(self.ram_seq, self.first_seq)
+
+    def _page_in(self, slot):
+        page_number = slot // PAGE_SLOTS
+        if page_number != self.page_number:
+            try:
+                self.spill_file.seek(page_number * PAGE_SLOTS * SLOT_SIZE)
+                self.spill_file.readinto(self.page)
+                self.page_number = page_number
+            except OSError as e:
+                print(f"Failed to page in scrollback: {e}")
+        return self.page
@@ -0,0 +1,164 @@
+# =============================================================================
+#  Project: Pico Portal
+#  License: CC-BY-NC-4.0
+#  Repository: https://github.com/CodyTolene/Pico-Portal
+#  Description: A service for serving files from a static folder on flash,
+#  such as a single-page app bundle. Files are streamed in fixed-size chunks
+#  through the connection's buffer from the web server's pool, so large
+#  files never have to fit in memory, with support for MIME types,
+#  cache headers, ETags, gzip copies, range requests and an index.html
+#  fallback for app routes.
+# =============================================================================
+
+import os
+import sys
+
+# Third party packages
+from modules.phew.server import Response
+
+# Ensure packages can be imported
+sys.path.append("../modules")
+sys.path.append("../services")
+
+# Size of the chunks files are streamed in without a connection buffer
+CHUNK_SIZE = 1024
+
+MIME_TYPES = {
+    "css": "text/css",
+    "gif": "image/gif",
+    "htm": "text/html",
+    "html": "text/html",
+    "ico": "image/x-icon",
+    "jpeg": "image/jpeg",
+    "jpg": "image/jpeg",
+    "js": "text/javascript",
+    "json": "application/json",
+    "map": "application/json",
+    "mjs": "text/javascript",
+    "png": "image/png",
+    "svg": "image/svg+xml",
+    "txt": "text/plain",
+    "wasm": "application/wasm",
+    "webmanifest": "application/manifest+json",
+    "webp": "image/webp",
+    "woff": "font/woff",
+    "woff2": "font/woff2",
+    "xml": "application/xml",
+}
+
+
+class StaticFilesService:
+    def __init__(self, root="www"):
+        # Properties
+        self.root = root.rstrip("/")
+        self.enabled = self.is_dir(self.root)
+
+    def is_dir(self, file_path):
+        try:
+            return (os.stat(file_path)[0] & 0x4000) != 0
+        except OSError:
+            return False
+
+    def is_file(self, file_path):
+        try:
+            return (os.stat(file_path)[0] & 0x4000) == 0
+        except OSError:
+            return False
+
+    # Build a response for a request path, or None if nothing should be served
+    def respond(self, request, path):
+        if not self.enabled or ".." in path:
+            return None
+
+        if path.endswith("/"):
+            path += "index.html"
+        file_path = self.root + path
+
+        if not self.is_file(file_path):
+            # Paths without an extension are app routes, serve the app shell
+            file_path = self.root + "/index.html"
+            if "." in path.rsplit("/", 1)[-1] or not self.is_file(file_path):
+                return None
+
+        return self.respond_file(request, file_path)
+
+    def respond_file(self, request, file_path):
+        extension = file_path.rsplit(".", 1)[-1].lower()
+        range_header = request.headers.get("range")
+        headers = {
+            "Content-Type": MIME_TYPES.get(extension, "application/octet-stream"),
+            "Accept-Ranges": "bytes",
+            "Vary": "Accept-Encoding",
+            "Cache-Control": (
+                "no-cache" if extension in ("htm", "html") else "public, max-age=86400"
+            ),
+        }
+
+        # Precompressed copy for clients that accept gzip, ranges are always
+        # served from the uncompressed file
+        if not range_header and "gzip" in request.headers.get("accept-encoding", ""):
+            if self.is_file(file_path + ".gz"):
+                file_path += ".gz"
+                headers["Content-Encoding"] = "gzip"
+
+        stat = os.stat(file_path)
+        size = stat[6]
+        etag = '"{:x}-{:x}{}"'.format(
+            size, stat[8], "-gz" if "Content-Encoding" in headers else ""
+        )
+        headers["ETag"] = etag
+
+        if etag in request.headers.get("if-none-match", ""):
+            return Response(b"", 304, {"ETag": etag})
+
+        if range_header:
+            byte_range = self.parse_range(range_header, size)
+            if byte_range is None:
+                return Response(b"", 416, {"Content-Range": f"bytes */{size}"})
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            headers["Content-Length"] = end - start + 1
+            return Response(
+                self.stream(file_path, start, end - start + 1, request), 206, headers
+            )
+
+        headers["Content-Length"] = size
+        return Response(self.stream(file_path, 0, size, request), 200, headers)
+
+    # Parse a single "bytes=start-end" range, None if it is not satisfiable
+    def parse_range(self, range_header, size):
+        try:
+            unit, value = range_header.split("=", 1)
+            start, end = value.split(",", 1)[0].strip().split("-", 1)
+            if unit.strip() != "bytes":
+                return None
+            if start:
+                start = int(start)
+                end = int(end) if end else size - 1
+            else:
+                # Suffix range, the last N bytes
+                start = max(0, size - int(end))
+                end = size - 1
+        except ValueError:
+            return None
+
+        end = min(end, size - 1)
+        if start > end:
+            return None
+        return start, end
+
+    # Generator yielding a file in chunks of the request's connection buffer,
+    # set by the web server, which stays with the connection until the
+    # response is sent
+    def stream(self, file_path, start, length, request):
+        buffer = getattr(request, "buffer", None) or bytearray(CHUNK_SIZE)
+        view = memoryview(buffer)
+        with open(file_path, "rb") as f:
+            f.seek(start)
+            while length > 0:
+                count = f.readinto(buffer)
+                if not count:
+                    break
+                count = min(count, length)
+                length -= count
+                yield view[:count]
@@ -0,0 +1,80 @@
+# =============================================================================
+#  Project: Pico Portal
+#  License: CC-BY-NC-4.0
+#  Repository: https://github.com/CodyTolene/Pico-Portal
+#  Description: A service for serving static pages from memory. Each page is
+#  read from flash once and kept as ready-to-send responses: plain, gzip (when
+#  a precompressed ".gz" copy exists) and "304 Not Modified" for clients that
+#  already hold the current ETag.
+# =============================================================================
+
+import binascii
+import hashlib
+import sys
+
+# Third party packages
+from modules.phew.server import Response
+
+# Ensure packages can be imported
+sys.path.append("../modules")
+sys.path.append("../services")
+
+
+class StaticPage:
+    def __init__(self, plain, gzip, not_modified, etag):
+        self.plain = plain
+        self.gzip = gzip
+        self.not_modified = not_modified
+        self.etag = etag
+
+
+class StaticPagesService:
+    def __init__(self):
+        self.pages = {}
+
+    # Read a page (and its ".gz" copy if present) into memory
+    def load(self, file_path, content_type="text/html"):
+        with open(file_path, "rb") as f:
+            body = f.read()
+
+        digest = hashlib.sha256(body).digest()
+        etag = '"' + binascii.hexlify(digest[:8]).decode() + '"'
+        headers = {
+            "Content-Type": content_type,
+            "Cache-Control": "no-cache",
+            "ETag": etag,
+            "Vary": "Accept-Encoding",
+        }
+
+        plain_headers = dict(headers)
+        plain_headers["Content-Length"] = len(body)
+        plain = Response(body, 200, plain_headers)
+
+        gzip = None
+        try:
+            with open(file_path + ".gz", "rb") as f:
+                gzip_body = f.read()
+            gzip_headers = dict(headers)
+            gzip_headers["Content-Encoding"] = "gzip"
+            gzip_headers["Content-Length"] = len(gzip_body)
+            gzip = Response(gzip_body, 200, gzip_headers)
+        except OSError:
+            pass
+
+        not_modified = Response(b"", 304, {"ETag": etag, "Cache-Control": "no-cache"})
+
+        self.pages[file_path] = StaticPage(plain, gzip, not_modified, etag)
+
+    # Pick the response for a request, loading the page on first use
+    def respond(self, request, file_path):
+        page = self.pages.get(file_path)
+        if page is None:
+            self.load(file_path)
+            page = self.pages[file_path]
+
+        headers = request.headers
+        if page.etag in headers.get("if-none-match", ""):
+            return page.not_modified
+        if page.gzip and "gzip" in headers.get("accept-encoding", ""):
+            return page.gzip
+        return page.plain
@@ -0,0 +1,191 @@
+# =============================================================================
+#  Project: Pico Portal
+#  License: CC-BY-NC-4.0
+#  Repository: https://github.com/CodyTolene/Pico-Portal
+#  Description: A supervisor for the long running tasks of the Pico Portal.
+#  Tasks that fail are restarted with an increasing delay, every step a task
+#  runs between awaits is timed so a task that blocks the event loop is
+#  named, and the hardware watchdog is fed from a scheduled job so a wedged
+#  event loop resets the board.
+# =============================================================================
+
+import sys
+import uasyncio  # type: ignore
+import utime  # type: ignore
+from machine import WDT  # type: ignore
+
+# Local packages
+from services.messages_service import MessagesService
+from services.metrics_service import MetricKeys, MetricsService
+
+# Ensure packages can be imported
+sys.path.append("../modules")
+sys.path.append("../services")
+
+# How often the watchdog is fed, and while saving power at most (a quarter
+# of the timeout if that is shorter)
+FEED_INTERVAL_MS = 250
+FEED_INTERVAL_SAVE_MS = 2000
+
+# A task step running longer than this without awaiting is reported
+SLOW_STEP_MS = 250
+
+# Delay before restarting a failed task, doubled on each failure in a row
+RESTART_DELAY_MS = 1000
+RESTART_DELAY_MAX_MS = 60000
+
+# A task that ran this long before failing restarts with the initial delay
+STABLE_RUN_MS = 60000
+
+
+class SupervisedTask:
+    def __init__(self, name, factory):
+        self.name = name
+        self.factory = factory
+        self.task = None
+        self.restarts = 0
+        self.slow_steps = 0
+        self.step_ms_max = 0
+
+
+class SupervisorService:
+    def __init__(
+        self,
+        messages: MessagesService,
+        metrics: MetricsService,
+        watchdog_timeout_ms=8000,
+    ):
+        # Dependencies
+        self.messages = messages
+        self.metrics = metrics
+
+        # Properties
+        self.tasks = {}
+        self.watchdog_timeout_ms = watchdog_timeout_ms
+        self.watchdog = None
+
+    # Run a task under supervision, factory returns a new coroutine for each
+    # start. A task that returns is done, a task that raises is restarted
+    def start(self, name, factory):
+        supervised = SupervisedTask(name, factory)
+        self.tasks[name] = supervised
+        uasyncio.create_task(self.supervise(supervised))
+        return supervised
+
+    async def supervise(self, supervised):
+        delay = RESTART_DELAY_MS
+        while True:
+            started = utime.ticks_ms()
+            try:
+                supervised.task = uasyncio.create_task(
+                    self.timed(supervised, supervised.factory())
+                )
+                await supervised.task
+                return
+            except Exception as e:
+                await self.messages.display(
+                    f"Task {supervised.name} failed: {e}", color=self.messages.RED
+                )
+
+            if utime.ticks_diff(utime.ticks_ms(), started) >= STABLE_RUN_MS:
+                delay = RESTART_DELAY_MS
+
+            await uasyncio.sleep_ms(delay)
+            delay = min(delay * 2, RESTART_DELAY_MAX_MS)
+
+            supervised.restarts += 1
+            self.metrics.inc(MetricKeys.TASK_RESTARTS)
+            await self.messages.display(f"Restarting task {supervised.name}")
+
+    # Step a coroutine like the event loop would, timing each step. Runs as
+    # the task itself, values and exceptions from the event loop are passed
+    # through unchanged
+    def timed(self, supervised, coro):
+        value = None
+        error = None
+        while True:
+            start = utime.ticks_ms()
+            try:
+                if error is None:
+                    awaitable = coro.send(value)
+                else:
+                    awaitable = coro.throw(error)
+            except StopIteration as stop:
+                return stop.value
+            finally:
+                self.check_step(supervised, utime.ticks_diff(utime.ticks_ms(), start))
+
+            value = None
+            error = None
+            try:
+                value = yield awaitable
+            except BaseException as e:
+                error = e
+
+    def check_step(self, supervised, elapsed):
+        if elapsed < SLOW_STEP_MS:
+            return
+
+        supervised.slow_steps += 1
+        self.metrics.inc(MetricKeys.SLOW_STEPS)
+
+        # Only report a task when it sets a new record, not on every step
+        if elapsed > supervised.step_ms_max:
+            supervised.step_ms_max = elapsed
+            uasyncio.create_task(
+                self.messages.display(
+                    f"Task {supervised.name} blocked for {elapsed}ms",
+                    color=self.messages.RED,
+                )
+            )
+
+    # Arm the watchdog, from then on feed must be called more often than the
+    # timeout or the board resets
+    def start_watchdog(self):
+        if self.watchdog_timeout_ms and not self.watchdog:
+            self.watchdog = WDT(timeout=self.watchdog_timeout_ms)
+
+    def feed(self):
+        if self.watchdog:
+            self.watchdog.feed()
+
+    def feed_interval_ms(self, power_save=False):
+        if not power_save:
+            return FEED_INTERVAL_MS
+        if self.watchdog_timeout_ms:
+            return min(FEED_INTERVAL_SAVE_MS, self.watchdog_timeout_ms // 4)
+        return FEED_INTERVAL_SAVE_MS
+
+
+# Testing
+if __name__ == "__main__":
+    from services.options_service import OptionsService
+    from services.scheduler_service import SchedulerService
+
+    async def main():
+        metrics = MetricsService()
+        messages = MessagesService(OptionsService(), metrics)
+        uasyncio.create_task(messages.run())
+
+        # No watchdog while testing, it cannot be stopped once armed
+        supervisor = SupervisorService(messages, metrics, watchdog_timeout_ms=0)
+        scheduler = SchedulerService(metrics)
+        scheduler.every("watchdog", supervisor.feed_interval_ms(), supervisor.feed)
+        supervisor.start("scheduler", scheduler.run)
+
+        async def crashing():
+            await uasyncio.sleep(1)
+            raise Exception("Simulated crash")
+
+        async def blocking():
+            while True:
+                utime.sleep_ms(SLOW_STEP_MS * 2)
+                await uasyncio.sleep(1)
+
+        supervisor.start("crashing", crashing)
+        supervisor.start("blocking", blocking)
+
+        await uasyncio.sleep(10)
+        print(metrics.snapshot())
+
+    uasyncio.run(main())
@@ -0,0 +1,491 @@
+# =============================================================================
+#  Project: Pico Portal
+#  License: CC-BY-NC-4.0
+#  Repository: https://github.com/CodyTolene/Pico-Portal
+#  Description: The web server for the Pico Portal. Requests for exact paths
+#  registered as fast paths (such as the OS captive-portal probes) are
+#  answered with prebuilt response bytes from a dictionary lookup. Everything
+#  else is matched against the routes registered with route() and
+#  catchall(), parsed here with only phew's public classes. Open
+#  connections are capped, clients beyond the cap get a prebuilt 503 and
+#  clients over their request rate a prebuilt 429. Idle keep-alive
+#  connections are reused until a timeout. Each connection takes a buffer
+#  from a preallocated pool, passed to route handlers as request.buffer, that
+#  static files and file responses are streamed through.
+# =============================================================================
+
+import json
+import sys
+import uasyncio  # type: ignore
+
+# Third party packages
+from modules.phew import server
+from modules.phew.server import FileResponse, Request, Response, Route, urldecode
+
+# Local packages
+from services.metrics_service import MetricKeys, MetricsService
+from services.options_service import OptionKeys, OptionsService
+from services.rate_limit_service import RateLimitService
+
+# Ensure packages can be imported
+sys.path.append("../modules")
+sys.path.append("../services")
+
+
+# Size of the buffers responses are streamed through, one per connection
+BUFFER_SIZE = 1024
+
+# Time a client gets to send its request line and headers
+REQUEST_TIMEOUT_MS = 5000
+
+# Time a client beyond the connection limit gets to send its request before
+# the busy answer is sent
+REJECT_READ_MS = 250
+
+
+# Status messages phew does not know
+STATUS_MESSAGES = {429: "Too Many Requests", 503: "Service Unavailable"}
+
+
+def status_message(status):
+    return server.status_message_map.get(status) or STATUS_MESSAGES.get(
+        status, "Unknown"
+    )
+
+
+# Parse an URL encoded query string or form body into a dictionary
+def parse_query_string(query_string):
+    result = {}
+    for parameter in query_string.split("&"):
+        key, _, value = parameter.partition("=")
+        if key:
+            result[urldecode(key)] = urldecode(value)
+    return result
+
+
+# Read headers up to the blank line (those of a request, or of a field in a
+# multipart/form-data body), names in lower case. Malformed lines are skipped
+async def parse_headers(reader):
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line == b"\r\n" or not line:
+            break
+        name, separator, value = line.decode().partition(":")
+        if separator:
+            headers[name.strip().lower()] = value.strip()
+    return headers
+
+
+# Fields of a multipart/form-data body
+async def parse_form_data(reader, headers):
+    boundary = "--" + headers["content-type"].split("boundary=")[1]
+    await reader.readline()  # First boundary
+
+    form = {}
+    while True:
+        field_headers = await parse_headers(reader)
+        if not field_headers:
+            break
+        name = field_headers["content-disposition"].split('name="')[1][:-1]
+        value = ""
+        while True:
+            line = await reader.readline()
+            if not line:
+                return form
+            line = line.decode().strip()
+            if line == boundary:
+                form[name] = value
+                break
+            if line == boundary + "--":
+                form[name] = value
+                return form
+            value += line
+    return form
+
+
+# Build the complete bytes of an HTTP response ahead of time
+def prebuilt_response(status, headers=None, body=b"", keep_alive=False):
+    lines = [f"HTTP/1.1 {status} {status_message(status)}"]
+    for key, value in (headers or {}).items():
+        lines.append(f"{key}: {value}")
+    lines.append(f"Content-Length: {len(body)}")
+    lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode() + body
+
+
+# Answer for clients beyond the connection limit
+BUSY_RESPONSE = prebuilt_response(
+    503, {"Content-Type": "text/plain", "Retry-After": 1}, b"Busy, try again"
+)
+
+
+# Answer for malformed requests
+BAD_REQUEST_RESPONSE = prebuilt_response(
+    400, {"Content-Type": "text/plain"}, b"Bad request"
+)
+
+
+# Answer for clients over their request rate
+THROTTLED_RESPONSE = prebuilt_response(
+    429, {"Content-Type": "text/plain", "Retry-After": 1}, b"Too many requests"
+)
+
+
+# Buffers for the connections, allocated up front so a burst of clients does
+# not fragment the heap. Runs out only if the connection limit was raised
+class BufferPool:
+    def __init__(self, count, size=BUFFER_SIZE):
+        self.count = count
+        self.size = size
+        self.buffers = [bytearray(size) for _ in range(count)]
+
+    def acquire(self):
+        if self.buffers:
+            return self.buffers.pop()
+        return bytearray(self.size)
+
+    def release(self, buffer):
+        if len(self.buffers) < self.count:
+            self.buffers.append(buffer)
+
+
+class WebServerService:
+    def __init__(self, options: OptionsService, metrics: MetricsService = None):
+        # Dependencies
+        self.metrics = metrics or MetricsService()
+
+        # Connection limits. The backlog only applies when the server starts
+        self.max_connections: int = options.get_option(
+            OptionKeys.HTTP_MAX_CONNECTIONS, 8
+        )
+        self.backlog: int = options.get_option(OptionKeys.HTTP_BACKLOG, 4)
+        self.keep_alive_ms: int = options.get_option(
+            OptionKeys.HTTP_KEEP_ALIVE_MS, 2000
+        )
+        options.subscribe(OptionKeys.HTTP_MAX_CONNECTIONS, self.set_max_connections)
+        options.subscribe(
+            OptionKeys.HTTP_KEEP_ALIVE_MS,
+            lambda value: setattr(self, "keep_alive_ms", value),
+        )
+
+        # Requests per second allowed from each client
+        self.rate_limit = RateLimitService(
+            options,
+            OptionKeys.HTTP_RATE_LIMIT,
+            OptionKeys.HTTP_RATE_BURST,
+            MetricKeys.HTTP_THROTTLED,
+            self.metrics,
+        )
+
+        # Open connections and their buffers. New connections are refused
+        # while memory is low
+        self.accepting = True
+        self.connections = 0
+        self.buffers = BufferPool(self.max_connections)
+
+        # Routes, most path segments first, and the handler of requests no
+        # route matches
+        self.routes = []
+        self.catchall_handler = None
+
+        # Exact request paths (bytes) mapped to (response bytes, keep-alive
+        # response bytes, status, route request counters)
+        self.fast_paths = {}
+
+        # Set once the first response of this boot has been sent
+        self.first_response = uasyncio.Event()
+
+    def set_max_connections(self, value):
+        self.max_connections = value
+        self.buffers.count = value
+
+    # Decorator adding a route, paths take phew's "<name>" parameters
+    def route(self, path, methods=["GET"]):
+        def add_route(handler):
+            self.routes.append(Route(path, handler, methods))
+            self.routes.sort(key=lambda route: len(route.path_parts), reverse=True)
+            return handler
+
+        return add_route
+
+    # Decorator setting the handler of requests no route matches
+    def catchall(self):
+        def set_catchall(handler):
+            self.catchall_handler = handler
+            return handler
+
+        return set_catchall
+
+    def match_route(self, request):
+        for route in self.routes:
+            if route.matches(request):
+                return route
+        return None
+
+    # Answer GET requests for an exact path with prebuilt response bytes
+    def add_fast_path(self, path: str, response: bytes):
+        status = int(response.split(b" ", 2)[1])
+        self.fast_paths[path.encode()] = (
+            response,
+            response.replace(b"Connection: close", b"Connection: keep-alive", 1),
+            status,
+            self.metrics.route(path),
+        )
+
+    async def start(self, host="0.0.0.0", port=80):
+        return await uasyncio.start_server(
+            self.handle_connection, host, port, backlog=self.backlog
+        )
+
+    # Serve the requests of a connection until the client closes it, goes
+    # idle or asks to close
+    async def handle_connection(self, reader, writer):
+        if not self.accepting or self.connections >= self.max_connections:
+            await self.reject(reader, writer)
+            return
+
+        values = self.metrics.values
+        self.connections += 1
+        values[MetricKeys.HTTP_CONNECTIONS] = self.connections
+        if self.connections > values[MetricKeys.HTTP_CONNECTIONS_MAX]:
+            values[MetricKeys.HTTP_CONNECTIONS_MAX] = self.connections
+        buffer = self.buffers.acquire()
+        address = writer.get_extra_info("peername")[0]
+
+        try:
+            timeout = REQUEST_TIMEOUT_MS
+            while True:
+                try:
+                    request_line = await uasyncio.wait_for_ms(
+                        reader.readline(), timeout
+                    )
+                except uasyncio.TimeoutError:
+                    break
+                if not request_line:
+                    break  # Closed by the client
+                if timeout != REQUEST_TIMEOUT_MS:
+                    self.metrics.inc(MetricKeys.HTTP_KEEP_ALIVE_REUSES)
+
+                if not self.rate_limit.allow(address):
+                    await uasyncio.wait_for_ms(
+                        self.skip_headers(reader), REQUEST_TIMEOUT_MS
+                    )
+                    writer.write(THROTTLED_RESPONSE)
+                    await writer.drain()
+                    break
+
+                keep_alive = await self.handle_request(
+                    reader, writer, request_line, buffer
+                )
+                if not keep_alive:
+                    break
+                timeout = self.keep_alive_ms
+        except Exception as e:
+            self.metrics.inc(MetricKeys.HTTP_ERRORS)
+            print(f"Web server error: {e}")
+        finally:
+            self.buffers.release(buffer)
+            self.connections -= 1
+            values[MetricKeys.HTTP_CONNECTIONS] = self.connections
+            writer.close()
+            await writer.wait_closed()
+
+    # Answer a client beyond the connection limit with the prebuilt busy
+    # response. The request is read first, closing a connection with unread
+    # data resets it before the client sees the answer
+    async def reject(self, reader, writer):
+        self.metrics.inc(MetricKeys.HTTP_REJECTED)
+        try:
+            try:
+                await uasyncio.wait_for_ms(self.skip_headers(reader), REJECT_READ_MS)
+            except uasyncio.TimeoutError:
+                pass
+            writer.write(BUSY_RESPONSE)
+            await writer.drain()
+        except Exception:
+            pass
+        finally:
+            writer.close()
+            await writer.wait_closed()
+
+    # Answer a malformed request and close the connection. Unread headers
+    # are skipped first, as for the busy answer
+    async def bad_request(self, reader, writer, skip_headers=True):
+        if skip_headers:
+            try:
+                await uasyncio.wait_for_ms(self.skip_headers(reader), REJECT_READ_MS)
+            except uasyncio.TimeoutError:
+                pass
+        writer.write(BAD_REQUEST_RESPONSE)
+        await writer.drain()
+        self.metrics.count_request(self.metrics.route("*"), 400)
+        return False
+
+    # Serve a single request, returns True to keep the connection open
+    async def handle_request(self, reader, writer, request_line, buffer):
+        try:
+            method, uri, protocol = request_line.split()
+        except ValueError:
+            return await self.bad_request(reader, writer)
+
+        # Fast path, a single dictionary lookup on the raw path
+        if method == b"GET":
+            fast_path = self.fast_paths.get(uri.split(b"?", 1)[0])
+            if fast_path is not None:
+                response, keep_alive_response, status, counters = fast_path
+                connection = await uasyncio.wait_for_ms(
+                    self.skip_headers(reader), REQUEST_TIMEOUT_MS
+                )
+                keep_alive = self.keep_alive(protocol.decode(), connection)
+                writer.write(keep_alive_response if keep_alive else response)
+                await writer.drain()
+                self.metrics.count_request(counters, status)
+                self.responded()
+                return keep_alive
+
+        try:
+            method, uri, protocol = method.decode(), uri.decode(), protocol.decode()
+        except ValueError:
+            return await self.bad_request(reader, writer)
+        keep_alive = await self.handle_routed_request(
+            reader, writer, method, uri, protocol, buffer
+        )
+        self.responded()
+        return keep_alive
+
+    # Whether to keep a connection open after the response. Only while there
+    # is room for more clients, so a busy server frees its sockets instead
+    def keep_alive(self, protocol, connection):
+        if not self.keep_alive_ms or self.connections >= self.max_connections:
+            return False
+        if protocol == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+    # Mark the first response in the boot timeline
+    def responded(self):
+        if not self.first_response.is_set():
+            self.metrics.mark(MetricKeys.BOOT_FIRST_REQUEST_MS)
+            self.first_response.set()
+
+    # Read past the headers, returns the Connection header in lower case
+    async def skip_headers(self, reader):
+        connection = ""
+        while True:
+            line = await reader.readline()
+            if line == b"\r\n" or not line:
+                break
+            if line[:11].lower() == b"connection:":
+                connection = line[11:].strip().lower().decode()
+        return connection
+
+    # General router, matches the request against the routes. Returns True to
+    # keep the connection open
+    async def handle_routed_request(
+        self, reader, writer, method, uri, protocol, buffer
+    ):
+        # The query string is parsed here rather than by phew's Request
+        path, _, query_string = uri.partition("?")
+        try:
+            query = parse_query_string(query_string) if query_string else {}
+        except ValueError:
+            return await self.bad_request(reader, writer)
+
+        request = Request(method, path, protocol)
+        request.uri = uri
+        request.query_string = query_string
+        request.query = query
+        request.buffer = buffer
+        request.headers = await uasyncio.wait_for_ms(
+            parse_headers(reader), REQUEST_TIMEOUT_MS
+        )
+        try:
+            await self.parse_body(reader, request)
+        except (KeyError, IndexError, ValueError):
+            return await self.bad_request(reader, writer, skip_headers=False)
+
+        route = self.match_route(request)
+        if route:
+            counters = self.metrics.route(route.path)
+            response = route.call_handler(request)
+        elif self.catchall_handler:
+            counters = self.metrics.route("*")
+            response = self.catchall_handler(request)
+        else:
+            counters = self.metrics.route("*")
+            response = "Not Found", 404
+
+        response = self.to_response(response)
+        self.metrics.count_request(counters, response.status)
+
+        # A connection is only kept when the request had no body and the
+        # client can tell where the response ends
+        body = getattr(response, "body", None)
+        length = response.headers.get("Content-Length")
+        if length is None and isinstance(body, (str, bytes)):
+            length = len(body)
+        keep_alive = False
+        if length is not None and not int(request.headers.get("content-length", 0)):
+            connection = request.headers.get("connection", "").lower()
+            keep_alive = self.keep_alive(protocol, connection)
+
+        # Status line and headers in a single write
+        head = [f"HTTP/1.1 {response.status} {status_message(response.status)}"]
+        for key, value in response.headers.items():
+            if key != "Content-Length":
+                head.append(f"{key}: {value}")
+        if length is not None:
+            head.append(f"Content-Length: {length}")
+        head.append("Connection: keep-alive" if keep_alive else "Connection: close")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode())
+
+        if isinstance(response, FileResponse):
+            view = memoryview(buffer)
+            with open(response.file, "rb") as f:
+                while True:
+                    count = f.readinto(buffer)
+                    if not count:
+                        break
+                    writer.write(view[:count])
+                    await writer.drain()
+        elif type(body).__name__ == "generator":
+            for chunk in body:
+                writer.write(chunk.encode() if isinstance(chunk, str) else chunk)
+                await writer.drain()
+        else:
+            writer.write(body.encode() if isinstance(body, str) else body)
+            await writer.drain()
+        return keep_alive
+
+    async def parse_body(self, reader, request):
+        headers = request.headers
+        if "content-length" not in headers or "content-type" not in headers:
+            return
+
+        content_type = headers["content-type"]
+        if content_type.startswith("multipart/form-data"):
+            request.form = await parse_form_data(reader, headers)
+        elif content_type.startswith("application/json"):
+            body = await reader.readexactly(int(headers["content-length"]))
+            request.data = json.loads(body.decode())
+        elif content_type.startswith("application/x-www-form-urlencoded"):
+            form_data = await reader.readexactly(int(headers["content-length"]))
+            request.form = parse_query_string(form_data.decode())
+
+    # Convert phew's shorthand return values into a Response
+    def to_response(self, response):
+        if type(response).__name__ == "generator":
+            response = (response,)
+        if isinstance(response, str):
+            response = (response,)
+        if isinstance(response, tuple):
+            body = response[0]
+            if isinstance(body, str):
+                body = body.encode()
+            status = response[1] if len(response) >= 2 else 200
+            content_type = response[2] if len(response) >= 3 else "text/html"
+            response = Response(body, status, {"Content-Type": content_type})
+            if hasattr(body, "__len__"):
+                response.add_header("Content-Length", len(body))
+        return response